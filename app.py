@@ -1,29 +1,23 @@
+import os
+import uuid
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
-from flask import Flask, render_template, request, redirect
+from flask import Flask, render_template, request, redirect, make_response, jsonify
 
-from game.game_env import GameEnv
-from play_vs_bot import initialize_players
+from game.policy_registry import policy_registry
+from game.numpy_policy import preload_numpy_policies
+from game.solver import equilibrium_table_path
+from utils.game_store import GameSession, make_game_store, game_store_backends
 
-def initialize_game(player_name, bot_behavior, fights_per_game=2):
-    """
-    Initialize two players and an instance of the game environment
-    :param player_name: (str) name of the player
-    :param bot_behavior: (str) the bot_behavior (i.e. its action policy)
-    :param fights_per_game: (int) the number of fights during a game
-    :return env: (gym.Env) the environment integrating both players
-    """
-    global env, player, bot_player
-    player, bot_player = initialize_players(player_name, bot_behavior)
-    env = GameEnv(player=player, bot_player=bot_player, fights_per_game=fights_per_game, verbose=False)
-    env.reset()
-    return env
 
 def get_game_status(player, bot_player):
     """
     Return the status at the end of a game (victory, defeat or equality)
     :param player: (str) the human player
     :param bot_player: (str) the bot player
-    :return game_status: (str) the game status 
+    :return game_status: (str) the game status
     """
     if player.nb_points > bot_player.nb_points:
         return "Victory"
@@ -32,68 +26,288 @@ def get_game_status(player, bot_player):
     else:
         return "Equality"
 
+# Each browser plays its own game, kept in the store under the id of its cookie. The store is chosen with
+# environment variables, so that every worker process of a WSGI server uses the same one
+store = make_game_store(os.environ.get("RISING_SUN_GAME_STORE", "memory"),
+                        directory=os.environ.get("RISING_SUN_GAME_STORE_DIR"),
+                        max_sessions=int(os.environ["RISING_SUN_GAME_MAX_SESSIONS"])
+                        if "RISING_SUN_GAME_MAX_SESSIONS" in os.environ else None,
+                        ttl=float(os.environ.get("RISING_SUN_GAME_TTL", 3600)))
+
+# The trained agents are loaded once, before the first game, so that starting a game against them reads nothing.
+# With RISING_SUN_FAST_POLICIES=1, the agents are their actors exported by export_policy.py, run in NumPy
+models_dir = os.environ.get("RISING_SUN_MODELS_DIR", "models")
+fast_policies = os.environ.get("RISING_SUN_FAST_POLICIES", "0") == "1"
+policy_registry.max_memory = int(os.environ.get("RISING_SUN_MODELS_MEMORY", 1024)) * 2**20
+if os.path.isdir(models_dir):
+    if fast_policies:
+        preload_numpy_policies(models_dir)
+    else:
+        policy_registry.preload(models_dir)
+
+# Largest number of fights of the games created by the web application
+max_fights_per_game = int(os.environ.get("RISING_SUN_MAX_FIGHTS_PER_GAME", 10))
+
+# Fights played in the background for /api/games/<game_id>/step_async, so that requests don't wait for the bots
+step_executor = ThreadPoolExecutor(max_workers=int(os.environ.get("RISING_SUN_STEP_THREADS", 8)))
+
 app = Flask(__name__)
 
+def get_game_id():
+    """
+    Return the id of the game of the browser, or a new one if it has none
+    """
+    game_id = request.cookies.get('game_id', '')
+    return game_id if game_id.isalnum() else uuid.uuid4().hex
+
+def with_game_id(response, game_id):
+    """
+    Set the cookie of the game id on a response
+    """
+    response = make_response(response)
+    response.set_cookie('game_id', game_id, max_age=int(store.ttl), httponly=True, samesite='Lax')
+    return response
+
+def get_trained_player_kwargs(form):
+    """
+    Return the parameters of the trained agent chosen in the form of the main page
+    """
+    return dict(exp_name=form.get('exp_name', ''),
+                algo=form.get('algo', 'PPO'),
+                tr_timesteps=int(form.get('tr_timesteps', 100000)),
+                tr_bot_behavior=form.get('tr_bot_behavior', 'random'),
+                seed=int(form.get('seed', 0)),
+                fast=fast_policies)
+
+def create_game_session(player_name, bot_behavior, fights_per_game, trained_agent):
+    """
+    Check the parameters of a new game, chosen in the form of the main page or given to the JSON API
+    :param trained_agent: (dict) parameters of the trained agent (see get_trained_player_kwargs), read if
+        bot_behavior is 'trained'
+    :return game: (GameSession) the game, raising a ValueError if a parameter is invalid
+    """
+    fights_per_game = int(fights_per_game)
+    if not 1 <= fights_per_game <= max_fights_per_game:
+        raise(ValueError(f"A game has between 1 and {max_fights_per_game} fights"))
+    trained_player_kwargs = None
+    if bot_behavior == 'trained':
+        if not isinstance(trained_agent, dict):
+            raise(ValueError("The parameters of the trained agent must be an object"))
+        trained_player_kwargs = get_trained_player_kwargs(trained_agent)
+    return GameSession(player_name=str(player_name),
+                       bot_behavior=bot_behavior,
+                       fights_per_game=fights_per_game,
+                       trained_player_kwargs=trained_player_kwargs)
+
+def end_current_game(game_id):
+    """
+    Mark the game as finished, so that the next visit of /play starts a new game with the same parameters
+    """
+    with store.lock(game_id):
+        game = store.get(game_id)
+        if game is not None:
+            game.game_initialized = False
+            store.set(game_id, game)
+
 @app.route('/')
 def index():
-    global game_initialized, player_name, bot_behavior, fights_per_game
-    game_initialized = False
-    player_name = None
-    bot_behavior = None
-    fights_per_game = None
-    return render_template('index.html')
+    game_id = get_game_id()
+    with store.lock(game_id):
+        store.delete(game_id)
+    # The equilibrium bot is only offered when its table was computed by solve_game.py, games of other numbers of
+    # fights without a table being refused when they are created
+    equilibrium_available = os.path.exists(equilibrium_table_path(2))
+    return with_game_id(render_template('index.html', equilibrium_available=equilibrium_available), game_id)
 
 @app.route('/rules')
 def rules():
-    global game_initialized
-    game_initialized = False
-    return render_template('rules.html')
+    game_id = get_game_id()
+    end_current_game(game_id)
+    return with_game_id(render_template('rules.html'), game_id)
 
 @app.route('/end_game')
 def end_game():
-    global game_initialized
-    game_initialized = False
+    game_id = get_game_id()
+    end_current_game(game_id)
 
     game_status = request.args.get('status')
-    return render_template('end_game.html', status=game_status)
+    return with_game_id(render_template('end_game.html', status=game_status), game_id)
 
 
 @app.route('/play', methods=['GET', 'POST'])
 def play():
-    global game_initialized, env, player, bot_player, player_name, bot_behavior, fights_per_game
-
-    # If the game hasn't been initialized, create a new one
-    if not game_initialized:
-        # And that game parameters aren't initialized either (i.e it isn't a rematch where the player already specified these parameters)
-        if request.method == 'POST' and (not player_name or not bot_behavior or not fights_per_game):
-            player_name = request.form['player_name']
-            bot_behavior = request.form['bot_behavior']
-            fights_per_game = int(request.form['fights_per_game'])
-
-        env = initialize_game(player_name, bot_behavior, fights_per_game)
-
-    # If the game is already initialized, play until the end of the game
-    if request.method =='POST' and game_initialized == True:
-        action = np.array([int(request.form['Sepuku']),
-                        int(request.form['Hostage']),
-                        int(request.form['Ronins']),
-                        int(request.form['Imperial_Poets'])])
-        obs, reward, done, truncated, info = env.step(action)
-
-        # return the game status at the end 
-        if done or truncated:
-            game_status = get_game_status(player, bot_player)
-            return redirect(f'/end_game?status={game_status}')
-        
-    # Get the players statistics to display them on the web interface
-    game_initialized = True 
-    player_state = player.get_statistics()
-    bot_state = bot_player.get_statistics()
-    
-    return render_template('play.html', player_state=player_state, bot_state=bot_state, nb_fights=env.fights_per_game, fight_nb=env.fight_nb+1)
+    game_id = get_game_id()
+
+    # The lock of the game is held until its new state is stored, requests of other games are not blocked
+    with store.lock(game_id):
+        game = store.get(game_id)
+
+        # If the game hasn't been initialized, create a new one
+        if game is None or not game.game_initialized:
+            # And that game parameters aren't initialized either (i.e it isn't a rematch where the player already specified these parameters)
+            if game is None:
+                if request.method != 'POST':
+                    return with_game_id(redirect('/'), game_id)
+                try:
+                    game = create_game_session(request.form['player_name'], request.form['bot_behavior'],
+                                               request.form['fights_per_game'], request.form)
+                except ValueError as error:
+                    return with_game_id((str(error), 400), game_id)
+
+            try:
+                game.new_game()
+            except ValueError as error:
+                return with_game_id((str(error), 400), game_id)
+
+        # If the game is already initialized, play until the end of the game
+        elif request.method == 'POST':
+            action = np.array([int(request.form['Sepuku']),
+                            int(request.form['Hostage']),
+                            int(request.form['Ronins']),
+                            int(request.form['Imperial_Poets'])])
+            obs, reward, done, truncated, info = game.env.step(action)
+
+            # return the game status at the end
+            if done or truncated:
+                game.game_initialized = False
+                store.set(game_id, game)
+                game_status = get_game_status(game.player, game.bot_player)
+                return with_game_id(redirect(f'/end_game?status={game_status}'), game_id)
+
+        # Get the players statistics to display them on the web interface
+        game.game_initialized = True
+        store.set(game_id, game)
+        player_state = game.player.get_statistics()
+        bot_state = game.bot_player.get_statistics()
+
+        return with_game_id(render_template('play.html', player_state=player_state, bot_state=bot_state,
+                                            nb_fights=game.env.fights_per_game, fight_nb=game.env.fight_nb+1,
+                                            game_id=game_id), game_id)
+
+
+# JSON API, used by the web interface to play the fights and by scripted clients
+
+def parse_action(data):
+    """
+    Return the action of a JSON request, ([int]) the golds used on each game action, or None if it is invalid
+    """
+    try:
+        action = [int(value) for value in data['action']]
+    except (KeyError, TypeError, ValueError):
+        return None
+    return action if len(action) == 4 and min(action) >= 0 else None
+
+def play_step(game_id, action, is_async=False):
+    """
+    Play a fight of a stored game
+    :param game_id: (str) id of the game
+    :param action: ([int]) golds used by the player on each game action
+    :param is_async: (bool) whether the fight was requested with step_async
+    :return diff, http_status: (dict, int) the changes made by the fight, see GameSession.step, or an error
+    """
+    with store.lock(game_id):
+        game = store.get(game_id)
+        if game is None:
+            return {'error': "Unknown game"}, 404
+        if not game.game_initialized:
+            return {'error': "The game is over"}, 409
+        if game.pending and not is_async:
+            return {'error': "A fight of the game is already being played"}, 409
+
+        try:
+            diff = game.step(action)
+            http_status = 200
+        except Exception as error:
+            diff, http_status = {'error': str(error)}, 500
+        if not game.game_initialized:
+            diff['status'] = get_game_status(game.player, game.bot_player)
+        game.pending = False
+        game.last_step = diff
+        store.set(game_id, game)
+    return diff, http_status
+
+@app.route('/api/games', methods=['POST'])
+def api_new_game():
+    """
+    Create a game. The JSON body can give the player_name, bot_behavior, fights_per_game, seed of the game,
+    and the parameters of a trained bot in trained_agent (see get_trained_player_kwargs)
+    """
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify(error="The body must be a JSON object"), 400
+    try:
+        game = create_game_session(data.get('player_name', 'player'), data.get('bot_behavior', 'random'),
+                                   data.get('fights_per_game', 2), data.get('trained_agent', {}))
+        game.new_game(seed=data.get('seed'))
+    except (ValueError, TypeError) as error:
+        return jsonify(error=str(error)), 400
+    game.game_initialized = True
+
+    game_id = uuid.uuid4().hex
+    with store.lock(game_id):
+        store.set(game_id, game)
+    return jsonify(game_id=game_id, **game.state()), 201
+
+@app.route('/api/games/<game_id>')
+def api_game(game_id):
+    """
+    Return the state of a game, whether a fight is being played and the changes made by the last one
+    """
+    if not game_id.isalnum():
+        return jsonify(error="Unknown game"), 404
+    with store.lock(game_id):
+        game = store.get(game_id)
+        if game is None:
+            return jsonify(error="Unknown game"), 404
+        return jsonify(game_id=game_id, pending=game.pending, last_step=game.last_step, **game.state())
+
+@app.route('/api/games/<game_id>/step', methods=['POST'])
+def api_step(game_id):
+    """
+    Play a fight with the action of the JSON body, {"action": [sepuku, hostage, ronins, imperial_poets]}, and
+    return only the changes it made to the state of the game
+    """
+    action = parse_action(request.get_json(silent=True))
+    if action is None:
+        return jsonify(error="The action must be 4 non negative numbers of golds"), 400
+    if not game_id.isalnum():
+        return jsonify(error="Unknown game"), 404
+    diff, http_status = play_step(game_id, action)
+    return jsonify(diff), http_status
+
+@app.route('/api/games/<game_id>/step_async', methods=['POST'])
+def api_step_async(game_id):
+    """
+    Same as api_step, but the fight is played in the background and the request returns at once. Its result
+    is read with GET /api/games/<game_id>, in last_step once pending is false
+    """
+    action = parse_action(request.get_json(silent=True))
+    if action is None:
+        return jsonify(error="The action must be 4 non negative numbers of golds"), 400
+    if not game_id.isalnum():
+        return jsonify(error="Unknown game"), 404
+    with store.lock(game_id):
+        game = store.get(game_id)
+        if game is None:
+            return jsonify(error="Unknown game"), 404
+        if not game.game_initialized or game.pending:
+            return jsonify(error="The game is over or a fight is already being played"), 409
+        game.pending = True
+        store.set(game_id, game)
+    step_executor.submit(play_step, game_id, action, True)
+    return jsonify(game_id=game_id, pending=True), 202
 
 if __name__ == '__main__':
-    app.run(debug=True)
 
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--game_store', type=str, required=False, default="memory", choices=game_store_backends)
+    parser.add_argument('--game_store_dir', type=str, required=False, default=None)
+    parser.add_argument('--max_sessions', type=int, required=False, default=None)
+    parser.add_argument('--ttl', type=float, required=False, default=3600)
+
+    args = parser.parse_args()
+
+    store = make_game_store(args.game_store, args.game_store_dir, args.max_sessions, args.ttl)
+    app.run(debug=True, threaded=True)
 
- # TODO : Allow playing against trained RL agents and not only bots with scripted behaviors 
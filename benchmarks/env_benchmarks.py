@@ -0,0 +1,65 @@
+import itertools
+
+import numpy as np
+
+from game.game_env import GameEnv, projection_modes
+from game.batched_game_env import BatchedGameEnv
+from game.players import Player
+from benchmarks.timing import measure, benchmark_result
+
+
+def make_game(fights_per_game, projection="random", seed=0):
+    """
+    Seeded game between two random players
+    """
+    env = GameEnv(player=Player(name='player', fights_per_game=fights_per_game),
+                  bot_player=Player(name='bot_player', fights_per_game=fights_per_game),
+                  fights_per_game=fights_per_game, projection=projection)
+    env.reset(seed=seed)
+    return env
+
+
+def stepper(env, actions):
+    """
+    Function making one step of a GameEnv with the next action of a cycle, and resetting the finished games
+    """
+    actions = itertools.cycle(actions)
+
+    def step():
+        observation, reward, done, truncated, info = env.step(next(actions).copy())
+        if done:
+            env.reset()
+    return step
+
+
+def run_env_benchmarks(fights_per_game_list, batch_sizes, repeat=3):
+    """
+    Time GameEnv.reset, GameEnv.step with each projection of the actions, GameEnv._get_observation and
+    BatchedGameEnv.step for each number of fights per game and batch size
+    :param fights_per_game_list: ([int]) numbers of fights per game
+    :param batch_sizes: ([int]) numbers of games of the batched env
+    :param repeat: (int) number of timing loops
+    :return results: ([dict]) results of benchmark_result
+    """
+    results = []
+    actions = np.random.default_rng(0).uniform(0, 7, size=(4096, 4))
+    for fights_per_game in fights_per_game_list:
+        env = make_game(fights_per_game)
+        results.append(benchmark_result("GameEnv.reset", measure(env.reset, repeat=repeat), "resets",
+                                        fights_per_game=fights_per_game))
+        results.append(benchmark_result("GameEnv._get_observation",
+                                        measure(lambda: env._get_observation(env.player), repeat=repeat),
+                                        "observations", fights_per_game=fights_per_game))
+        for projection in projection_modes:
+            env = make_game(fights_per_game, projection)
+            results.append(benchmark_result("GameEnv.step", measure(stepper(env, actions), repeat=repeat), "steps",
+                                            fights_per_game=fights_per_game, projection=projection))
+
+        for batch_size in batch_sizes:
+            batched_env = BatchedGameEnv(batch_size, "random", fights_per_game, seed=0)
+            batched_env.reset()
+            batch_actions = actions[np.arange(batch_size) % len(actions)]
+            results.append(benchmark_result("BatchedGameEnv.step",
+                                            measure(lambda: batched_env.step(batch_actions), batch_size, repeat),
+                                            "steps", fights_per_game=fights_per_game, batch_size=batch_size))
+    return results
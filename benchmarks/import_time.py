@@ -0,0 +1,89 @@
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+from tabulate import tabulate
+
+
+# Modules which must start fast, as they don't need the RL libraries : the game, the scripted bots, the CLI game
+# and the web application (whose trained agents are loaded after the import)
+fast_modules = ["game.game_env", "game.players", "play_vs_bot", "app", "evaluate_model", "utils.utils"]
+heavy_modules = ["torch", "stable_baselines3", "tensorflow", "matplotlib", "scipy", "pandas"]
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_python(code, *options):
+    """
+    Run python code in a new interpreter, from the repository directory and without preloading trained agents
+    :return stdout, stderr: (str, str) outputs of the interpreter
+    """
+    with tempfile.TemporaryDirectory() as models_dir:
+        env = dict(os.environ, RISING_SUN_MODELS_DIR=models_dir, PYTHONPATH=repo_dir)
+        process = subprocess.run([sys.executable, *options, "-c", code], cwd=repo_dir, env=env,
+                                 capture_output=True, text=True, check=True)
+    return process.stdout, process.stderr
+
+
+def measure_import(module, repeat=3):
+    """
+    Time the import of a module in new interpreters
+    :param module: (str) name of the module
+    :param repeat: (int) number of interpreters, the fastest import being kept
+    :return import_time, loaded_heavy_modules: (float, [str]) seconds of the import, and heavy_modules it loaded
+    """
+    code = (f"import sys, time, json\n"
+            f"start = time.perf_counter()\n"
+            f"import {module}\n"
+            f"import_time = time.perf_counter() - start\n"
+            f"print(json.dumps([import_time, [name for name in {heavy_modules!r} if name in sys.modules]]))")
+    results = [json.loads(run_python(code)[0].splitlines()[-1]) for _ in range(repeat)]
+    return min(import_time for import_time, loaded in results), results[0][1]
+
+
+def slowest_imports(module, nb_imports=10):
+    """
+    Packages taking the most time in the import of a module, read with python -X importtime
+    :return slowest: ([(str, float)]) top-level packages and the time spent importing their modules, in seconds
+    """
+    stderr = run_python(f"import {module}", "-X", "importtime")[1]
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_time, cumulative, name = line[len("import time:"):].split("|")
+        package = name.strip().split(".")[0]
+        times[package] = times.get(package, 0.) + int(self_time) / 1e6
+    return sorted(times.items(), key=lambda item: -item[1])[:nb_imports]
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--modules', type=str, nargs="+", required=False, default=fast_modules)
+    parser.add_argument('--budget', type=float, required=False, default=1., help="maximum import time in seconds")
+    parser.add_argument('--repeat', type=int, required=False, default=3)
+
+    args = parser.parse_args()
+
+    rows, failures = [], []
+    for module in args.modules:
+        import_time, loaded = measure_import(module, args.repeat)
+        status = "ok"
+        if import_time > args.budget or loaded:
+            status = "OVER BUDGET" if import_time > args.budget else "HEAVY IMPORTS"
+            failures.append(module)
+        rows.append([module, f"{import_time:.3f}", ", ".join(loaded) or "-", status])
+    print(tabulate(rows, headers=["module", "import time (s)", "heavy modules loaded", "status"]))
+
+    for module in failures:
+        print(f"\nSlowest imports of {module} :")
+        print(tabulate([[name, f"{seconds:.3f}"] for name, seconds in slowest_imports(module)],
+                       headers=["package", "import time (s)"]))
+    if failures:
+        raise SystemExit(f"\n{len(failures)} modules exceed the import budget of {args.budget}s or import "
+                         f"{', '.join(heavy_modules)} : {', '.join(failures)}")
@@ -0,0 +1,289 @@
+import re
+import json
+import logging
+import time
+import argparse
+import threading
+import urllib.parse
+import urllib.error
+import urllib.request
+import http.cookiejar
+from collections import defaultdict
+
+import numpy as np
+from tabulate import tabulate
+
+
+client_policies = ["random", "sepuku_poets"]
+client_routes = ["play", "api", "api_async"]
+
+
+def choose_action(policy, golds, fight_nb, rng):
+    """
+    Action of a simulated player, entered as the golds of HumanPlayer.choose_action
+    :param policy: (str) 'random' (same choice as the random bot) or 'sepuku_poets' (same as the SepukuPoetsPlayer)
+    :param golds: (int) golds of the player
+    :param fight_nb: (int) number of the fight, starting at 0
+    :param rng: (np.random.Generator) random generator of the client
+    :return action: ([int]) golds used for sepuku, hostage, ronins and imperial poets
+    """
+    if policy == "random":
+        return np.bincount(rng.integers(0, 4, size=rng.integers(0, max(golds, 1))), minlength=4).tolist()
+    elif policy == "sepuku_poets":
+        gold_used = golds // 2 if fight_nb == 0 else golds
+        return [gold_used // 2, 0, 0, gold_used - gold_used // 2]
+    raise(ValueError(f"Unknown client policy {policy}, choose among {client_policies}"))
+
+
+class LoadStats:
+    """
+    Latencies and errors of the requests of all the clients, per route
+    """
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.nb_errors = defaultdict(int)
+        self.nb_games = 0
+        self.nb_failed_games = 0
+        self.lock = threading.Lock()
+
+    def add_request(self, route, latency, ok):
+        with self.lock:
+            self.latencies[route].append(latency)
+            if not ok:
+                self.nb_errors[route] += 1
+
+    def add_game(self, ok):
+        with self.lock:
+            if ok:
+                self.nb_games += 1
+            else:
+                self.nb_failed_games += 1
+
+    def report(self, duration):
+        """
+        Summary of the load test
+        :param duration: (float) duration of the test in seconds
+        :return report: (dict) games per second and failed games, and the requests, error rate and latency
+            percentiles (ms) of each route
+        """
+        routes = {}
+        for route, latencies in sorted(self.latencies.items()):
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+            routes[route] = {"requests": len(latencies),
+                             "requests_per_sec": len(latencies) / duration,
+                             "error_rate": self.nb_errors[route] / len(latencies),
+                             "p50_ms": p50, "p95_ms": p95, "p99_ms": p99}
+        return {"duration": duration, "games": self.nb_games, "games_per_sec": self.nb_games / duration,
+                "failed_games": self.nb_failed_games, "routes": routes}
+
+
+class LoadTestClient:
+    """
+    Simulated player of the web application, playing full games through the HTML pages (/play) or the JSON API.
+    It keeps its own cookies, so each client plays its own game.
+    """
+
+    def __init__(self, base_url, stats, route="api", policy="random", bot_behavior="random", fights_per_game=2,
+                 seed=None, poll_interval=0.005, timeout=30):
+        self.base_url = base_url.rstrip("/")
+        self.stats = stats
+        self.route = route
+        self.policy = policy
+        self.bot_behavior = bot_behavior
+        self.fights_per_game = fights_per_game
+        self.rng = np.random.default_rng(seed)
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def request(self, route, path, data=None, json_data=None):
+        """
+        Send a request, and record its latency under the name of its route
+        :return status, body, url: (int, bytes, str) the response, after redirections, or status 0 if it failed
+        """
+        headers = {}
+        if json_data is not None:
+            data = json.dumps(json_data).encode()
+            headers["Content-Type"] = "application/json"
+        elif data is not None:
+            data = urllib.parse.urlencode(data).encode()
+        request = urllib.request.Request(self.base_url + path, data=data, headers=headers)
+        start_time = time.perf_counter()
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                status, body, url = response.status, response.read(), response.url
+        except urllib.error.HTTPError as error:
+            status, body, url = error.code, error.read(), error.url
+        except (urllib.error.URLError, OSError):
+            status, body, url = 0, b"", ""
+        self.stats.add_request(route, time.perf_counter() - start_time, 200 <= status < 300)
+        return status, body, url
+
+    def play_game(self):
+        """
+        Play a game until its end
+        :return ok: (bool) whether the game ended without error
+        """
+        if self.route == "play":
+            return self.play_html_game()
+        return self.play_api_game()
+
+    def play_html_game(self):
+        self.request("GET /", "/")
+        status, body, url = self.request("POST /play (new game)", "/play",
+                                         data={"player_name": "load_test", "bot_behavior": self.bot_behavior,
+                                               "fights_per_game": self.fights_per_game})
+        for fight_nb in range(self.fights_per_game):
+            if status != 200:
+                return False
+            # Golds displayed in the page, see templates/play.html
+            golds = re.search(rb'id="player-golds">\s*(\d+)', body)
+            action = choose_action(self.policy, int(golds.group(1)) if golds else 0, fight_nb, self.rng)
+            status, body, url = self.request("POST /play", "/play",
+                                             data=dict(zip(["Sepuku", "Hostage", "Ronins", "Imperial_Poets"], action)))
+        return status == 200 and "/end_game" in url
+
+    def play_api_game(self):
+        status, body, url = self.request("POST /api/games", "/api/games",
+                                         json_data={"player_name": "load_test", "bot_behavior": self.bot_behavior,
+                                                    "fights_per_game": self.fights_per_game})
+        if status != 201:
+            return False
+        state = json.loads(body)
+        game_id, golds, fight_nb = state["game_id"], state["player"]["golds"], state["fight_nb"]
+        game_over = False
+        while not game_over:
+            action = choose_action(self.policy, golds, fight_nb, self.rng)
+            if self.route == "api":
+                status, body, url = self.request("POST /api/games/<id>/step", f"/api/games/{game_id}/step",
+                                                 json_data={"action": action})
+                if status != 200:
+                    return False
+                diff = json.loads(body)
+            else:
+                diff = self.play_async_step(game_id, action)
+                if diff is None:
+                    return False
+            golds = diff.get("player", {}).get("golds", golds)
+            fight_nb = diff.get("fight_nb", fight_nb)
+            game_over = diff.get("game_over", False)
+        return True
+
+    def play_async_step(self, game_id, action):
+        """
+        Play a fight with step_async, and poll the game until it has been played
+        :return diff: (dict) the changes made by the fight, or None if a request failed
+        """
+        start_time = time.perf_counter()
+        status, body, url = self.request("POST /api/games/<id>/step_async", f"/api/games/{game_id}/step_async",
+                                         json_data={"action": action})
+        if status != 202:
+            return None
+        while True:
+            time.sleep(self.poll_interval)
+            status, body, url = self.request("GET /api/games/<id>", f"/api/games/{game_id}")
+            if status != 200:
+                return None
+            game = json.loads(body)
+            if not game["pending"]:
+                # Time from the action to its result, as seen by the player
+                self.stats.add_request("fight (step_async + polls)", time.perf_counter() - start_time, True)
+                return game["last_step"]
+
+    def run(self, end_time, max_games=None):
+        """
+        Play games until end_time (time.monotonic) or until max_games have been played
+        """
+        nb_games = 0
+        while time.monotonic() < end_time and (max_games is None or nb_games < max_games):
+            self.stats.add_game(self.play_game())
+            nb_games += 1
+
+
+def start_local_server(host="127.0.0.1", port=0):
+    """
+    Serve app.py in a thread of this process, with one thread per request as `flask run` does
+    :return server, base_url: (BaseWSGIServer, str) the server, to shut down at the end, and its url
+    """
+    from werkzeug.serving import make_server
+    from app import app
+    # Logging every request would slow the server down
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server(host, port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_port}"
+
+
+def run_load_test(base_url, nb_clients=16, duration=10., max_games=None, route="api", policy="random",
+                  bot_behavior="random", fights_per_game=2, seed=0):
+    """
+    Play games with simulated clients, each in its own thread
+    :param base_url: (str) url of the server
+    :param nb_clients: (int) number of concurrent clients
+    :param duration: (float) maximum duration of the test in seconds
+    :param max_games: (int) maximum number of games per client, unlimited if None
+    :param route: (str) one of client_routes, how the clients play
+    :param policy: (str) one of client_policies, how the clients choose their actions
+    :param bot_behavior: (str) the behavior of the bots played against
+    :param fights_per_game: (int) number of fights per game
+    :param seed: (int) random seed of the clients
+    :return report: (dict) report of LoadStats
+    """
+    stats = LoadStats()
+    seeds = np.random.SeedSequence(seed).spawn(nb_clients)
+    clients = [LoadTestClient(base_url, stats, route, policy, bot_behavior, fights_per_game, seed=client_seed)
+               for client_seed in seeds]
+    start_time = time.monotonic()
+    threads = [threading.Thread(target=client.run, args=(start_time + duration, max_games)) for client in clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return stats.report(time.monotonic() - start_time)
+
+
+def print_report(report):
+    rows = [[route, result["requests"], f"{result['requests_per_sec']:.1f}", f"{result['error_rate']:.1%}",
+             f"{result['p50_ms']:.1f}", f"{result['p95_ms']:.1f}", f"{result['p99_ms']:.1f}"]
+            for route, result in report["routes"].items()]
+    print(tabulate(rows, headers=["route", "requests", "req/sec", "errors", "p50 ms", "p95 ms", "p99 ms"]))
+    print(f"\n{report['games']} games in {report['duration']:.1f}s : {report['games_per_sec']:.1f} games/sec, "
+          f"{report['failed_games']} failed games")
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--url', type=str, required=False, default=None,
+                        help="url of a running server, a local one is started in this process if None")
+    parser.add_argument('--nb_clients', type=int, required=False, default=16)
+    parser.add_argument('--duration', type=float, required=False, default=10.)
+    parser.add_argument('--max_games', type=int, required=False, default=None, help="maximum games per client")
+    parser.add_argument('--route', type=str, required=False, default="api", choices=client_routes)
+    parser.add_argument('--policy', type=str, required=False, default="random", choices=client_policies)
+    parser.add_argument('--bot_behavior', type=str, required=False, default="random")
+    parser.add_argument('--fights_per_game', type=int, required=False, default=2)
+    parser.add_argument('--seed', type=int, required=False, default=0)
+    parser.add_argument('--output', type=str, required=False, default=None, help="JSON file of the report")
+
+    args = parser.parse_args()
+
+    server = None
+    base_url = args.url
+    if base_url is None:
+        server, base_url = start_local_server()
+
+    report = run_load_test(base_url, args.nb_clients, args.duration, args.max_games, args.route, args.policy,
+                           args.bot_behavior, args.fights_per_game, args.seed)
+    if server is not None:
+        server.shutdown()
+
+    print_report(report)
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+        print(f"Report saved in {args.output}")
+    if report["failed_games"] or any(result["error_rate"] > 0 for result in report["routes"].values()):
+        raise SystemExit("Some requests failed")
@@ -0,0 +1,129 @@
+import os
+import itertools
+import tempfile
+
+import numpy as np
+from stable_baselines3 import PPO
+
+from game.game_env import GameEnv
+from game.players import Player, TrainedPlayer, bot_player_dict
+from game.numpy_policy import export_policy, NumpyPolicy
+from game.solver import equilibrium_table_path
+from benchmarks.timing import measure, benchmark_result
+
+
+def collect_states(bot_player, fights_per_game, nb_states=64, seed=0):
+    """
+    Collect the observations met by a bot player and its statistics at that time, during games against a random player
+    :return states: ([(np.ndarray, np.ndarray)]) observations and statistics of the bot player
+    """
+    env = GameEnv(player=Player(name='player', fights_per_game=fights_per_game), bot_player=bot_player,
+                  fights_per_game=fights_per_game)
+    env.reset(seed=seed)
+    states = []
+    while len(states) < nb_states:
+        states.append((env._get_observation(bot_player), bot_player._state.copy()))
+        observation, reward, done, truncated, info = env.step(env.np_random.uniform(0, 7, size=4))
+        if done:
+            env.reset()
+    return states
+
+
+def action_chooser(player, states):
+    """
+    Function making the player choose an action in the next state of a cycle
+    """
+    states = itertools.cycle(states)
+
+    def choose_action():
+        observation, statistics = next(states)
+        player._state[:] = statistics
+        player.choose_action(observation)
+    return choose_action
+
+
+def untrained_player(fights_per_game):
+    """
+    TrainedPlayer using the initial policy of a PPO agent, whose inference costs as much as a trained one
+    """
+    env = GameEnv(player=Player(name='player', fights_per_game=fights_per_game),
+                  bot_player=Player(name='bot_player', fights_per_game=fights_per_game),
+                  fights_per_game=fights_per_game)
+    player = TrainedPlayer.__new__(TrainedPlayer)
+    Player.__init__(player, 'trained_player', fights_per_game)
+    player.policy = PPO('MlpPolicy', env=env, seed=0, device="cpu")
+    return player
+
+
+def exported_player(player):
+    """
+    TrainedPlayer in fast mode, using the actor of the policy of a TrainedPlayer exported to NumPy
+    """
+    fast_player = TrainedPlayer.__new__(TrainedPlayer)
+    Player.__init__(fast_player, 'trained_player', player.fights_per_game)
+    with tempfile.TemporaryDirectory() as directory:
+        fast_player.policy = NumpyPolicy(export_policy(player.policy, os.path.join(directory, "policy.npz")))
+    return fast_player
+
+
+def registry_player(player):
+    """
+    TrainedPlayer serving the policy of a TrainedPlayer through the policy registry, as the saved models are
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        model_path = os.path.join(directory, "PPO_policy.zip")
+        player.policy.save(model_path)
+        return TrainedPlayer(name='trained_player', fights_per_game=player.fights_per_game, model_path=model_path)
+
+
+def run_player_benchmarks(fights_per_game_list, batch_sizes, repeat=3):
+    """
+    Time the choose_action method of each bot of bot_player_dict and of a TrainedPlayer (in fast mode too), and the
+    choose_actions method of the bots and the predictions of a policy and of its NumPy export on batches of observations
+    :param fights_per_game_list: ([int]) numbers of fights per game
+    :param batch_sizes: ([int]) numbers of observations predicted at once
+    :param repeat: (int) number of timing loops
+    :return results: ([dict]) results of benchmark_result
+    """
+    results = []
+    for fights_per_game in fights_per_game_list:
+        for behavior, player_class in bot_player_dict.items():
+            if behavior == "equilibrium" and not os.path.exists(equilibrium_table_path(fights_per_game)):
+                # The equilibrium player needs the table computed by solve_game.py
+                continue
+            player = player_class(name='bot_player', fights_per_game=fights_per_game)
+            states = collect_states(player, fights_per_game)
+            choose_action = action_chooser(player, states)
+            # The first pass fills the caches (states solved by the equilibrium player ...)
+            for _ in states:
+                choose_action()
+            results.append(benchmark_result(f"{player_class.__name__}.choose_action",
+                                            measure(choose_action, repeat=repeat), "actions",
+                                            fights_per_game=fights_per_game))
+            observations = np.stack([observation for observation, statistics in states])
+            golds = np.array([statistics[0] for observation, statistics in states])
+            for batch_size in batch_sizes:
+                batch = np.arange(batch_size) % len(states)
+                results.append(benchmark_result(f"{player_class.__name__}.choose_actions",
+                                                measure(lambda: player.choose_actions(observations[batch], golds[batch]),
+                                                        batch_size, repeat),
+                                                "actions", fights_per_game=fights_per_game, batch_size=batch_size))
+
+        player = untrained_player(fights_per_game)
+        fast_player = exported_player(player)
+        served_player = registry_player(player)
+        states = collect_states(player, fights_per_game)
+        observations = np.stack([observation for observation, statistics in states])
+        for name, trained_player, policy_name in (("TrainedPlayer", player, "policy"),
+                                                  ("TrainedPlayer(registry)", served_player, "BatchedPolicy"),
+                                                  ("TrainedPlayer(fast)", fast_player, "NumpyPolicy")):
+            results.append(benchmark_result(f"{name}.choose_action",
+                                            measure(action_chooser(trained_player, states), repeat=repeat), "actions",
+                                            fights_per_game=fights_per_game))
+            for batch_size in batch_sizes:
+                batch = observations[np.arange(batch_size) % len(observations)]
+                results.append(benchmark_result(f"{policy_name}.predict",
+                                                measure(lambda: trained_player.policy.predict(batch, deterministic=True),
+                                                        batch_size, repeat),
+                                                "actions", fights_per_game=fights_per_game, batch_size=batch_size))
+    return results
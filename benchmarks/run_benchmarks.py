@@ -0,0 +1,70 @@
+import os
+import argparse
+
+from benchmarks.timing import save_results, load_results, compare_results
+
+
+suites = ["env", "players", "evaluation", "training"]
+default_baseline = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+def run_suite(suite, args):
+    """
+    Run one suite of benchmarks, importing its module only when needed
+    :param suite: (str) one of suites
+    :param args: parsed arguments of the command line
+    :return results: ([dict]) results of benchmark_result
+    """
+    if suite == "env":
+        from benchmarks.env_benchmarks import run_env_benchmarks
+        return run_env_benchmarks(args.fights_per_game, args.batch_sizes, args.repeat)
+    elif suite == "players":
+        from benchmarks.player_benchmarks import run_player_benchmarks
+        return run_player_benchmarks(args.fights_per_game, args.batch_sizes, args.repeat)
+    elif suite == "evaluation":
+        from benchmarks.training_benchmarks import run_evaluation_benchmarks
+        return run_evaluation_benchmarks(args.fights_per_game, args.batch_sizes, args.nb_games)
+    elif suite == "training":
+        from benchmarks.training_benchmarks import run_training_benchmarks
+        return run_training_benchmarks(args.fights_per_game, args.n_envs, args.total_timesteps, args.vec_backend)
+    raise(ValueError(f"Unknown suite {suite}, choose among {suites}"))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--suites', type=str, nargs="+", required=False, default=suites, choices=suites)
+    parser.add_argument('--fights_per_game', type=int, nargs="+", required=False, default=[2, 3])
+    parser.add_argument('--batch_sizes', type=int, nargs="+", required=False, default=[1, 64, 1024])
+    parser.add_argument('--n_envs', type=int, nargs="+", required=False, default=[1, 8])
+    parser.add_argument('--repeat', type=int, required=False, default=3)
+    parser.add_argument('--nb_games', type=int, required=False, default=200)
+    parser.add_argument('--total_timesteps', type=int, required=False, default=4096)
+    parser.add_argument('--vec_backend', type=str, required=False, default="dummy")
+    parser.add_argument('--output', type=str, required=False, default=os.path.join("benchmarks", "results.json"))
+    parser.add_argument('--baseline', type=str, required=False, default=default_baseline)
+    parser.add_argument('--save_baseline', action="store_true", help="store the results as the new baseline")
+    parser.add_argument('--tolerance', type=float, required=False, default=0.2,
+                        help="relative slowdown from the baseline reported as a regression")
+
+    args = parser.parse_args()
+
+    results = []
+    for suite in args.suites:
+        print(f"\nRunning the {suite} benchmarks")
+        results += run_suite(suite, args)
+
+    save_results(args.output, results)
+    print(f"\nResults saved in {args.output}\n")
+
+    if args.save_baseline:
+        save_results(args.baseline, results)
+        print(f"Baseline saved in {args.baseline}")
+    elif os.path.exists(args.baseline):
+        regressions = compare_results(results, load_results(args.baseline), args.tolerance)
+        if regressions:
+            raise SystemExit(f"\n{len(regressions)} benchmarks are more than {args.tolerance:.0%} slower than "
+                             f"the baseline : {', '.join(regressions)}")
+    else:
+        print(f"No baseline found in {args.baseline}, run with --save_baseline to store one")
@@ -0,0 +1,102 @@
+import os
+import sys
+import json
+import time
+import timeit
+import platform
+
+import numpy as np
+from tabulate import tabulate
+
+
+def measure(fn, nb_ops=1, repeat=3, number=None):
+    """
+    Throughput of a function, measured as timeit does : the function is called in loops long enough to last
+    at least 0.2s, and the fastest of several loops is kept
+    :param fn: (Callable) function without arguments
+    :param nb_ops: (int) number of operations (steps, games ...) made by each call of fn
+    :param repeat: (int) number of loops
+    :param number: (int) number of calls per loop, found automatically if None
+    :return ops_per_sec: (float) number of operations per second
+    """
+    timer = timeit.Timer(fn)
+    if number is None:
+        number, _ = timer.autorange()
+    best_time = min(timer.repeat(repeat=repeat, number=number)) / number
+    return nb_ops / best_time
+
+
+def benchmark_result(name, ops_per_sec, unit, **params):
+    """
+    Machine-readable result of a benchmark
+    :param name: (str) name of the benchmark
+    :param ops_per_sec: (float) measured throughput
+    :param unit: (str) what an operation is (steps, games, actions ...)
+    :param params: parameters of the benchmark (fights_per_game, batch size ...)
+    :return result: (dict) the result
+    """
+    return {"name": name, "params": params, "ops_per_sec": ops_per_sec, "unit": unit}
+
+
+def result_key(result):
+    """
+    Identifier of a benchmark and its parameters, used to match results with the baseline
+    """
+    params = ", ".join(f"{name}={value}" for name, value in sorted(result["params"].items()))
+    return f"{result['name']}({params})"
+
+
+def save_results(path, results):
+    """
+    Write benchmark results in a JSON file, with a description of the machine and of the library versions
+    :param path: (str) path of the JSON file
+    :param results: ([dict]) results of benchmark_result
+    """
+    import torch
+    import stable_baselines3
+    metadata = {"date": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "platform": platform.platform(),
+                "processor": platform.processor(),
+                "cpu_count": os.cpu_count(),
+                "python": sys.version.split()[0],
+                "numpy": np.__version__,
+                "torch": torch.__version__,
+                "stable_baselines3": stable_baselines3.__version__}
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as file:
+        json.dump({"metadata": metadata, "results": results}, file, indent=2)
+
+
+def load_results(path):
+    """
+    Load the results written by save_results
+    :return results: ([dict]) the results
+    """
+    with open(path) as file:
+        return json.load(file)["results"]
+
+
+def compare_results(results, baseline, tolerance=0.2):
+    """
+    Compare results with a baseline and print them in a table
+    :param results: ([dict]) the new results
+    :param baseline: ([dict]) the results of the baseline
+    :param tolerance: (float) relative slowdown from which a result is a regression
+    :return regressions: ([str]) keys of the benchmarks slower than the baseline by more than the tolerance
+    """
+    baseline = {result_key(result): result for result in baseline}
+    rows, regressions = [], []
+    for result in results:
+        key = result_key(result)
+        reference = baseline.get(key)
+        if reference is None:
+            rows.append([key, f"{result['ops_per_sec']:.1f}", "-", "-", "new"])
+            continue
+        ratio = result["ops_per_sec"] / reference["ops_per_sec"]
+        status = "ok"
+        if ratio < 1 - tolerance:
+            status = "REGRESSION"
+            regressions.append(key)
+        rows.append([key, f"{result['ops_per_sec']:.1f}", f"{reference['ops_per_sec']:.1f}", f"{ratio:.2f}", status])
+    print(tabulate(rows, headers=["benchmark", "ops/sec", "baseline ops/sec", "ratio", "status"]))
+    return regressions
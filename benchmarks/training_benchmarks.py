@@ -0,0 +1,73 @@
+import time
+
+from stable_baselines3 import PPO
+
+from evaluate_model import evaluate_model, evaluate_model_batched
+from game.game_env import GameEnv
+from game.players import Player, bot_player_dict
+from utils.vec_env import make_vec_env
+from benchmarks.timing import benchmark_result
+
+
+def time_once(fn, nb_ops):
+    """
+    Throughput of a single call of a long function
+    """
+    start_time = time.perf_counter()
+    fn()
+    return nb_ops / (time.perf_counter() - start_time)
+
+
+def run_evaluation_benchmarks(fights_per_game_list, batch_sizes, nb_games=200):
+    """
+    Time the games played per second by evaluate_model, and by evaluate_model_batched for each batch size,
+    with the initial policy of a PPO agent against a random bot
+    :param fights_per_game_list: ([int]) numbers of fights per game
+    :param batch_sizes: ([int]) numbers of games played at once by evaluate_model_batched
+    :param nb_games: (int) number of games played by evaluate_model, evaluate_model_batched playing 8 times more
+    :return results: ([dict]) results of benchmark_result
+    """
+    results = []
+    for fights_per_game in fights_per_game_list:
+        env = GameEnv(player=Player(name='player', fights_per_game=fights_per_game),
+                      bot_player=bot_player_dict["random"](name='bot_player', fights_per_game=fights_per_game),
+                      fights_per_game=fights_per_game)
+        env.reset(seed=0)
+        model = PPO('MlpPolicy', env=env, seed=0, device="cpu")
+        results.append(benchmark_result("evaluate_model", time_once(lambda: evaluate_model(nb_games, env, model),
+                                                                    nb_games),
+                                        "games", fights_per_game=fights_per_game))
+        for batch_size in batch_sizes:
+            nb_batched_games = max(8 * nb_games, batch_size)
+            evaluate = lambda: evaluate_model_batched(model, "random", fights_per_game, nb_batched_games,
+                                                      n_envs=batch_size, seed=0, verbose=False)
+            results.append(benchmark_result("evaluate_model_batched", time_once(evaluate, nb_batched_games), "games",
+                                            fights_per_game=fights_per_game, batch_size=batch_size))
+    return results
+
+
+def run_training_benchmarks(fights_per_game_list, batch_sizes, total_timesteps=4096, vec_backend="dummy"):
+    """
+    Time the env-steps per second of PPO training, as done by train.py, for each number of games played
+    in parallel. The model is built before the timing starts.
+    :param fights_per_game_list: ([int]) numbers of fights per game
+    :param batch_sizes: ([int]) numbers of games played in parallel (n_envs)
+    :param total_timesteps: (int) number of training timesteps
+    :param vec_backend: (str) backend of the vectorized environment
+    :return results: ([dict]) results of benchmark_result
+    """
+    results = []
+    for fights_per_game in fights_per_game_list:
+        for n_envs in batch_sizes:
+            env = make_vec_env("random", fights_per_game, n_envs, vec_backend, seed=0)
+            # Keep the rollouts of all the n_envs shorter than the training
+            n_steps = max(total_timesteps // (2 * n_envs), 2)
+            model = PPO('MlpPolicy', env=env, n_steps=n_steps, batch_size=min(64, n_steps * n_envs), seed=0,
+                        device="cpu")
+            steps_per_sec = time_once(lambda: model.learn(total_timesteps=total_timesteps), total_timesteps)
+            # learn completes its last rollout, so it can make more steps than total_timesteps
+            steps_per_sec *= model.num_timesteps / total_timesteps
+            env.close()
+            results.append(benchmark_result("PPO.learn", steps_per_sec, "env-steps", fights_per_game=fights_per_game,
+                                            n_envs=n_envs, vec_backend=vec_backend))
+    return results
@@ -0,0 +1,111 @@
+import os
+import argparse
+
+import numpy as np
+
+from game.game_env import GameEnv, observation_layout
+from game.players import Player, TrainedPlayer, bot_player_dict, limit_golds
+from game.policy_table import encode_observations, write_policy_table
+
+
+def collect_observations(bot_player, fights_per_game, nb_games, seed=None):
+    """
+    Collect the observations met by a bot player during games against a player using random actions
+    :param bot_player: (Player) the bot player whose observations are collected
+    :param fights_per_game: (int) Number of fights per game
+    :param nb_games: (int) Number of games played
+    :param seed: (int) Random seed of the games
+    :return observations: (np.ndarray) (n, nb_fields) unique observations
+    """
+    env = GameEnv(player=Player(name='player', fights_per_game=fights_per_game), bot_player=bot_player,
+                  fights_per_game=fights_per_game, verbose=False)
+    observations = []
+    for game in range(nb_games):
+        env.reset(seed=seed if game == 0 else None)
+        done = False
+        while not done:
+            observations.append(env._get_observation(bot_player))
+            action = env.np_random.integers(0, env.max_gold_per_action + 1, size=4)
+            obs, reward, done, truncated, info = env.step(action)
+
+    observations = np.stack(observations)
+    keys, unique_idx = np.unique(encode_observations(observations), return_index=True)
+    return observations[unique_idx]
+
+
+def distill_player(player, observations, nb_samples):
+    """
+    Estimate the action distribution of a scripted player on each observation by sampling its actions
+    :param player: (Player) the distilled player
+    :param observations: (np.ndarray) (n, nb_fields) observations
+    :param nb_samples: (int) Number of actions sampled per observation
+    :return actions, probabilities: ([np.ndarray], [np.ndarray]) the actions and their empirical probabilities
+    """
+    layout = observation_layout(player.fights_per_game)
+    actions, probabilities = [], []
+    for observation in observations:
+        samples = []
+        for _ in range(nb_samples):
+            # The player is put in the state described by the observation before each sample
+            player.golds = observation[layout["golds"]]
+            player.force_per_fights = np.array(observation[layout["forces"]])
+            player.nb_ronins = observation[layout["ronins"]]
+            samples.append(player.choose_action(observation))
+        observation_actions, counts = np.unique(np.stack(samples), axis=0, return_counts=True)
+        actions.append(observation_actions)
+        probabilities.append(counts / nb_samples)
+    return actions, probabilities
+
+
+def distill_model(model, observations):
+    """
+    Deterministic actions of a trained model on each observation, as chosen by TrainedPlayer
+    :param model: the agent's action policy
+    :param observations: (np.ndarray) (n, nb_fields) observations
+    :return actions, probabilities: ([np.ndarray], [np.ndarray]) one action of probability 1 per observation
+    """
+    golds = observations[:, observation_layout((observations.shape[1] - 5) // 2)["golds"]]
+    model_actions, _ = model.predict(observations, deterministic=True)
+    model_actions = limit_golds(np.clip(np.rint(model_actions), 0, 7).astype(np.int64), golds)
+    return [action[None] for action in model_actions], [np.ones(1) for _ in model_actions]
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--behavior", type=str, required=False, default="heuristic",
+                        help="behavior of bot_player_dict to distill, or 'trained' for a trained model")
+    parser.add_argument('--fights_per_game', type=int, required=False, default=2)
+    parser.add_argument('--nb_games', type=int, required=False, default=10000)
+    parser.add_argument('--nb_samples', type=int, required=False, default=1000)
+    parser.add_argument('--output', type=str, required=False, default=None)
+    # Parameters of the trained model
+    parser.add_argument('--exp_name', type=str, required=False, default="")
+    parser.add_argument('--algo', type=str, required=False, default="PPO")
+    parser.add_argument("--tr_bot_behavior", type=str, required=False, default="random")
+    parser.add_argument('--tr_timesteps', type=int, required=False, default=100000)
+    parser.add_argument('--seed', type=int, required=False, default=0)
+
+    args = parser.parse_args()
+
+    if args.behavior == "trained":
+        bot_player = TrainedPlayer(name='bot_player', exp_name=args.exp_name, fights_per_game=args.fights_per_game,
+                                   algo=args.algo, tr_timesteps=args.tr_timesteps,
+                                   tr_bot_behavior=args.tr_bot_behavior, seed=args.seed)
+        table_name = f"{args.algo}_{int(args.tr_timesteps/1000)}k_steps__seed_{args.seed}_vs_{args.tr_bot_behavior}"
+    else:
+        bot_player = bot_player_dict[args.behavior](name='bot_player', fights_per_game=args.fights_per_game)
+        table_name = args.behavior
+    output = args.output or os.path.join("models", "tables", f"{args.fights_per_game}_fights_per_game", table_name)
+
+    observations = collect_observations(bot_player, args.fights_per_game, args.nb_games)
+    print(f"{len(observations)} observations collected in {args.nb_games} games")
+
+    if args.behavior == "trained":
+        actions, probabilities = distill_model(bot_player.policy, observations)
+    else:
+        actions, probabilities = distill_player(bot_player, observations, args.nb_samples)
+
+    write_policy_table(output, observations, actions, probabilities)
+    print(f"Policy table saved in {output}")
@@ -1,61 +1,252 @@
 import os
 import argparse
+import multiprocessing as mp
+from statistics import NormalDist
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 import numpy as np
 
-from stable_baselines3.common.env_checker import check_env
+from game.game_env import initialize_players_eval, initialize_game, spawn_seed_sequences
+from game.players import Player, TrainedPlayer, load_agent_name
+from utils.utils import create_saving_directories
+from utils.reports import EvaluationReport, plot_report
 
-from game.game_env import initialize_players_eval, initialize_game
-from game.players import Player, TrainedPlayer
-from utils.utils import create_saving_directories, plot_evaluation_results
 
-
-def evaluate_model(nb_testing_games, env, model):
+def evaluate_model(nb_testing_games, env, model, report=None, chunk_size=100, confidence=0.95):
     """
     Evaluate a trained RL agent against another bot
     :param nb_testing_games: (int) Number of games where agents compete with each other
     :param env : (GameEnv) Gymnasium environment
     :param model : {(int)} Neural Network weights of the agent's action policy
+    :param report : (EvaluationReport) Report where the results of each chunk of games are appended
+    :param chunk_size : (int) Number of games whose results are kept in memory before being added to the statistics
+    :param confidence : (float) Confidence level of the interval of the win rate
+    :return stats : (EvaluationStats) Statistics of the games
     """
-
-    player_wins, player_wins_list, player_nb_points = 0, [], []
-    bot_player_wins, bot_player_wins_list, bot_player_nb_points = 0, [], []
+    stats = EvaluationStats(confidence)
+    player_points, bot_points, fight_rewards = [], [], []
 
     player = env.player
     bot_player = env.bot_player
 
-    for _ in range(nb_testing_games):
+    for game in range(nb_testing_games):
         obs, info = env.reset()
         done = False
-        player_ep_nb_points = []
-        bot_ep_nb_points = []
+        rewards = []
         while not done:
             action, _ = model.predict(obs)
             obs, reward, done, truncated, info = env.step(action)
-            player_ep_nb_points.append(player.nb_points)
-            bot_ep_nb_points.append(bot_player.nb_points)
+            rewards.append(reward)
 
         # If episode is finished
-        player_nb_points.append(np.mean(player_ep_nb_points))
-        bot_player_nb_points.append(np.mean(bot_ep_nb_points))
-        if player.nb_points > bot_player.nb_points:
-            player_wins += 1
-        else:
-            bot_player_wins += 1
-        player_wins_list.append(player_wins)
-        bot_player_wins_list.append(bot_player_wins)
+        player_points.append(player.nb_points)
+        bot_points.append(bot_player.nb_points)
+        fight_rewards.append(rewards)
+        if len(player_points) == chunk_size or game == nb_testing_games - 1:
+            add_batch_results(stats, report, None, None, np.array(player_points), np.array(bot_points),
+                              np.array(fight_rewards))
+            player_points, bot_points, fight_rewards = [], [], []
+
+    stats.show()
+    return stats
+
+
+def win_rate_confidence_interval(wins, nb_games, confidence=0.95):
+    """
+    Wilson score interval of a win rate
+    :param wins: (int) Number of games won
+    :param nb_games: (int) Number of games played
+    :param confidence: (float) Confidence level of the interval
+    :return low, high: (float, float) Bounds of the interval
+    """
+    if nb_games == 0:
+        return 0., 1.
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    win_rate = wins / nb_games
+    center = (win_rate + z**2 / (2 * nb_games)) / (1 + z**2 / nb_games)
+    half_width = z * np.sqrt(win_rate * (1 - win_rate) / nb_games + z**2 / (4 * nb_games**2)) / (1 + z**2 / nb_games)
+    return center - half_width, center + half_width
+
+
+def play_batched_games(model, env):
+    """
+    Play games on all the envs of a BatchedGameEnv, the actions of all live games being predicted
+    in a single forward pass of the model
+    :param model : the agent's action policy
+    :param env : (BatchedGameEnv) Vectorized game environment
+    :return : generator of (np.ndarray, np.ndarray, np.ndarray), the final points of the env.num_envs games of each
+        round, and the (env.num_envs, fights_per_game) rewards of the player at each of their fights
+    """
+    from game.batched_game_env import PLAYER, BOT
+
+    obs = env.reset()
+    while True:
+        dones = np.zeros(env.num_envs, dtype=bool)
+        fight_rewards = []
+        while not dones.all():
+            actions, _ = model.predict(obs)
+            obs, rewards, dones, infos = env.step(actions)
+            fight_rewards.append(rewards)
+        yield env.episode_nb_points[:, PLAYER].copy(), env.episode_nb_points[:, BOT].copy(), np.stack(fight_rewards, 1)
 
-    mean_rl_ep_points = np.mean(player_nb_points)
-    mean_bot_ep_points = np.mean(bot_player_nb_points)
 
-    print(f"\nmean player points : {mean_rl_ep_points}  mean bot_player points : {mean_bot_ep_points}")
-    return player_wins_list, bot_player_wins_list
+class EvaluationStats:
+    """
+    Running statistics of an evaluation, updated with the results of each batch of games
+    """
+
+    def __init__(self, confidence=0.95):
+        self.confidence = confidence
+        self.nb_games = 0
+        self.player_wins = 0
+        self.bot_player_wins = 0
+        self.player_points = 0.
+        self.bot_player_points = 0.
+
+    def update(self, player_points, bot_points):
+        self.nb_games += len(player_points)
+        self.player_wins += int(np.sum(player_points > bot_points))
+        self.bot_player_wins += int(np.sum(player_points < bot_points))
+        self.player_points += float(np.sum(player_points))
+        self.bot_player_points += float(np.sum(bot_points))
+
+    @property
+    def draws(self):
+        return self.nb_games - self.player_wins - self.bot_player_wins
+
+    def confidence_interval(self):
+        return win_rate_confidence_interval(self.player_wins, self.nb_games, self.confidence)
+
+    def is_precise_enough(self, tolerance):
+        """
+        Returns True once the confidence interval of the win rate is narrower than the tolerance
+        """
+        low, high = self.confidence_interval()
+        return tolerance is not None and high - low < tolerance
+
+    def show(self):
+        low, high = self.confidence_interval()
+        print(f"games : {self.nb_games}  player win rate : {self.player_wins / self.nb_games:.4f} "
+              f"[{low:.4f}, {high:.4f}]  draws : {self.draws}  "
+              f"mean player points : {self.player_points / self.nb_games:.3f}  "
+              f"mean bot_player points : {self.bot_player_points / self.nb_games:.3f}")
+
+
+def evaluate_model_batched(model, bot_behavior, fights_per_game, nb_testing_games, n_envs=1024, tolerance=None,
+                           confidence=0.95, seed=None, verbose=True, report=None, keep_points=True):
+    """
+    Evaluate a trained RL agent against a bot on a BatchedGameEnv, batching the policy inference
+    over all live games
+    :param model : the agent's action policy
+    :param bot_behavior : (str) Behavior of the bot player
+    :param fights_per_game : (int) Number of fights per game
+    :param nb_testing_games : (int) Maximum number of games played
+    :param n_envs : (int) Number of games played in parallel
+    :param tolerance : (float) Stop once the confidence interval of the win rate is narrower than this value
+    :param confidence : (float) Confidence level of the interval
+    :param seed : (int) Random seed of the games
+    :param verbose : (bool) Print the running statistics after each batch of games
+    :param report : (EvaluationReport) Report where the results of each batch of games are appended
+    :param keep_points : (bool) Keep the final points of each game, else only the running statistics are kept
+    :return stats, player_points, bot_points : (EvaluationStats, np.ndarray, np.ndarray) Statistics and final points of each game
+        (None if not keep_points)
+    """
+    # The batched env is a stable-baselines3 VecEnv, imported only when needed
+    from game.batched_game_env import BatchedGameEnv
+
+    env = BatchedGameEnv(min(n_envs, nb_testing_games), bot_behavior, fights_per_game, seed=seed)
+    stats = EvaluationStats(confidence)
+    player_points, bot_points = [], []
+
+    for batch_player_points, batch_bot_points, batch_fight_rewards in play_batched_games(model, env):
+        nb_games = min(env.num_envs, nb_testing_games - stats.nb_games)
+        add_batch_results(stats, report, player_points if keep_points else None, bot_points,
+                          batch_player_points[:nb_games], batch_bot_points[:nb_games], batch_fight_rewards[:nb_games])
+        if verbose:
+            stats.show()
+        if stats.nb_games >= nb_testing_games or stats.is_precise_enough(tolerance):
+            break
+
+    if not keep_points:
+        return stats, None, None
+    return stats, np.concatenate(player_points), np.concatenate(bot_points)
+
+
+def add_batch_results(stats, report, player_points, bot_points, batch_player_points, batch_bot_points,
+                      batch_fight_rewards):
+    """
+    Add the results of a batch of games to the statistics of an evaluation, to its report if it has one,
+    and to the lists of final points if they are kept (player_points not None)
+    """
+    stats.update(batch_player_points, batch_bot_points)
+    if report is not None:
+        report.add_batch(batch_player_points, batch_bot_points, batch_fight_rewards)
+    if player_points is not None:
+        player_points.append(batch_player_points)
+        bot_points.append(batch_bot_points)
+
+
+_worker_model = None
+
+
+def _load_worker_model(trained_player_kwargs):
+    """
+    Initializer of the evaluation processes : load the evaluated policy once per process
+    """
+    global _worker_model
+    _worker_model = TrainedPlayer(**trained_player_kwargs).policy
+
+
+def _evaluate_chunk(bot_behavior, fights_per_game, nb_games, seed):
+    from game.batched_game_env import BatchedGameEnv
+
+    env = BatchedGameEnv(nb_games, bot_behavior, fights_per_game, seed=seed)
+    return next(play_batched_games(_worker_model, env))
+
+
+def evaluate_model_parallel(trained_player_kwargs, bot_behavior, fights_per_game, nb_testing_games, n_workers=None,
+                            n_envs=1024, tolerance=None, confidence=0.95, seed=0, verbose=True, report=None,
+                            keep_points=True):
+    """
+    Evaluate a trained RL agent against a bot, splitting the games in chunks played on batched
+    environments by a pool of processes. The remaining chunks are cancelled as soon as the
+    confidence interval of the win rate is narrower than the tolerance.
+    :param trained_player_kwargs : (dict) Arguments of the TrainedPlayer whose policy is evaluated
+    :param n_workers : (int) Number of processes, defaults to the number of cpus
+    :param report, keep_points : see evaluate_model_batched
+    :return stats, player_points, bot_points : see evaluate_model_batched
+    """
+    n_workers = n_workers or os.cpu_count()
+    nb_chunks = -(-nb_testing_games // n_envs)
+    chunk_sizes = [len(chunk) for chunk in np.array_split(np.arange(nb_testing_games), nb_chunks)]
+
+    stats = EvaluationStats(confidence)
+    player_points, bot_points = [], []
+
+    start_method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+    with ProcessPoolExecutor(max_workers=n_workers, mp_context=mp.get_context(start_method),
+                             initializer=_load_worker_model, initargs=(trained_player_kwargs,)) as executor:
+        # Each chunk gets its own child of the seed
+        futures = [executor.submit(_evaluate_chunk, bot_behavior, fights_per_game, chunk_size, chunk_seed)
+                   for chunk_seed, chunk_size in zip(spawn_seed_sequences(seed, nb_chunks), chunk_sizes)]
+        for future in as_completed(futures):
+            add_batch_results(stats, report, player_points if keep_points else None, bot_points, *future.result())
+            if verbose:
+                stats.show()
+            if stats.is_precise_enough(tolerance):
+                for pending in futures:
+                    pending.cancel()
+                break
+
+    if not keep_points:
+        return stats, None, None
+    return stats, np.concatenate(player_points), np.concatenate(bot_points)
 
 
 if __name__ == '__main__':
 
     parser = argparse.ArgumentParser()
-    
+
     parser.add_argument('--exp_name', type=str, required=False, default="")
     parser.add_argument('--algo', type=str, required=False, default="PPO")
     parser.add_argument('--fights_per_game', type=int, required=False, default=2)
@@ -63,27 +254,60 @@ if __name__ == '__main__':
     parser.add_argument("--tr_bot_behavior", type=str, required=False, default="random")
     parser.add_argument('--tr_timesteps', type=int, required=False, default=100000)
     parser.add_argument('--seed', type=int, required=False, default=0)
+    parser.add_argument('--fast', action="store_true",
+                        help="evaluate the actor exported by export_policy.py, run in NumPy")
     parser.add_argument('--nb_testing_games', type=int, required=False, default=1000)
+    parser.add_argument('--n_envs', type=int, required=False, default=1024,
+                        help="number of games played in parallel on a BatchedGameEnv by each process")
+    parser.add_argument('--n_workers', type=int, required=False, default=1)
+    parser.add_argument('--tolerance', type=float, required=False, default=None)
+    parser.add_argument('--confidence', type=float, required=False, default=0.95)
+    parser.add_argument('--serial', action="store_true",
+                        help="play the games one by one on a GameEnv checked by check_env, without --tolerance")
+    parser.add_argument('--report', type=str, required=False, default=None,
+                        help="JSON lines report written during the evaluation, in the logs directory by default")
+    parser.add_argument('--plot', type=str, required=False, default=None,
+                        help="PNG or HTML plot of the evaluation, next to the report by default")
 
     args = parser.parse_args()
+    if args.serial and args.tolerance is not None:
+        parser.error("--tolerance can't be used with --serial, whose games are all played")
+    if args.serial and args.n_workers > 1:
+        parser.error("--n_workers can't be used with --serial")
 
     logs_dir, models_dir = create_saving_directories(args.exp_name, args.fights_per_game, args.tr_bot_behavior)
+    evaluation_name = f"evaluation_{load_agent_name(args.algo, args.tr_timesteps, args.seed)}_vs_{args.bot_behavior}"
+    report_path = args.report or os.path.join(logs_dir, f"{evaluation_name}.jsonl")
+    plot_path = args.plot or f"{os.path.splitext(report_path)[0]}.png"
 
-    trained_player = TrainedPlayer(exp_name=args.exp_name,
-                                   fights_per_game=args.fights_per_game, 
-                                   algo=args.algo, 
-                                   tr_timesteps=args.tr_timesteps,
-                                   tr_bot_behavior=args.tr_bot_behavior, 
-                                   seed=args.seed)
-    model = trained_player.policy 
-    
-    rl_player, bot_player = initialize_players_eval(args.bot_behavior, trained_player)
-    env = initialize_game(player=trained_player, bot_player=bot_player, fights_per_game=args.fights_per_game, verbose=False) 
-    check_env(env, warn=True)
-
+    trained_player_kwargs = dict(exp_name=args.exp_name,
+                                 fights_per_game=args.fights_per_game,
+                                 algo=args.algo,
+                                 tr_timesteps=args.tr_timesteps,
+                                 tr_bot_behavior=args.tr_bot_behavior,
+                                 seed=args.seed,
+                                 fast=args.fast)
 
-    rl_player_wins_list, bot_player_wins_list = evaluate_model(args.nb_testing_games, env, model)
-    plot_evaluation_results(rl_player_wins_list, bot_player_wins_list)
+    # The evaluations only keep their running statistics, their results are streamed to the report
+    report = EvaluationReport(report_path, bot_behavior=args.bot_behavior, **trained_player_kwargs)
+    if args.n_workers > 1:
+        evaluate_model_parallel(trained_player_kwargs, args.bot_behavior, args.fights_per_game, args.nb_testing_games,
+                                args.n_workers, args.n_envs, args.tolerance, args.confidence, report=report,
+                                keep_points=False)
+    else:
+        trained_player = TrainedPlayer(**trained_player_kwargs)
+        model = trained_player.policy
 
+        if not args.serial:
+            evaluate_model_batched(model, args.bot_behavior, args.fights_per_game, args.nb_testing_games, args.n_envs,
+                                   args.tolerance, args.confidence, report=report, keep_points=False)
+        else:
+            rl_player, bot_player = initialize_players_eval(args.bot_behavior, trained_player, args.fights_per_game)
+            env = initialize_game(player=trained_player, bot_player=bot_player, fights_per_game=args.fights_per_game, verbose=False)
+            from stable_baselines3.common.env_checker import check_env
+            check_env(env, warn=True)
 
+            evaluate_model(args.nb_testing_games, env, model, report=report, confidence=args.confidence)
 
+    plot_report(report_path, plot_path)
+    print(f"Evaluation plotted in {plot_path}")
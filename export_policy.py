@@ -0,0 +1,72 @@
+import os
+import argparse
+
+import numpy as np
+
+from game.players import load_agent_name, find_saved_models
+from game.numpy_policy import export_policy, exported_policy_path, NumpyPolicy
+from utils.utils import create_saving_directories
+from utils.algos import algos
+
+
+def check_exported_policy(model, path, nb_observations=10000, seed=0):
+    """
+    Compare the actions of an exported policy with the deterministic actions of its model
+    :param model: (BaseAlgorithm) the exported model
+    :param path: (str) path of the exported policy
+    :param nb_observations: (int) number of observations drawn in the observation space of the model
+    :return max_difference: (float) largest difference between the actions of the model and of the export
+    """
+    observation_space = model.policy.observation_space
+    rng = np.random.default_rng(seed)
+    observations = rng.integers(observation_space.low, observation_space.high + 1,
+                                size=(nb_observations, *observation_space.shape), dtype=observation_space.dtype)
+    model_actions, _ = model.predict(observations, deterministic=True)
+    numpy_actions, _ = NumpyPolicy(path).predict(observations, deterministic=True)
+    return float(np.max(np.abs(model_actions.astype(np.float64) - numpy_actions)))
+
+
+def export_model(model_path, algo=None, tolerance=1e-4):
+    """
+    Export the actor of a model saved by train.py next to it, see export_policy
+    :param model_path: (str) path of the model, with or without its .zip extension
+    :param algo: (str) RL algorithm of the model, read in its name (see load_agent_name) if None
+    :param tolerance: (float) largest accepted difference between the actions of the model and of the export
+    :return path: (str) path of the exported policy
+    """
+    model_path = model_path[:-len(".zip")] if model_path.endswith(".zip") else model_path
+    algo = algo or os.path.basename(model_path).split("_")[0]
+    model = algos[algo].load(model_path, device="cpu")
+    path = export_policy(model, exported_policy_path(model_path))
+
+    max_difference = check_exported_policy(model, path)
+    if max_difference > tolerance:
+        os.remove(path)
+        raise(ValueError(f"The exported policy of {model_path} differs from the model by {max_difference}"))
+    print(f"{model_path} exported in {path} ({os.path.getsize(path)} bytes, max difference {max_difference:.2e})")
+    return path
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--exp_name', type=str, required=False, default="")
+    parser.add_argument('--algo', type=str, required=False, default="PPO")
+    parser.add_argument('--fights_per_game', type=int, required=False, default=2)
+    parser.add_argument("--tr_bot_behavior", type=str, required=False, default="random")
+    parser.add_argument('--tr_timesteps', type=int, required=False, default=100000)
+    parser.add_argument('--seed', type=int, required=False, default=0)
+    parser.add_argument('--models_dir', type=str, required=False, default=None,
+                        help="export all the models of this directory and its subdirectories instead")
+    parser.add_argument('--tolerance', type=float, required=False, default=1e-4)
+
+    args = parser.parse_args()
+
+    if args.models_dir is not None:
+        for model_path in find_saved_models(args.models_dir):
+            export_model(model_path, tolerance=args.tolerance)
+    else:
+        logs_dir, models_dir = create_saving_directories(args.exp_name, args.fights_per_game, args.tr_bot_behavior)
+        model_path = os.path.join(models_dir, load_agent_name(args.algo, args.tr_timesteps, args.seed))
+        export_model(model_path, args.algo, args.tolerance)
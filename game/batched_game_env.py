@@ -0,0 +1,376 @@
+from typing import Optional, List, Any, Sequence, Type, Union
+
+import numpy as np
+import gymnasium as gym
+from gymnasium import spaces
+from stable_baselines3.common.vec_env.base_vec_env import VecEnv, VecEnvIndices, VecEnvStepReturn, VecEnvObs
+
+from game.game_env import spawn_seed_sequences, project_actions, projection_modes, make_observation_space, \
+    observation_layout, observation_size
+from game.players import Player, bot_player_dict, limit_golds
+
+
+# Bot behaviors played by BatchedGameEnv, with the choose_actions method of their class in bot_player_dict
+batched_bot_behaviors = ["random", "heuristic", "sepuku_poets"]
+
+# Index of the players along the second axis of the state buffers
+PLAYER, BOT = 0, 1
+
+
+class BatchedGameEnv(VecEnv):
+    """
+    Vectorized version of GameEnv that plays N independent games at once.
+
+    Instead of keeping a pair of Player objects per game, the statistics of every game
+    (golds, force per fights, ronins, points, deaths per fights ...) are stored in
+    struct-of-arrays NumPy buffers. The four game actions and the fight resolution are
+    applied with masked array operations across all the games in one call.
+
+    Game i is seeded with the i-th child of np.random.SeedSequence(seed), which is split as in
+    GameEnv.reset into the generators of the env and of its two players. They are drawn from in
+    the same order as GameEnv does, so game i gives bit-identical results to a GameEnv reset with
+    this child as seed (see spawn_seed_sequences).
+
+    As any stable-baselines3 VecEnv, finished games are automatically reset and their
+    last observation is stored in info['terminal_observation'].
+
+    The bot players can also be drawn from a pool of opponents (see set_opponents), mixing scripted
+    bots and trained policies. Each policy predicts the actions of all the games it plays in a single
+    call, so that playing against trained opponents costs one forward pass per opponent and per step.
+
+    The transitions of the games can be recorded in an EpisodeRecorder of utils.episode_recorder, as in GameEnv.
+    """
+
+    def __init__(self,
+                 n_envs: int,
+                 bot_behavior: Optional[str] = "random",
+                 fights_per_game: Optional[int] = 2,
+                 bot_reward_penalty: Optional[float] = 0.5,
+                 golds_reward_penalty: Optional[float] = 0.5,
+                 seed: Optional[Union[int, np.random.SeedSequence]] = None,
+                 projection: Optional[str] = "random",
+                 recorder: Optional[Any] = None):
+
+        if bot_behavior not in batched_bot_behaviors:
+            raise(ValueError(f"Bot behavior {bot_behavior} is not available in BatchedGameEnv"))
+        if projection not in projection_modes:
+            raise(ValueError(f"Unknown projection {projection}, choose among {projection_modes}"))
+
+        self.bot_behavior = bot_behavior
+        self.actions_names = ['Sepuku', 'Hostage', 'Ronins', 'Imperial Poets']
+        self.fights_per_game = fights_per_game
+        self.bot_reward_penalty = bot_reward_penalty
+        self.golds_reward_penalty = golds_reward_penalty
+        self.projection = projection
+        self.max_gold_per_action = 7
+        self.render_mode = None
+
+        action_space = spaces.Box(low=np.zeros(4),
+                                  high=np.ones(4)*self.max_gold_per_action,
+                                  dtype=np.int64)
+
+        observation_space = make_observation_space(fights_per_game)
+        self.observation_layout = observation_layout(fights_per_game)
+
+        # Struct-of-arrays state of the N games, the second axis indexes the (player, bot_player) pair
+        self.fight_nb = np.zeros(n_envs, dtype=np.int64)
+        self.golds = np.zeros((n_envs, 2), dtype=np.int64)
+        self.gold_used_current_fight = np.zeros((n_envs, 2), dtype=np.int64)
+        self.force_per_fights = np.zeros((n_envs, 2, fights_per_game), dtype=np.int64)
+        self.nb_ronins = np.zeros((n_envs, 2), dtype=np.int64)
+        self.nb_points = np.zeros((n_envs, 2), dtype=np.int64)
+        self.death_per_fights = np.zeros((n_envs, fights_per_game), dtype=np.int64)
+        self.player_gold = np.zeros(n_envs, dtype=np.int64)
+        # Final points of the last finished game of each env, kept because finished games are reset
+        self.episode_nb_points = np.zeros((n_envs, 2), dtype=np.int64)
+        # Opponent of each game in the pool of opponents, and opponent of the last finished game of each env
+        self.opponents = [bot_behavior]
+        self.opponent_probabilities = None
+        self.opponent_ids = np.zeros(n_envs, dtype=np.int64)
+        self.episode_opponent_ids = np.zeros(n_envs, dtype=np.int64)
+        self._opponents_rng = np.random.default_rng()
+        # Scripted bots choosing the actions of all the games they play, with the generators of the games
+        self._scripted_bots = {behavior: bot_player_dict[behavior](name='bot_player', fights_per_game=fights_per_game)
+                               for behavior in batched_bot_behaviors}
+        # Observations of the players, rewritten at each step without allocating them again
+        self._observations = np.zeros((n_envs, observation_size(fights_per_game)), dtype=np.int64)
+        self._bot_observations = np.zeros((n_envs, observation_size(fights_per_game)), dtype=np.int64)
+        # Recorder of the transitions, and episode of each game in it (-1 until its first transition is recorded)
+        self.recorder = recorder
+        self.episodes = np.full(n_envs, -1, dtype=np.int64)
+
+        self._rows = np.arange(n_envs)
+        self._actions = None
+        self._rngs = [np.random.default_rng() for _ in range(n_envs)]
+        self._players_rngs = [[np.random.default_rng(), np.random.default_rng()] for _ in range(n_envs)]
+        # Bounds of the golds, ronins and force per fights drawn at each reset, see Player.reset
+        self._low = np.array([5, 0] + [1] * fights_per_game)
+        self._high = np.array([10, 3] + [6] * fights_per_game)
+
+        super().__init__(n_envs, observation_space, action_space)
+
+        if seed is not None:
+            self.seed(seed)
+
+    def seed(self, seed: Optional[Union[int, np.random.SeedSequence]] = None) -> Sequence[np.random.SeedSequence]:
+        """
+        Seed the random generators of each game with the children of np.random.SeedSequence(seed)
+        :param seed: (int or np.random.SeedSequence) the seed of the batch of games
+        :return seeds: ([np.random.SeedSequence]) the seeds of the games
+        """
+        seeds = spawn_seed_sequences(seed, self.num_envs)
+        for game, game_seed in enumerate(seeds):
+            env_seed, player_seed, bot_seed = spawn_seed_sequences(game_seed, 3)
+            self._rngs[game] = np.random.default_rng(env_seed)
+            self._players_rngs[game] = [np.random.default_rng(player_seed), np.random.default_rng(bot_seed)]
+        return seeds
+
+    def set_opponents(self, opponents: List[Any], probabilities: Optional[Sequence[float]] = None,
+                      seed: Optional[Union[int, np.random.SeedSequence]] = None) -> None:
+        """
+        Play against a pool of opponents instead of the bots of bot_behavior. Each game draws its opponent
+        in the pool when it is reset, the games being played keeping theirs if it is still in the pool.
+        :param opponents: ([str, Player or policy]) behaviors of batched_bot_behaviors, players choosing their
+            actions with choose_actions (any bot of bot_player_dict, TablePlayer, TrainedPlayer ...), or policies
+            with the predict method of stable-baselines3 (models, their policies, BatchedPolicy, NumpyPolicy ...)
+        :param probabilities: ([float]) probability of drawing each opponent, uniform if None
+        :param seed: (int or np.random.SeedSequence) seed of the draws of the opponents, unchanged if None
+        """
+        opponents = list(opponents)
+        for opponent in opponents:
+            if isinstance(opponent, str) and opponent not in batched_bot_behaviors:
+                raise(ValueError(f"Bot behavior {opponent} is not available in BatchedGameEnv"))
+        if seed is not None:
+            self._opponents_rng = np.random.default_rng(seed)
+
+        # Position of the previous opponents in the new pool, -1 for the ones removed from it
+        new_ids = np.array([opponents.index(opponent) if opponent in opponents else -1
+                            for opponent in self.opponents])
+        self.opponents = opponents
+        self.opponent_probabilities = None
+        if probabilities is not None:
+            self.opponent_probabilities = np.asarray(probabilities, dtype=np.float64) / np.sum(probabilities)
+        self.opponent_ids = new_ids[self.opponent_ids]
+        removed = np.flatnonzero(self.opponent_ids < 0)
+        self.opponent_ids[removed] = self._draw_opponents(len(removed))
+
+    def players_rngs(self, player_id: int, games: Optional[np.ndarray] = None) -> List[np.random.Generator]:
+        """
+        Generators of the player or of the bot player of some games, the ones of Player.rng in GameEnv.
+        With those of the player, a scripted player chooses the actions of the rl player as in a GameEnv.
+        :param player_id: (int) PLAYER or BOT
+        :param games: (np.ndarray) indices of the games, all of them if None
+        """
+        games = self._rows if games is None else games
+        return [self._players_rngs[i][player_id] for i in games]
+
+    def _draw_opponents(self, nb_games: int) -> np.ndarray:
+        if len(self.opponents) == 1:
+            return np.zeros(nb_games, dtype=np.int64)
+        return self._opponents_rng.choice(len(self.opponents), size=nb_games, p=self.opponent_probabilities)
+
+    def reset(self) -> VecEnvObs:
+        self._reset_games(self._rows)
+        self.reset_infos = [{} for _ in range(self.num_envs)]
+        return self._get_observation(PLAYER)
+
+    def step_async(self, actions: np.ndarray) -> None:
+        self._actions = actions
+
+    def step_wait(self) -> VecEnvStepReturn:
+        """
+        Play one fight in every game. 'actions' and 'bot_actions' are (N, 4) arrays with the golds
+        used by each player on the game actions, see GameEnv.step.
+        """
+        if self.recorder is not None:
+            # The observations before the fight, which changes the statistics they are read from
+            recorded_observations = self._get_observation(PLAYER)
+
+        # Actions of the bot players
+        bot_actions = self._bot_actions()
+
+        # Actions of the rl players
+        actions = self._transform_actions(self._actions)
+
+        # 0 : no player gets the action, 1 : the player, 2 : the bot player
+        gold_balance = actions - bot_actions
+        actions_assignement = np.where(gold_balance > 0, 1, np.where(gold_balance < 0, 2, 0))
+
+        rewards_player, rewards_bot_player = self._apply_actions(actions_assignement)
+
+        rewards = self._reward_function(actions, rewards_player, rewards_bot_player)
+
+        observations = self._get_observation(PLAYER, out=self._observations)
+
+        dones = self.fight_nb >= self.fights_per_game - 1
+        # If it is the last fight of the episode, the player get additional reward if he wins the game
+        rewards = np.where(dones & (self.nb_points[:, PLAYER] > self.nb_points[:, BOT]), rewards + 10, rewards)
+
+        self.fight_nb += 1
+
+        if self.recorder is not None:
+            new_episodes = np.flatnonzero(self.episodes < 0)
+            self.episodes[new_episodes] = self.recorder.new_episodes(len(new_episodes))
+            self.recorder.add(self.episodes, recorded_observations, self._bot_observations, actions, bot_actions,
+                              actions_assignement, rewards, observations, dones)
+
+        infos = [{} for _ in range(self.num_envs)]
+        done_games = np.flatnonzero(dones)
+        if len(done_games):
+            for i in done_games:
+                infos[i]["terminal_observation"] = observations[i].copy()
+                infos[i]["TimeLimit.truncated"] = False
+            self.episode_nb_points[done_games] = self.nb_points[done_games]
+            self.episode_opponent_ids[done_games] = self.opponent_ids[done_games]
+            self._reset_games(done_games)
+            observations = self._get_observation(PLAYER, out=self._observations)
+
+        # The buffer is rewritten at the next step while the caller may still hold the observations
+        return observations.copy(), rewards, dones, infos
+
+    def close(self) -> None:
+        pass
+
+    def get_attr(self, attr_name: str, indices: VecEnvIndices = None) -> List[Any]:
+        return [getattr(self, attr_name) for _ in self._get_indices(indices)]
+
+    def set_attr(self, attr_name: str, value: Any, indices: VecEnvIndices = None) -> None:
+        setattr(self, attr_name, value)
+
+    def env_method(self, method_name: str, *method_args, indices: VecEnvIndices = None, **method_kwargs) -> List[Any]:
+        return [getattr(self, method_name)(*method_args, **method_kwargs) for _ in self._get_indices(indices)]
+
+    def env_is_wrapped(self, wrapper_class: Type[gym.Wrapper], indices: VecEnvIndices = None) -> List[bool]:
+        return [False for _ in self._get_indices(indices)]
+
+    def _reset_games(self, games: np.ndarray) -> None:
+        """
+        Reset the statistics of the selected games, drawing them as Player.reset does for the
+        player and then for the bot player
+        """
+        self.fight_nb[games] = 0
+        self.death_per_fights[games] = 0
+        self.gold_used_current_fight[games] = 0
+        self.nb_points[games] = 0
+        self.episodes[games] = -1
+        for i in games:
+            for player_id in (PLAYER, BOT):
+                statistics = self._players_rngs[i][player_id].integers(self._low, self._high)
+                self.golds[i, player_id] = statistics[0]
+                self.nb_ronins[i, player_id] = statistics[1]
+                self.force_per_fights[i, player_id] = statistics[2:]
+        self.player_gold[games] = self.golds[games, PLAYER]
+        self.opponent_ids[games] = self._draw_opponents(len(games))
+
+    def _bot_actions(self) -> np.ndarray:
+        """
+        Returns the (N, 4) golds used by the bot players, each game being played by its opponent
+        """
+        bot_observations = self._get_observation(BOT, out=self._bot_observations)
+        if len(self.opponents) == 1:
+            bot_actions = self._opponent_actions(self.opponents[0], self._rows, bot_observations)
+        else:
+            bot_actions = np.zeros((self.num_envs, 4))
+            for opponent_id, opponent in enumerate(self.opponents):
+                games = np.flatnonzero(self.opponent_ids == opponent_id)
+                if len(games):
+                    bot_actions[games] = self._opponent_actions(opponent, games, bot_observations[games])
+
+        gold_used = bot_actions.sum(axis=1).astype(np.int64)
+        self.gold_used_current_fight[:, BOT] = gold_used
+        self.golds[:, BOT] -= gold_used
+        return bot_actions
+
+    def _opponent_actions(self, opponent: Any, games: np.ndarray, observations: np.ndarray) -> np.ndarray:
+        """
+        Returns the (len(games), 4) golds used by the bot players of some games. A scripted bot or a player chooses
+        them with its choose_actions method (the one of its class in bot_player_dict for a behavior), drawing each
+        game with its own generator as GameEnv does, and a trained policy predicts them in one call and limits them
+        to the golds of the bots as TrainedPlayer does.
+        """
+        golds = self.golds[games, BOT]
+        if isinstance(opponent, (str, Player)):
+            bot_rngs = self.players_rngs(BOT, games)
+            bot = self._scripted_bots[opponent] if isinstance(opponent, str) else opponent
+            return bot.choose_actions(observations, golds, bot_rngs)
+        actions, _ = opponent.predict(observations, deterministic=True)
+        return limit_golds(np.clip(np.rint(actions), 0, None), golds).astype(np.float64)
+
+    def _transform_actions(self, actions: np.ndarray) -> np.ndarray:
+        """
+        Transform the float to int actions, and decrease the golds used if they exceed the possessed value,
+        see project_actions
+        """
+        return project_actions(actions, self.golds[:, PLAYER], self.projection, self._rngs)
+
+    def _reward_function(self, actions: np.ndarray, rewards_rl: np.ndarray, rewards_bot: np.ndarray) -> np.ndarray:
+        """
+        Same reward as GameEnv._reward_function, computed for all games
+        """
+        rewards = rewards_rl - rewards_bot * self.bot_reward_penalty
+
+        golds_spent = np.sum(actions, axis=1)
+        surplus_gold = golds_spent - self.player_gold
+        return np.where(surplus_gold > 0, rewards - surplus_gold * self.golds_reward_penalty, rewards)
+
+    def _get_observation(self, player_id: int, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Returns the (N, 2 * fights_per_game + 5) observations of the player or of the bot player, with the
+        same layout as GameEnv._get_observation
+        :param out: (np.ndarray) array in which the observations are written, a new one if None
+        """
+        opponent_id = 1 - player_id
+        if out is None:
+            out = np.empty((self.num_envs, observation_size(self.fights_per_game)), dtype=np.int64)
+
+        layout = self.observation_layout
+        out[:, layout["fight_nb"]] = self.fight_nb
+        out[:, layout["forces"]] = self.force_per_fights[:, player_id]
+        out[:, layout["opponent_forces"]] = self.force_per_fights[:, opponent_id]
+        out[:, layout["golds"]] = self.golds[:, player_id]
+        out[:, layout["opponent_golds"]] = self.golds[:, opponent_id]
+        out[:, layout["ronins"]] = self.nb_ronins[:, player_id]
+        out[:, layout["opponent_ronins"]] = self.nb_ronins[:, opponent_id]
+        return out
+
+    def _apply_actions(self, assignement: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Apply the four game actions and the fight rules of GameEnv._apply_actions to all games.
+        The forces and deaths of the current fight are gathered in (N, 2) and (N,) arrays, updated
+        with masks selecting the player that got each game action, and scattered back at the end.
+        """
+        # (N, 2) masks of the player that got each game action
+        sides = np.array([1, 2])
+        sepuku, hostage, ronins, poets = (assignement[:, [i]] == sides for i in range(4))
+
+        force = self.force_per_fights[self._rows, :, self.fight_nb]
+        deaths = self.death_per_fights[self._rows, self.fight_nb]
+
+        # Sepuku : the units of the player suicide, and he gets 1 point for each unit
+        self.nb_points += np.where(sepuku, force, 0)
+        deaths += np.where(sepuku, force, 0).sum(axis=1)
+        force = np.where(sepuku, 0, force)
+
+        # Hostage : the player captures every enemy units and gets 1 golds per unit captured
+        captured = hostage[:, ::-1]
+        self.golds += np.where(hostage, np.where(captured, force, 0).sum(axis=1, keepdims=True), 0)
+        force = np.where(captured, 0, force)
+
+        # Ronins : the player increases his number of units by the number of ronins called
+        force = force + np.where(ronins, self.nb_ronins, 0)
+
+        # Checking of the winner and application of the fight rules
+        winner = np.stack((force[:, PLAYER] > force[:, BOT], force[:, PLAYER] < force[:, BOT]), axis=1)
+        loser = winner[:, ::-1]
+        deaths += np.where(loser, force, 0).sum(axis=1)
+        force = np.where(loser, 0, force)
+        self.golds += np.where(loser, np.where(winner, self.gold_used_current_fight, 0).sum(axis=1, keepdims=True), 0)
+        self.nb_points += np.where(winner, 4, 0)
+
+        # Imperial poets : the player gets 1 point for each unit killed in combat during the fight
+        self.nb_points += np.where(poets, deaths[:, None], 0)
+
+        self.force_per_fights[self._rows, :, self.fight_nb] = force
+        self.death_per_fights[self._rows, self.fight_nb] = deaths
+
+        return self.nb_points[:, PLAYER], self.nb_points[:, BOT]
@@ -8,6 +8,10 @@ from gymnasium import spaces
 from game.players import Player, HeuristicPlayer, SepukuPoetsPlayer, HumanPlayer, bot_player_dict
 
 
+# Ways of reducing the actions using more golds than possessed, see project_actions
+projection_modes = ["random", "proportional", "hypergeometric"]
+
+
 class GameEnv(gym.Env):
     """
      Custom Environment that follows the gym interface for the board game 'Rising Sun'
@@ -26,51 +30,57 @@ class GameEnv(gym.Env):
                  fights_per_game: Optional[int] = 2,
                  bot_reward_penalty: Optional[float] = 0.5,
                  golds_reward_penalty: Optional[float] = 0.5,
-                 verbose: Optional[bool] = False):
+                 verbose: Optional[bool] = False,
+                 projection: Optional[str] = "random",
+                 recorder: Optional[Any] = None):
         super().__init__()
 
+        if projection not in projection_modes:
+            raise(ValueError(f"Unknown projection {projection}, choose among {projection_modes}"))
+
         self.player = player
         self.player_gold = None
         self.bot_player = bot_player
         self.actions_names = ['Sepuku', 'Hostage', 'Ronins', 'Imperial Poets']
         self.fight_nb = 0
         self.fights_per_game = fights_per_game
-        self.death_per_fights = np.zeros(fights_per_game)
+        self.death_per_fights = np.zeros(fights_per_game, dtype=np.int64)
         self.bot_reward_penalty = bot_reward_penalty
         self.golds_reward_penalty = golds_reward_penalty
+        self.projection = projection
         self.max_gold_per_action = 7
 
         self.action_space = spaces.Box(low=np.zeros(4),
                                        high=np.ones(4)*self.max_gold_per_action,
                                        dtype=np.int64)
 
-        # We also fix the limits of the values of observation space with the values indicated in the Player class
-        max_nb_force_per_fight = 10
-        max_golds = 20
-        max_ronins = 3
-        self.observation_space = spaces.Box(low=np.zeros(9),
-                                            high=np.array([fights_per_game,
-                                                           max_nb_force_per_fight,
-                                                           max_nb_force_per_fight,
-                                                           max_nb_force_per_fight,
-                                                           max_nb_force_per_fight,
-                                                           max_golds,
-                                                           max_golds,
-                                                           max_ronins,
-                                                           max_ronins]),
-                                            dtype=np.int64)
+        self.observation_space = make_observation_space(fights_per_game)
+        self.observation_layout = observation_layout(fights_per_game)
+        # Observation of the bot player, rewritten at each step without allocating it again
+        self._bot_observation = np.zeros(observation_size(fights_per_game), dtype=np.int64)
+        # EpisodeRecorder of utils.episode_recorder in which the transitions are recorded, if any
+        self.recorder = recorder
+        self.episode = None
 
         self.verbose = verbose
         if self.verbose: self._show_game_state()
 
     def reset(self, seed=None, options=None) -> tuple[np.array, dict]:
         # reset les paramètres et ceux des deux joueurs aussi
+        if seed is not None:
+            # The env and both players draw from their own generators, seeded with the children of the seed
+            env_seed, player_seed, bot_seed = spawn_seed_sequences(seed, 3)
+            self._np_random = np.random.default_rng(env_seed)
+            self.player.seed(player_seed)
+            self.bot_player.seed(bot_seed)
         self.fight_nb = 0
-        self.death_per_fights = np.zeros(self.fights_per_game)
+        self.death_per_fights = np.zeros(self.fights_per_game, dtype=np.int64)
         self.player.reset()
         self.bot_player.reset()
         observation = self._get_observation(self.player)
-        self.player_gold = observation[5]
+        self.player_gold = observation[self.observation_layout["golds"]]
+        # The episode is numbered by the recorder when its first transition is recorded
+        self.episode = None
 
         info = {}
         return observation, info
@@ -88,7 +98,10 @@ class GameEnv(gym.Env):
             self._show_game_state()
 
         # Action of the bot player
-        bot_obs = self._get_observation(self.bot_player)
+        bot_obs = self._get_observation(self.bot_player, out=self._bot_observation)
+        if self.recorder is not None:
+            # The observations before the fight, which changes the statistics they are read from
+            recorded_observations = self._get_observation(self.player), bot_obs.copy()
         bot_action = self.bot_player.choose_action(bot_obs)
 
         # Action of the rl player
@@ -117,6 +130,12 @@ class GameEnv(gym.Env):
 
         self.fight_nb += 1
 
+        if self.recorder is not None:
+            if self.episode is None:
+                self.episode = self.recorder.new_episodes(1)[0]
+            self.recorder.add(self.episode, *recorded_observations, action, bot_action, actions_assignement, reward,
+                              observation, done)
+
         info = {}
         truncated = False
 
@@ -126,11 +145,7 @@ class GameEnv(gym.Env):
         """
         Transform the float to int action, and decrease the golds used if they exceed the possessed value
         """
-        action = np.rint(action)
-        while sum(action) > self.player.golds:
-            idx = np.random.randint(len(action))
-            action[idx] = max(action[idx]-1, 0)
-        return action
+        return project_actions(action, [self.player.golds], self.projection, self.np_random)[0]
 
     def _reward_function(self, action: np.array, reward_rl: float, reward_bot: float) -> float:
         """
@@ -147,23 +162,26 @@ class GameEnv(gym.Env):
 
         return reward
 
-    def _get_observation(self, player: Player) -> np.array:
+    def _get_observation(self, player: Player, out: Optional[np.ndarray] = None) -> np.array:
         """
         Returns the observation for a player
         Rt is composed of the fight number an of all the stats
-        of the player getting the observation and of its opponent
+        of the player getting the observation and of its opponent, see observation_layout
+        :param out: (np.ndarray) array in which the observation is written, a new one if None
         """
         opponent_player = self.player if player == self.bot_player else self.bot_player
-
-        return np.array((self.fight_nb,
-                         player.force_per_fights[0],
-                         player.force_per_fights[1],
-                         opponent_player.force_per_fights[0],
-                         opponent_player.force_per_fights[1],
-                         player.golds,
-                         opponent_player.golds,
-                         player.nb_ronins,
-                         opponent_player.nb_ronins))
+        if out is None:
+            out = np.empty(observation_size(self.fights_per_game), dtype=np.int64)
+
+        layout = self.observation_layout
+        out[layout["fight_nb"]] = self.fight_nb
+        out[layout["forces"]] = player.force_per_fights
+        out[layout["opponent_forces"]] = opponent_player.force_per_fights
+        out[layout["golds"]] = player.golds
+        out[layout["opponent_golds"]] = opponent_player.golds
+        out[layout["ronins"]] = player.nb_ronins
+        out[layout["opponent_ronins"]] = opponent_player.nb_ronins
+        return out
 
     def _apply_actions(self, assignement_vector: np.array) -> tuple[Any, Any]:
         """
@@ -251,16 +269,138 @@ class GameEnv(gym.Env):
         print(tabulate(data, headers="firstrow", tablefmt="fancy_grid"))
 
 
-def initialize_players_eval(bot_behavior, evaluated_player=None):
+def project_actions(actions, golds, projection="random", rngs=None):
+    """
+    Transform float to int actions, and decrease the golds used by the actions exceeding the golds possessed :
+    - 'random' removes one gold at a time from a random game action, as GameEnv always did
+    - 'proportional' scales the action down to the golds possessed, rounded with the largest remainders
+    - 'hypergeometric' keeps a uniformly random subset of the golds of the action
+    The last two reduce a batch of actions in a constant number of array operations. They ignore negative golds.
+    :param actions: (np.ndarray) (n, 4) golds per game action
+    :param golds: ([int]) golds possessed for each action
+    :param projection: (str) one of projection_modes
+    :param rngs: (np.random.Generator or [np.random.Generator]) generator of the batch or one generator per action,
+    from which the random projections draw as if each action was reduced in turn with its own generator
+    :return actions: (np.ndarray) (n, 4) the int valued actions
+    """
+    actions = np.rint(np.asarray(actions, dtype=np.float64).reshape(-1, 4))
+    golds = np.asarray(golds, dtype=np.int64).reshape(-1)
+    exceeding = np.flatnonzero(actions.sum(axis=1) > golds)
+    if not len(exceeding):
+        return actions
+
+    if projection == "proportional":
+        actions[exceeding] = _proportional_projection(np.maximum(actions[exceeding], 0), golds[exceeding])
+    elif isinstance(rngs, np.random.Generator) and projection == "hypergeometric":
+        actions[exceeding] = _hypergeometric_projection(np.maximum(actions[exceeding], 0), golds[exceeding], rngs)
+    else:
+        for i in exceeding:
+            rng = rngs if isinstance(rngs, np.random.Generator) else rngs[i]
+            if projection == "hypergeometric":
+                actions[i] = _hypergeometric_projection(np.maximum(actions[[i]], 0), golds[[i]], rng)[0]
+            elif projection == "random":
+                action = actions[i]
+                while sum(action) > golds[i]:
+                    idx = rng.integers(len(action))
+                    action[idx] = max(action[idx]-1, 0)
+            else:
+                raise(ValueError(f"Unknown projection {projection}, choose among {projection_modes}"))
+    return actions
+
+
+def _proportional_projection(actions, golds):
+    """
+    Largest remainder rounding of actions * golds / actions.sum(), ties going to the first game actions
+    """
+    scaled = actions * (golds / actions.sum(axis=1))[:, None]
+    projected = np.floor(scaled)
+    missing = np.rint(golds - projected.sum(axis=1))
+    order = np.argsort(projected - scaled, axis=1, kind="stable")
+    ranks = np.empty_like(order)
+    np.put_along_axis(ranks, order, np.arange(actions.shape[1])[None], axis=1)
+    return projected + (ranks < missing[:, None])
+
+
+def _hypergeometric_projection(actions, golds, rng):
+    """
+    Draw the golds kept on each game action when golds are sampled without replacement among those of the action,
+    as successive hypergeometric draws of the golds kept on one game action among the remaining ones
+    """
+    actions = actions.astype(np.int64)
+    remaining = actions.sum(axis=1)
+    nb_samples = golds.copy()
+    projected = np.zeros(actions.shape)
+    for k in range(actions.shape[1] - 1):
+        remaining -= actions[:, k]
+        projected[:, k] = rng.hypergeometric(actions[:, k], remaining, nb_samples)
+        nb_samples -= projected[:, k].astype(np.int64)
+    projected[:, -1] = nb_samples
+    return projected
+
+
+def observation_layout(fights_per_game):
+    """
+    Positions of the fields in the observations of GameEnv : the fight number, the forces of the player getting
+    the observation on each fight, then those of its opponent, their golds and their ronins
+    :param fights_per_game: (int) number of fights per game
+    :return layout: (dict) field name -> index of the field, or slice of the fields per fight
+    """
+    return {"fight_nb": 0,
+            "forces": slice(1, fights_per_game + 1),
+            "opponent_forces": slice(fights_per_game + 1, 2 * fights_per_game + 1),
+            "golds": 2 * fights_per_game + 1,
+            "opponent_golds": 2 * fights_per_game + 2,
+            "ronins": 2 * fights_per_game + 3,
+            "opponent_ronins": 2 * fights_per_game + 4}
+
+
+def observation_size(fights_per_game):
+    """
+    Number of fields of the observations of GameEnv, see observation_layout
+    """
+    return 2 * fights_per_game + 5
+
+
+def make_observation_space(fights_per_game, max_nb_force_per_fight=10, max_golds=20, max_ronins=3):
+    """
+    Observation space of GameEnv and BatchedGameEnv, whose limits are the values indicated in the Player class
+    :param fights_per_game: (int) number of fights per game
+    :return observation_space: (spaces.Box) the int64 observation space
+    """
+    layout = observation_layout(fights_per_game)
+    high = np.zeros(observation_size(fights_per_game), dtype=np.int64)
+    high[layout["fight_nb"]] = fights_per_game
+    high[layout["forces"]] = high[layout["opponent_forces"]] = max_nb_force_per_fight
+    high[layout["golds"]] = high[layout["opponent_golds"]] = max_golds
+    high[layout["ronins"]] = high[layout["opponent_ronins"]] = max_ronins
+    return spaces.Box(low=np.zeros(len(high)), high=high, dtype=np.int64)
+
+
+def spawn_seed_sequences(seed, n):
+    """
+    Children of a seed, equal to np.random.SeedSequence(seed).spawn(n) but without changing a SeedSequence
+    given as seed, so that the same seed always gives the same children
+    :param seed: (int or np.random.SeedSequence) the parent seed
+    :param n: (int) the number of children
+    :return seed_sequences: ([np.random.SeedSequence]) the n children
+    """
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    return [np.random.SeedSequence(seed.entropy, spawn_key=seed.spawn_key + (i,), pool_size=seed.pool_size)
+            for i in range(n)]
+
+
+def initialize_players_eval(bot_behavior, evaluated_player=None, fights_per_game=2):
     """
     Initialize two players for evaluation
     :param bot_behavior: (str) the bot_behavior (i.e. its action policy)
     :param evaluated_player: (str) the nalme of the trained evaluated player
+    :param fights_per_game: (int) the number of fights per game
     :return player: (Player) the evaluated player
     :return bot_player: (Player) the bot player
     """
-    player = Player(name='player') if not evaluated_player else evaluated_player
-    bot_player = bot_player_dict[bot_behavior](name='bot_player')
+    player = Player(name='player', fights_per_game=fights_per_game) if not evaluated_player else evaluated_player
+    bot_player = bot_player_dict[bot_behavior](name='bot_player', fights_per_game=fights_per_game)
     return player, bot_player
 
 def initialize_game(player, bot_player, fights_per_game, verbose=True):
@@ -0,0 +1,214 @@
+import os
+import json
+
+import numpy as np
+
+from utils.atomic_write import atomic_savez
+
+# Activations of the networks of stable-baselines3, by name of their torch module
+activations = {"Tanh": np.tanh,
+               "ReLU": lambda x: np.maximum(x, 0),
+               "ELU": lambda x: np.where(x > 0, x, np.expm1(np.minimum(x, 0))),
+               "LeakyReLU": lambda x: np.where(x > 0, x, 0.01 * x),
+               "Sigmoid": lambda x: 1 / (1 + np.exp(-x))}
+
+
+def exported_policy_path(model_path):
+    """
+    Path of the exported policy of a model saved by train.py, next to it
+    :param model_path: (str) path of the model, with or without its .zip extension (or the one of its export)
+    """
+    model_path = os.path.splitext(model_path)[0] if model_path.endswith((".zip", ".npz")) else model_path
+    return f"{model_path}.npz"
+
+
+def _actor_modules(policy):
+    """
+    Parts of a stable-baselines3 policy computing its actions from the flattened observation : the modules of
+    its latent features, the modules of the mean actions from them, the log standard deviation of its gaussian
+    distribution (None if it is deterministic) and whether the actions are squashed by tanh and rescaled to the
+    action space (they are clipped to it otherwise)
+    """
+    if getattr(policy, "use_sde", False) or getattr(getattr(policy, "actor", None), "use_sde", False):
+        raise(ValueError("Policies using gSDE can't be exported"))
+    if hasattr(policy, "mlp_extractor"):
+        # PPO and A2C : gaussian distribution whose log standard deviation is a parameter
+        return [policy.mlp_extractor.policy_net], [policy.action_net], policy.log_std, False
+    if hasattr(policy.actor, "latent_pi"):
+        # SAC : gaussian distribution whose log standard deviation is predicted from the latent features
+        return [policy.actor.latent_pi], [policy.actor.mu], policy.actor.log_std, True
+    # TD3 and DDPG : deterministic actor, ending with the tanh squashing its actions
+    return [], [policy.actor.mu[:-1]], None, True
+
+
+def _linear_layer(layer, weights, offset):
+    """
+    Append the weights and the bias of a torch linear layer to the flat weights
+    :return description, offset: (dict, int) the layer in the header, and the offset of the next weights
+    """
+    layer_weights = [layer.weight.detach().cpu().numpy(), layer.bias.detach().cpu().numpy()]
+    weights += [array.astype(np.float32).ravel() for array in layer_weights]
+    return ({"type": "Linear", "in": layer.in_features, "out": layer.out_features, "offset": offset},
+            offset + sum(array.size for array in layer_weights))
+
+
+def export_policy(model, path):
+    """
+    Export the actor of a stable-baselines3 model (PPO, A2C, SAC, TD3 or DDPG with an MlpPolicy) in a flat
+    weights file, run in NumPy by NumpyPolicy : the float32 weights and biases of its linear layers one
+    after the other, and a JSON header with the layers, the log standard deviation of its actions and the
+    bounds of the action space
+    :param model: (BaseAlgorithm) the model
+    :param path: (str) path of the .npz file
+    :return path: (str) the path of the file
+    """
+    import torch
+
+    policy = model.policy
+    features_extractor = getattr(policy, "pi_features_extractor", None) or getattr(policy, "actor", policy).features_extractor
+    if type(features_extractor).__name__ != "FlattenExtractor":
+        raise(ValueError(f"Only MlpPolicy can be exported, not {type(features_extractor).__name__}"))
+
+    latent_modules, mean_modules, log_std, squash_output = _actor_modules(policy)
+    layers, weights, offset, nb_latent_layers = [], [], 0, 0
+    for module in latent_modules + mean_modules:
+        for layer in (module if isinstance(module, torch.nn.Sequential) else [module]):
+            name = type(layer).__name__
+            if name == "Linear":
+                description, offset = _linear_layer(layer, weights, offset)
+                layers.append(description)
+            elif name in activations:
+                if name == "LeakyReLU" and layer.negative_slope != 0.01:
+                    raise(ValueError("Only the default slope of LeakyReLU can be exported"))
+                layers.append({"type": name})
+            elif name not in ("Identity", "Flatten"):
+                raise(ValueError(f"The layer {name} can't be exported"))
+        if module in latent_modules:
+            nb_latent_layers = len(layers)
+
+    if log_std is None:
+        log_std_description = None
+    elif isinstance(log_std, torch.nn.Linear):
+        log_std_description, offset = _linear_layer(log_std, weights, offset)
+    else:
+        log_std_description = {"type": "Constant", "offset": offset, "size": log_std.numel()}
+        weights.append(log_std.detach().cpu().numpy().astype(np.float32).ravel())
+        offset += log_std.numel()
+
+    header = {"algo": type(model).__name__,
+              "observation_shape": list(policy.observation_space.shape),
+              "action_shape": list(policy.action_space.shape),
+              "squash_output": squash_output,
+              "layers": layers,
+              "nb_latent_layers": nb_latent_layers,
+              "log_std": log_std_description}
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    atomic_savez(path, header=json.dumps(header), weights=np.concatenate(weights),
+                 action_low=policy.action_space.low.astype(np.float32),
+                 action_high=policy.action_space.high.astype(np.float32))
+    return path
+
+
+class NumpyPolicy:
+    """
+    Actor of a stable-baselines3 model exported by export_policy, whose forward pass runs in NumPy.
+
+    It has the predict method of the stable-baselines3 models, on single or batched observations : the
+    deterministic actions are the mean of the distribution of the actor, the others are sampled from it with
+    the generator of the policy. Loading it reads a few kilobytes and needs neither torch nor stable-baselines3,
+    so that the processes playing against trained agents start in milliseconds.
+    """
+
+    def __init__(self, path, seed=None):
+        self.path = path
+        self.rng = np.random.default_rng(seed)
+        with np.load(path) as data:
+            self.header = json.loads(str(data["header"]))
+            weights = data["weights"]
+            self.action_low, self.action_high = data["action_low"], data["action_high"]
+        self.observation_shape = tuple(self.header["observation_shape"])
+        self.action_shape = tuple(self.header["action_shape"])
+        self.squash_output = self.header["squash_output"]
+        self.nb_latent_layers = self.header["nb_latent_layers"]
+        # Linear layers as (transposed weights, bias), computing x @ W.T + b, and activations as functions
+        self.layers = [self._layer(layer, weights) for layer in self.header["layers"]]
+        log_std = self.header["log_std"]
+        self.log_std = None if log_std is None else self._layer(log_std, weights)
+
+    @staticmethod
+    def _layer(layer, weights):
+        if layer["type"] == "Constant":
+            return weights[layer["offset"]:layer["offset"] + layer["size"]]
+        if layer["type"] == "Linear":
+            size, offset = layer["in"] * layer["out"], layer["offset"]
+            matrix = weights[offset:offset + size].reshape(layer["out"], layer["in"])
+            return np.ascontiguousarray(matrix.T), weights[offset + size:offset + size + layer["out"]]
+        return activations[layer["type"]]
+
+    def forward(self, observations):
+        """
+        :param observations: (np.ndarray) (n, *observation_shape) observations
+        :return mean_actions, log_std: (np.ndarray, np.ndarray) (n, *action_shape) mean of the distribution of the
+            actions, before their squashing or clipping, and its log standard deviation (None if deterministic)
+        """
+        x = np.asarray(observations, dtype=np.float32).reshape(len(observations), -1)
+        latent = x
+        for i, layer in enumerate(self.layers):
+            if i == self.nb_latent_layers:
+                latent = x
+            x = x @ layer[0] + layer[1] if isinstance(layer, tuple) else layer(x)
+        if self.nb_latent_layers == len(self.layers):
+            latent = x
+
+        log_std = self.log_std
+        if isinstance(log_std, tuple):
+            # Bounds of the log standard deviation of SAC
+            log_std = np.clip(latent @ log_std[0] + log_std[1], -20, 2)
+        return x.reshape(-1, *self.action_shape), log_std
+
+    def predict(self, observation, state=None, episode_start=None, deterministic=False):
+        """
+        Same as the predict method of stable-baselines3 models
+        :param observation: (np.ndarray) one observation or a batch of observations
+        :return action, state: (np.ndarray, None) the action(s) and no recurrent state
+        """
+        observation = np.asarray(observation)
+        vectorized = observation.shape != self.observation_shape
+        actions, log_std = self.forward(observation.reshape(-1, *self.observation_shape))
+        if not deterministic and log_std is not None:
+            actions = actions + np.exp(log_std) * self.rng.standard_normal(actions.shape, dtype=np.float32)
+        if self.squash_output:
+            actions = self.action_low + 0.5 * (np.tanh(actions) + 1.0) * (self.action_high - self.action_low)
+        else:
+            actions = np.clip(actions, self.action_low, self.action_high)
+        return (actions if vectorized else actions[0]), None
+
+
+_policies = {}
+
+
+def load_numpy_policy(path):
+    """
+    Load an exported policy once per process, so that all the players using it share it
+    :param path: (str) path of the .npz file written by export_policy
+    """
+    if path not in _policies:
+        if not os.path.exists(path):
+            raise(ValueError(f"No exported policy {path}, export the model with export_policy.py first"))
+        _policies[path] = NumpyPolicy(path)
+    return _policies[path]
+
+
+def preload_numpy_policies(models_dir="models"):
+    """
+    Load all the exported policies of a directory and its subdirectories
+    :return nb_policies: (int) number of policies loaded
+    """
+    for directory, subdirectories, files in sorted(os.walk(models_dir)):
+        for file in sorted(files):
+            if file.endswith(".npz") and not file.endswith(".tmp.npz"):
+                path = os.path.join(directory, file)
+                with np.load(path) as data:
+                    if "header" in data and "weights" in data:
+                        load_numpy_policy(path)
+    return len(_policies)
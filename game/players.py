@@ -2,8 +2,12 @@ import os
 
 import numpy as np
 
-from utils.algos import algos
+from game.policy_table import load_policy_table
+from game.policy_registry import policy_registry
+from game.numpy_policy import load_numpy_policy, exported_policy_path
+from game.solver import GameSolver, state_observation, equilibrium_table_path
 from utils.utils import create_saving_directories
+from utils.algos import algo_names
 
 
 class Player:
@@ -13,31 +17,81 @@ class Player:
 
     Each player starts the game with random statistics (number of golds, number
     of units per fight, number of ronins) and counters (number of points scored,
-    golds used during each fight).
+    golds used during each fight). They are stored in a single int array and
+    drawn from the random generator of the player.
 
     For the Bot player, this class also implements the actions to return, based
     one hard-coded rules, in order to imitate realistic behaviors to play against
-    the Rl Agent.
+    the Rl Agent. They are chosen by choose_actions for a batch of games at once,
+    choose_action being its version for the game of the player.
 
     The players have a reset method that re-initialize those parameters and that
     is used by the reset method of the gym environment.
     """
 
-    def __init__(self, name, fights_per_game=2):
+    # The statistics are stored in one int array : golds, nb_ronins, force per fights, gold_used_current_fight
+    # and nb_points. The first 2 + fights_per_game values are drawn at each reset between these bounds.
+    __slots__ = ("name", "fights_per_game", "rng", "_state", "_low", "_high")
+
+    def __init__(self, name, fights_per_game=2, seed=None):
         self.name = name
         self.fights_per_game = fights_per_game
-        self.golds = np.random.randint(5, 10)
-        self.gold_used_current_fight = 0
-        self.force_per_fights = np.random.randint(1, 6, size=self.fights_per_game)
-        self.nb_ronins = np.random.randint(0, 3)
-        self.nb_points = 0
+        self.rng = np.random.default_rng(seed)
+        self._state = np.zeros(fights_per_game + 4, dtype=np.int64)
+        self._low = np.array([5, 0] + [1] * fights_per_game)
+        self._high = np.array([10, 3] + [6] * fights_per_game)
+        self.reset()
 
     def reset(self):
-        self.golds = np.random.randint(5, 10)
-        self.gold_used_current_fight = 0
-        self.force_per_fights = np.random.randint(1, 6, size=self.fights_per_game)
-        self.nb_ronins = np.random.randint(0, 3)
-        self.nb_points = 0
+        self._state[:self.fights_per_game + 2] = self.rng.integers(self._low, self._high)
+        self._state[self.fights_per_game + 2:] = 0
+
+    def seed(self, seed=None):
+        """
+        Re-create the random generator of the player
+        :param seed: (int or np.random.SeedSequence) the seed of the generator
+        """
+        self.rng = np.random.default_rng(seed)
+
+    @property
+    def golds(self):
+        return self._state[0]
+
+    @golds.setter
+    def golds(self, value):
+        self._state[0] = value
+
+    @property
+    def nb_ronins(self):
+        return self._state[1]
+
+    @nb_ronins.setter
+    def nb_ronins(self, value):
+        self._state[1] = value
+
+    @property
+    def force_per_fights(self):
+        return self._state[2:self.fights_per_game + 2]
+
+    @force_per_fights.setter
+    def force_per_fights(self, value):
+        self._state[2:self.fights_per_game + 2] = value
+
+    @property
+    def gold_used_current_fight(self):
+        return self._state[self.fights_per_game + 2]
+
+    @gold_used_current_fight.setter
+    def gold_used_current_fight(self, value):
+        self._state[self.fights_per_game + 2] = value
+
+    @property
+    def nb_points(self):
+        return self._state[self.fights_per_game + 3]
+
+    @nb_points.setter
+    def nb_points(self, value):
+        self._state[self.fights_per_game + 3] = value
 
     def show_statistics(self):
         print(f"{self.name}   Golds: {self.golds}  Units: {self.force_per_fights}  Ronins: {self.nb_ronins}  Points: {self.nb_points}")
@@ -46,31 +100,52 @@ class Player:
         return self.name, self.golds, self.force_per_fights, self.nb_ronins, self.nb_points
 
     def choose_action(self, state):
-        self.gold_used_current_fight = np.random.randint(low=0, high=self.golds)
-        golds_per_action = np.zeros(4)
-        for i in range(self.gold_used_current_fight):
-            action = np.random.randint(0, len(golds_per_action))
-            golds_per_action[action] += 1
+        # The generator of the player is given as the one of a single game, whose draws don't go through arrays
+        golds_per_action = self.choose_actions(np.asarray(state)[None], [self.golds], [self.rng])[0]
+        self.gold_used_current_fight = int(golds_per_action.sum())
         self.golds -= self.gold_used_current_fight
         return golds_per_action
+
+    def choose_actions(self, states, golds, rngs=None):
+        """
+        Choose the actions of the player in a batch of games, without changing its statistics.
+        The random player uses a random number of its golds, each gold unit going on a random game action.
+
+        :param states: (np.ndarray) (n, nb_fields) observations of the player in each game
+        :param golds: (np.ndarray) (n,) golds of the player in each game
+        :param rngs: (np.random.Generator or [np.random.Generator]) generator drawing the actions of all the games
+            at once, or one generator per game (as the games of BatchedGameEnv), the one of the player if None
+        :return: (np.ndarray) (n, 4) golds used on each game action
+        """
+        rngs = self.rng if rngs is None else rngs
+        if isinstance(rngs, np.random.Generator):
+            gold_used = rngs.integers(low=0, high=golds)
+        else:
+            gold_used = np.array([rng.integers(low=0, high=game_golds) for rng, game_golds in zip(rngs, golds)],
+                                 dtype=np.int64)
+        return spread_golds(gold_used, rngs)
     
     
 class TrainedPlayer(Player):
     """
     Class to create an opponent with an action policy (behavior) trained with Reinforcement Learning.
+
+    The policies are read in the policy registry of the process, so each model is loaded from the disk once
+    and the actions of all the players using it are predicted in batches. In fast mode, the policy is the
+    actor exported by export_policy.py, run in NumPy without loading torch nor stable-baselines3.
     """
 
-    def __init__(self, name='trained_player', exp_name='', fights_per_game=2, algo="PPO", tr_timesteps=100000, tr_bot_behavior='random', seed=0):
-        self.name = name
-        self.fights_per_game = fights_per_game
-        self.golds = np.random.randint(5, 10)
-        self.gold_used_current_fight = 0
-        self.force_per_fights = np.random.randint(1, 6, size=self.fights_per_game)
-        self.nb_ronins = np.random.randint(0, 3)
-        self.nb_points = 0
-        self.policy = self.load_policy(exp_name, algo, fights_per_game, tr_timesteps, tr_bot_behavior, seed)
-
-    def load_policy(self, exp_name, algo, fights_per_game, training_timesteps, training_bot_behavior, seed):
+    __slots__ = ("policy",)
+
+    def __init__(self, name='trained_player', exp_name='', fights_per_game=2, algo="PPO", tr_timesteps=100000, tr_bot_behavior='random', seed=0, fast=False, model_path=None):
+        super().__init__(name, fights_per_game)
+        if model_path is None:
+            self.policy = self.load_policy(exp_name, algo, fights_per_game, tr_timesteps, tr_bot_behavior, seed, fast)
+        else:
+            # A model given by its path, e.g. a checkpoint of any experiment (its export if it ends with .npz)
+            self.policy = self.load_model(model_path, fast=fast or model_path.endswith(".npz"))
+
+    def load_policy(self, exp_name, algo, fights_per_game, training_timesteps, training_bot_behavior, seed, fast=False):
         """
         Load a trained RL policy
 
@@ -80,28 +155,34 @@ class TrainedPlayer(Player):
         :param training_timestpes : (int) The number of training timesteps
         :param training_bot_behavior : (str) The bot behavior used during training
         :param seed : (int) The random seed of the training  
+        :param fast : (bool) Whether to load the exported actor of the model (see export_policy.py)
         :return policy : The agent's pretained action policy      
         """
         logs_dir, models_dir = create_saving_directories(exp_name,fights_per_game, training_bot_behavior)
         agent_name = load_agent_name(algo, training_timesteps, seed)
 
         model_name = os.path.join(models_dir, agent_name)
-        try:
-            policy = algos[algo].load(model_name)
-        except:
-            raise(ValueError(f"No model has been trained with this configuration yet"))
-        return policy
-
+        return self.load_model(model_name, algo, fast)
 
-    def choose_action(self, state):
+    @staticmethod
+    def load_model(model_path, algo=None, fast=False):
+        """
+        Load the policy of a saved model, from the policy registry or from its export in fast mode
+        :param model_path: (str) path of the model, with or without its .zip extension
+        :param algo: (str) RL algorithm of the model, read in its name if None
         """
-        Choose an action based on the current state.
+        if fast:
+            return load_numpy_policy(exported_policy_path(model_path))
+        return policy_registry.get(model_path, algo)
 
-        :param state: ([int]) The current state of the environment.
-        :return: ([int]) The selected action.
+
+    def choose_actions(self, states, golds, rngs=None):
+        """
+        Actions of the policy in a batch of games, predicted at once and limited to the golds of the player,
+        see Player.choose_actions
         """
-        action = self.policy(state)
-        return action
+        actions, _ = self.policy.predict(states, deterministic=True)
+        return limit_golds(np.clip(np.rint(actions), 0, None), golds)
 
 
 class SepukuPoetsPlayer(Player):
@@ -110,18 +191,13 @@ class SepukuPoetsPlayer(Player):
 
     At each time step, this player tries to maximize its points by applying the action sepuku (sacrificing its units) and imperial poets (win points per units killed).
     """
-    def choose_action(self, state):
-        fight_number = state[0]
-        if fight_number == 0:
-            self.gold_used_current_fight = int(self.golds/2)
-        else:
-            self.gold_used_current_fight = self.golds
-        golds_per_action = np.zeros(4)
-        golds_sepuku = int(self.gold_used_current_fight/2)
-        golds_poets = self.gold_used_current_fight - golds_sepuku
-        golds_per_action[0] += golds_sepuku
-        golds_per_action[3] += golds_poets
-        self.golds -= self.gold_used_current_fight
+    __slots__ = ()
+
+    def choose_actions(self, states, golds, rngs=None):
+        gold_used = half_golds_on_first_fight(states, golds)
+        golds_per_action = np.zeros((len(gold_used), 4))
+        golds_per_action[:, 0] = gold_used // 2
+        golds_per_action[:, 3] = gold_used - gold_used // 2
         return golds_per_action
 
 
@@ -131,26 +207,94 @@ class HeuristicPlayer(Player):
 
     If it is the first fight, this player only uses half of his golds. It it is the last one, he uses all golds.
     """
-    def choose_action(self, state):
-        fight_number = state[0]
-        if fight_number == 0:
-            # If it is the first fight, use half of the golds
-            self.gold_used_current_fight = int(self.golds/2)
+    __slots__ = ()
+
+    def choose_actions(self, states, golds, rngs=None):
+        # Each gold unit goes on a random game action
+        gold_used = half_golds_on_first_fight(states, golds)
+        return spread_golds(gold_used, self.rng if rngs is None else rngs)
+
+
+class TablePlayer(Player):
+    """
+    Class to create an opponent whose action policy is read in a policy table (see game/policy_table.py).
+
+    The table maps each observation to a distribution over actions, from which the action is sampled.
+    It is memory-mapped, so that all the players and processes using it share a single read-only copy.
+    Tables can be distilled from any Player subclass or trained model with distill_policy.py. When an
+    observation is missing from the table, the player falls back on the random behavior of Player.
+    """
+    __slots__ = ("table", "nb_misses")
+
+    def __init__(self, name, fights_per_game=2, table_dir=None):
+        from game.game_env import observation_size
+
+        super().__init__(name, fights_per_game)
+        self.table = load_policy_table(table_dir, observation_size(fights_per_game))
+        self.nb_misses = 0
+
+    def lookup(self, state):
+        return self.table.lookup(state)
+
+    def choose_actions(self, states, golds, rngs=None):
+        rngs = self.rng if rngs is None else rngs
+        golds_per_action = np.zeros((len(states), 4))
+        distributions = [self.lookup(state) for state in states]
+        misses = np.array([idx for idx, distribution in enumerate(distributions) if distribution is None],
+                          dtype=np.int64)
+        if len(misses):
+            self.nb_misses += len(misses)
+            golds_per_action[misses] = Player.choose_actions(self, states[misses], np.asarray(golds)[misses],
+                                                             select_rngs(rngs, misses))
+        hits = np.array([idx for idx, distribution in enumerate(distributions) if distribution is not None],
+                        dtype=np.int64)
+        if isinstance(rngs, np.random.Generator):
+            uniforms = rngs.random(len(hits))
         else:
-            # Else use all golds available
-            self.gold_used_current_fight = self.golds
-        golds_per_action = np.zeros(4)
-        for i in range(self.gold_used_current_fight):
-            action = np.random.randint(0, len(golds_per_action))
-            golds_per_action[action] += 1
-        self.golds -= self.gold_used_current_fight
+            uniforms = [rngs[idx].random() for idx in hits]
+        for idx, uniform in zip(hits, uniforms):
+            # Inverse of the cumulative distribution, as drawn by np.random.Generator.choice
+            actions, probabilities = distributions[idx]
+            cdf = (probabilities / probabilities.sum()).astype(np.float64).cumsum()
+            cdf /= cdf[-1]
+            golds_per_action[idx] = actions[cdf.searchsorted(uniform, side='right')]
         return golds_per_action
 
 
+class EquilibriumPlayer(TablePlayer):
+    """
+    Class to create an opponent playing the equilibrium strategy of the fight phase.
+
+    The strategies are read in the table computed by solve_game.py, which must exist, and the rare states
+    missing from it are solved on demand. They are the equilibrium of the game of GameEnv as seen by its bot
+    player, whose opponent never spends its golds (see GameSolver) : no rl player of GameEnv can do better
+    against it than the value of the game, which makes it a reference to measure how exploitable trained
+    agents are. Played on the rl side, it assumes golds that it doesn't spend, and is no longer an equilibrium.
+    """
+    __slots__ = ("solver",)
+
+    def __init__(self, name, fights_per_game=2, table_dir=None):
+        table_dir = table_dir or equilibrium_table_path(fights_per_game)
+        if not os.path.exists(table_dir):
+            raise(ValueError(f"No equilibrium table in {table_dir}, compute it with solve_game.py first"))
+        super().__init__(name, fights_per_game, table_dir)
+        self.solver = GameSolver(fights_per_game)
+
+    def lookup(self, state):
+        canonical_state = self.solver.canonical_state(state)
+        distribution = self.table.lookup(state_observation(canonical_state))
+        if distribution is None:
+            self.nb_misses += 1
+            distribution = self.solver.solve(canonical_state)[1:]
+        return distribution
+
+
 class HumanPlayer(Player):
     """
     Class to play against a bot player and input your own actions.
     """
+    __slots__ = ()
+
     def choose_action(self):
         print("Enter your gold values for sepuku, hostage, ronins and poets separated with spaces : ")
         user_input = input()
@@ -163,6 +307,55 @@ class HumanPlayer(Player):
         return golds_per_action
 
 
+# The random bots put each gold unit on one of the 4 game actions with the same probability
+game_actions_probabilities = np.full(4, 0.25)
+
+
+def select_rngs(rngs, games):
+    """
+    Generators of some games, given a generator of all the games or one generator per game
+    """
+    return rngs if isinstance(rngs, np.random.Generator) else [rngs[idx] for idx in games]
+
+
+def half_golds_on_first_fight(states, golds):
+    """
+    Golds used by the scripted bots in a batch of games : half of their golds on the first fight, all of them after
+    :param states: (np.ndarray) (n, nb_fields) observations of the bots
+    :param golds: (np.ndarray) (n,) golds of the bots
+    :return gold_used: (np.ndarray) (n,) golds used in each game
+    """
+    return np.asarray(golds) // (1 + (np.asarray(states)[:, 0] == 0))
+
+
+def spread_golds(gold_used, rngs):
+    """
+    Put each gold unit used in a batch of games on a uniformly random game action, with a multinomial draw
+    :param gold_used: (np.ndarray) (n,) golds used in each game
+    :param rngs: (np.random.Generator or [np.random.Generator]) generator of all the games, drawing them in a
+        single call, or one generator per game
+    :return: (np.ndarray) (n, 4) golds used on each game action
+    """
+    if isinstance(rngs, np.random.Generator):
+        return rngs.multinomial(gold_used, game_actions_probabilities).astype(np.float64).reshape(-1, 4)
+    return np.array([rng.multinomial(golds, game_actions_probabilities) for rng, golds in zip(rngs, gold_used)],
+                    dtype=np.float64).reshape(-1, 4)
+
+
+def limit_golds(actions, golds):
+    """
+    Remove golds from the largest entries of integer actions until they don't use more golds than possessed
+    :param actions: (np.ndarray) (n, 4) golds per game action
+    :param golds: ([int]) golds possessed for each action
+    :return actions: (np.ndarray) the limited actions
+    """
+    actions = np.array(actions)
+    for action, action_golds in zip(actions, golds):
+        while action.sum() > action_golds:
+            action[np.argmax(action)] -= 1
+    return actions
+
+
 def create_agent_name(algo, training_timesteps):
     """
     Create a unique agent name based on the algorithm and training timesteps.
@@ -186,7 +379,22 @@ def load_agent_name(algo, training_timesteps, seed):
     """
     return f"{algo}_{int(training_timesteps/1000)}k_steps__seed_{seed}"
 
+def find_saved_models(models_dir="models"):
+    """
+    Find the models saved by train.py and train_self_play.py in a directory and its subdirectories, named after
+    their algorithm (see load_agent_name), without the checkpoints being written.
+
+    :param models_dir: (str) The directory of the models.
+    :return: ([str]) The paths of the models, sorted.
+    """
+    models = []
+    for directory, subdirectories, files in sorted(os.walk(models_dir)):
+        models += [os.path.join(directory, file) for file in sorted(files)
+                   if file.endswith(".zip") and not file.endswith(".partial.zip") and file.split("_")[0] in algo_names]
+    return models
+
 bot_player_dict = {"random" : Player,
                    "heuristic": HeuristicPlayer,
-                   "sepuku_poets": SepukuPoetsPlayer}
+                   "sepuku_poets": SepukuPoetsPlayer,
+                   "equilibrium": EquilibriumPlayer}
 
@@ -0,0 +1,198 @@
+import os
+import time
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+import numpy as np
+
+from utils.algos import algos
+
+
+class BatchedPolicy:
+    """
+    Front of a trained model answering the predictions asked concurrently by many players (e.g. the games of the
+    web application) with single forward passes.
+
+    A deterministic prediction asked while no other one is queued or being made is made at once by the calling
+    thread, so that a lone player doesn't wait. The others are queued, and a serving thread gathers the requests
+    arriving within max_delay seconds (until they have max_batch_size observations), predicts their actions in one
+    call of the model and hands each player its own. The thread stops after idle_timeout seconds without requests,
+    so that an unused policy can be freed. Other predictions are made directly by the model.
+    """
+
+    def __init__(self, model, max_batch_size=64, max_delay=0.002, idle_timeout=1.):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.idle_timeout = idle_timeout
+        self.requests = deque()
+        self.nb_queued_observations = 0
+        self.condition = threading.Condition()
+        self.serving = False
+        # Whether a prediction is being made, by a player or by the serving thread
+        self.predicting = False
+        self.nb_batches = 0
+        self.nb_requests = 0
+
+    def predict(self, observation, state=None, episode_start=None, deterministic=False):
+        """
+        Same as the predict method of stable-baselines3 models
+        :param observation: (np.ndarray) one observation or a batch of observations
+        :return action, state: (np.ndarray, None) the action(s) and no recurrent state
+        """
+        if not deterministic or state is not None:
+            return self.model.predict(observation, state, episode_start, deterministic)
+
+        observation = np.asarray(observation)
+        observations = observation.reshape(-1, observation.shape[-1])
+        with self.condition:
+            alone = not self.requests and not self.predicting
+            if alone:
+                self.predicting = True
+            else:
+                future = Future()
+                self.requests.append((observations, future))
+                self.nb_queued_observations += len(observations)
+                if not self.serving:
+                    self.serving = True
+                    threading.Thread(target=self._serve, daemon=True).start()
+                self.condition.notify_all()
+
+        if alone:
+            try:
+                actions, _ = self.model.predict(observations, deterministic=True)
+            finally:
+                with self.condition:
+                    self.predicting = False
+                    self.nb_batches += 1
+                    self.nb_requests += 1
+                    self.condition.notify_all()
+        else:
+            actions = future.result()
+        return (actions[0] if observation.ndim == 1 else actions), None
+
+    def _serve(self):
+        while True:
+            with self.condition:
+                if not self.requests:
+                    self.condition.wait(self.idle_timeout)
+                    if not self.requests:
+                        self.serving = False
+                        return
+                # Wait a little for the requests of other players, to predict them in the same forward pass
+                deadline = time.monotonic() + self.max_delay
+                while self.nb_queued_observations < self.max_batch_size and time.monotonic() < deadline:
+                    self.condition.wait(deadline - time.monotonic())
+                while self.predicting:
+                    self.condition.wait()
+                # At least one request, then the next ones as long as they fit in max_batch_size observations
+                batch = [self.requests.popleft()]
+                nb_observations = len(batch[0][0])
+                while self.requests and nb_observations + len(self.requests[0][0]) <= self.max_batch_size:
+                    batch.append(self.requests.popleft())
+                    nb_observations += len(batch[-1][0])
+                self.nb_queued_observations -= nb_observations
+                self.predicting = True
+            try:
+                self._predict_batch(batch)
+            finally:
+                with self.condition:
+                    self.predicting = False
+                    self.condition.notify_all()
+
+    def _predict_batch(self, batch):
+        observations, futures = zip(*batch)
+        try:
+            actions, _ = self.model.predict(np.concatenate(observations), deterministic=True)
+        except Exception as error:
+            for future in futures:
+                future.set_exception(error)
+            return
+        self.nb_batches += 1
+        self.nb_requests += len(batch)
+        start = 0
+        for request_observations, future in zip(observations, futures):
+            future.set_result(actions[start:start + len(request_observations)])
+            start += len(request_observations)
+
+
+def model_memory(model):
+    """
+    Number of bytes used by the weights of a stable-baselines3 model and by the state of their optimizer
+    """
+    tensors = list(model.policy.parameters())
+    optimizer = getattr(model.policy, "optimizer", None)
+    if optimizer is not None:
+        tensors += [value for state in optimizer.state.values() for value in state.values() if hasattr(value, "numel")]
+    return sum(tensor.numel() * tensor.element_size() for tensor in tensors)
+
+
+class PolicyRegistry:
+    """
+    Registry of the trained models of a process, loaded from the disk once and shared by all the TrainedPlayers.
+
+    The models are kept in a LRU dict, the least recently used ones being evicted when their total memory
+    exceeds max_memory bytes (the players already using an evicted model keep it until they are deleted).
+    Each model is served through a BatchedPolicy.
+    """
+
+    def __init__(self, max_memory=1024 * 2**20, max_batch_size=64, max_delay=0.002):
+        self.max_memory = max_memory
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.policies = OrderedDict()
+        self.memory = 0
+        self.nb_loads = 0
+        self.nb_evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, model_path, algo=None):
+        """
+        Returns the policy of a trained model, loading it if it isn't in the registry
+        :param model_path: (str) path of the model saved by train.py, with or without its .zip extension
+        :param algo: (str) RL algorithm of the model, read in its name (see load_agent_name) if None
+        :return policy: (BatchedPolicy) the policy of the model
+        """
+        model_path = model_path[:-len(".zip")] if model_path.endswith(".zip") else model_path
+        with self.lock:
+            if model_path in self.policies:
+                self.policies.move_to_end(model_path)
+                return self.policies[model_path][0]
+
+            if not os.path.exists(f"{model_path}.zip"):
+                raise(ValueError(f"No model has been trained with this configuration yet"))
+            # The algorithm is the beginning of the agent name, see load_agent_name
+            algo = algo or os.path.basename(model_path).split("_")[0]
+            model = algos[algo].load(model_path, device="cpu")
+            self.nb_loads += 1
+            policy = BatchedPolicy(model, self.max_batch_size, self.max_delay)
+            memory = model_memory(model)
+            self.policies[model_path] = (policy, memory)
+            self.memory += memory
+
+            # Evict the least recently used models, but never the one just loaded
+            while self.memory > self.max_memory and len(self.policies) > 1:
+                evicted_path, (evicted_policy, evicted_memory) = self.policies.popitem(last=False)
+                self.memory -= evicted_memory
+                self.nb_evictions += 1
+            return policy
+
+    def preload(self, models_dir="models"):
+        """
+        Load all the models saved in a directory and its subdirectories, until one of them doesn't fit in max_memory
+        :param models_dir: (str) directory of the models
+        :return nb_models: (int) number of models in the registry
+        """
+        from game.players import find_saved_models
+
+        nb_evictions = self.nb_evictions
+        for path in find_saved_models(models_dir):
+            self.get(path)
+            if self.nb_evictions > nb_evictions:
+                break
+        return len(self.policies)
+
+
+# Registry of the process, used by TrainedPlayer
+policy_registry = PolicyRegistry()
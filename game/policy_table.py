@@ -0,0 +1,133 @@
+import os
+import json
+
+import numpy as np
+
+
+# Each field of the observation is encoded on 6 bits of the int64 keys, or on a byte of the keys of the observations
+# having too many fields to fit in 64 bits (games of more than 2 fights)
+OBSERVATION_BITS = 6
+MAX_OBSERVATION_VALUE = 2**OBSERVATION_BITS - 1
+TABLE_FILES = ["keys", "offsets", "actions", "probabilities"]
+
+
+def encode_observations(observations):
+    """
+    Encode observations of GameEnv._get_observation in sortable keys
+    :param observations: (np.ndarray) (n, nb_fields) observations, or a single one
+    :return keys: (np.ndarray) (n,) int64 keys, or np.void keys of nb_fields bytes when 6 bits per field don't fit
+    in 64 bits
+    """
+    observations = np.asarray(observations, dtype=np.int64)
+    nb_fields = observations.shape[-1]
+    observations = np.minimum(observations.reshape(-1, nb_fields), MAX_OBSERVATION_VALUE)
+    if nb_fields * OBSERVATION_BITS < 64:
+        return (observations << (OBSERVATION_BITS * np.arange(nb_fields))).sum(axis=1)
+    return np.ascontiguousarray(observations, dtype=np.uint8).view(f"V{nb_fields}").ravel()
+
+
+def write_policy_table(directory, observations, actions, probabilities, **extra_arrays):
+    """
+    Write an observation -> action distribution table in a directory of .npy files that can be memory-mapped :
+    the sorted keys of the observations, and for each of them a slice of the arrays of actions and probabilities
+    :param directory: (str) directory of the table
+    :param observations: (np.ndarray) (n, nb_fields) observations
+    :param actions: ([np.ndarray]) (k_i, 4) golds per game action of the actions possible for each observation
+    :param probabilities: ([np.ndarray]) (k_i,) probabilities of these actions
+    :param extra_arrays: (np.ndarray) other arrays with one value per observation, saved in the same order
+    """
+    keys = encode_observations(observations)
+    order = np.argsort(keys)
+    if len(np.unique(keys)) != len(keys):
+        raise(ValueError("The observations of a policy table must be unique"))
+
+    sizes = np.array([len(actions[idx]) for idx in order], dtype=np.int64)
+    arrays = {"keys": keys[order],
+              "offsets": np.concatenate([[0], np.cumsum(sizes)]),
+              "actions": np.concatenate([actions[idx] for idx in order]).astype(np.uint8),
+              "probabilities": np.concatenate([probabilities[idx] for idx in order]).astype(np.float32)}
+    for name, values in extra_arrays.items():
+        arrays[name] = np.asarray(values)[order]
+
+    os.makedirs(directory, exist_ok=True)
+    for name, values in arrays.items():
+        np.save(os.path.join(directory, f"{name}.npy"), values)
+    with open(os.path.join(directory, "table.json"), "w") as file:
+        json.dump({"nb_observations": len(keys), "observation_size": int(np.shape(observations)[-1]),
+                   "arrays": list(arrays)}, file)
+
+
+class PolicyTable:
+    """
+    Read-only observation -> action distribution table written by write_policy_table.
+
+    The arrays are memory-mapped, so every process using the same table shares a single copy of it
+    in the page cache and loading it costs nothing whatever its size.
+    """
+
+    def __init__(self, directory, observation_size=None):
+        """
+        :param directory: (str) directory of the table
+        :param observation_size: (int) number of fields of the observations looked up, checked against the table
+        """
+        self.directory = directory
+        with open(os.path.join(directory, "table.json")) as file:
+            self.metadata = json.load(file)
+        self.observation_size = self.metadata.get("observation_size")
+        if observation_size is not None:
+            self.check_observation_size(observation_size)
+        self.arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r')
+                       for name in self.metadata["arrays"]}
+        self.keys = self.arrays["keys"]
+        self.offsets = self.arrays["offsets"]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def check_observation_size(self, observation_size):
+        """
+        Raise a ValueError if the observations of the table don't have observation_size fields
+        """
+        if self.observation_size is not None:
+            matches = self.observation_size == observation_size
+        elif self.keys.dtype.kind == "V":
+            # Tables written before the number of fields was saved : one byte per field in their keys,
+            # or fields fitting in their int64 keys
+            matches = self.keys.dtype.itemsize == observation_size
+        else:
+            matches = observation_size * OBSERVATION_BITS < 64
+        if not matches:
+            raise(ValueError(f"The policy table {self.directory} doesn't have observations of {observation_size} "
+                             f"fields"))
+
+    def lookup(self, observation):
+        """
+        Action distribution of an observation
+        :param observation: (np.ndarray) observation of GameEnv._get_observation
+        :return actions, probabilities: (np.ndarray, np.ndarray) (k, 4) actions and their probabilities, or None if
+        the observation is not in the table
+        """
+        if self.observation_size is not None and np.shape(observation)[-1] != self.observation_size:
+            raise(ValueError(f"The policy table {self.directory} has observations of {self.observation_size} fields, "
+                             f"not {np.shape(observation)[-1]}"))
+        key = encode_observations(observation)[0]
+        idx = int(np.searchsorted(self.keys, key))
+        if idx == len(self.keys) or self.keys[idx] != key:
+            return None
+        start, end = self.offsets[idx], self.offsets[idx + 1]
+        return self.arrays["actions"][start:end], self.arrays["probabilities"][start:end]
+
+
+_tables = {}
+
+
+def load_policy_table(directory, observation_size=None):
+    """
+    Load a policy table once per process, so that all the players using it share it
+    :param observation_size: (int) number of fields of the observations looked up, checked against the table
+    """
+    if directory not in _tables:
+        _tables[directory] = PolicyTable(directory)
+    if observation_size is not None:
+        _tables[directory].check_observation_size(observation_size)
+    return _tables[directory]
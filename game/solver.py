@@ -0,0 +1,267 @@
+import os
+from functools import lru_cache
+
+import numpy as np
+
+from game.policy_table import write_policy_table, MAX_OBSERVATION_VALUE
+
+
+# Owner of a game action in the assignment codes : nobody, the solved player ('me') or his opponent
+NOBODY, ME, OPPONENT = 0, 1, 2
+NB_ASSIGNEMENTS = 3**4
+MAX_GOLDS = MAX_OBSERVATION_VALUE
+
+
+@lru_cache(maxsize=None)
+def allocations(golds, cap):
+    """
+    All the ways to spend at most 'golds' golds on the 4 game actions, with at most 'cap' golds per action
+    :param golds: (int) golds possessed
+    :param cap: (int) maximum number of golds on each game action
+    :return: (np.ndarray) (k, 4) array of allocations, the first one spending nothing
+    """
+    values = np.arange(cap + 1)
+    grid = np.stack(np.meshgrid(values, values, values, values, indexing='ij'), axis=-1).reshape(-1, 4)
+    return grid[grid.sum(axis=1) <= golds]
+
+
+@lru_cache(maxsize=None)
+def assignement_outcomes(force_me, force_opponent, ronins_me, ronins_opponent):
+    """
+    Consequences of the 81 possible assignements of the game actions on the current fight, following
+    the rules of GameEnv._apply_actions. The assignement code is sum(owner_k * 3**k) over the 4 game actions.
+    :return points_diff: (np.ndarray) points scored by 'me' minus points scored by the opponent
+    :return captured: (np.ndarray) (81, 2) golds won with the hostage action by 'me' and the opponent
+    :return fight_winner: (np.ndarray) NOBODY, ME or OPPONENT
+    """
+    points_diff = np.zeros(NB_ASSIGNEMENTS)
+    captured = np.zeros((NB_ASSIGNEMENTS, 2), dtype=np.int64)
+    fight_winner = np.zeros(NB_ASSIGNEMENTS, dtype=np.int64)
+    ronins = (ronins_me, ronins_opponent)
+
+    for code in range(NB_ASSIGNEMENTS):
+        sepuku, hostage, ronin, poets = (code // 3**k % 3 for k in range(4))
+        force = [force_me, force_opponent]
+        points = [0, 0]
+        deaths = 0
+        if sepuku:
+            points[sepuku - 1] += force[sepuku - 1]
+            deaths += force[sepuku - 1]
+            force[sepuku - 1] = 0
+        if hostage:
+            captured[code, hostage - 1] = force[2 - hostage]
+            force[2 - hostage] = 0
+        if ronin:
+            force[ronin - 1] += ronins[ronin - 1]
+        if force[0] != force[1]:
+            winner = 0 if force[0] > force[1] else 1
+            deaths += force[1 - winner]
+            points[winner] += 4
+            fight_winner[code] = winner + 1
+        if poets:
+            points[poets - 1] += deaths
+        points_diff[code] = points[0] - points[1]
+
+    return points_diff, captured, fight_winner
+
+
+def solve_matrix_game(payoffs):
+    """
+    Solve a zero-sum matrix game with linear programming
+    :param payoffs: (np.ndarray) (m, n) payoffs of the row player
+    :return value, row_strategy, column_strategy: (float, np.ndarray, np.ndarray) value and equilibrium mixed strategies
+    """
+    from scipy.optimize import linprog
+
+    m, n = payoffs.shape
+    # Maximize v such that the row strategy x gets at least v against every column : v - x.M[:, j] <= 0
+    cost = np.zeros(m + 1)
+    cost[-1] = -1
+    result = linprog(cost,
+                     A_ub=np.hstack([-payoffs.T, np.ones((n, 1))]), b_ub=np.zeros(n),
+                     A_eq=np.hstack([np.ones((1, m)), np.zeros((1, 1))]), b_eq=np.ones(1),
+                     bounds=[(0, None)] * m + [(None, None)],
+                     method='highs')
+    if result.status != 0:
+        raise(RuntimeError(f"Matrix game resolution failed : {result.message}"))
+    row_strategy = np.clip(result.x[:m], 0, None)
+    # The duals of the constraints are the column player's equilibrium strategy
+    column_strategy = np.clip(-result.ineqlin.marginals, 0, None)
+    return -result.fun, row_strategy / row_strategy.sum(), column_strategy / column_strategy.sum()
+
+
+class GameSolver:
+    """
+    Exact solver of the fight phase, seen as a sequence of simultaneous zero-sum games.
+
+    A state is (fight_nb, forces_me, forces_opponent, golds_me, golds_opponent, ronins_me, ronins_opponent),
+    the forces of the fights already played being irrelevant and set to 0. Its value is the equilibrium
+    difference of points that 'me' will score against his opponent until the end of the game.
+
+    At each fight both players choose a gold allocation on the 4 game actions. The joint allocation gives
+    the assignement of the game actions, and thus the points scored and the golds of both players at the next
+    fight. By default the solved game is the one of GameEnv, 'me' being its bot player and the opponent its rl
+    player : 'me' pays the golds he uses and the opponent gets them if he loses the fight, but the golds of the
+    opponent are never spent, so 'me' gets nothing when he loses it. With opponent_spends_golds, both players
+    pay the golds they use and the loser of the fight gets the golds of the winner, as between two bots of
+    bot_player_dict. The payoff of a joint allocation is the difference of points scored plus the value of the
+    next state, computed by memoized backward induction.
+
+    The matrix games are solved exactly by linear programming with the double oracle method : the LP is
+    solved on a growing subset of allocations, extended with the oracle_batch best responses over all the
+    allocations until none improves the value. Allocations putting more golds on an action than needed to surely win it
+    are weakly dominated and never considered.
+    """
+
+    def __init__(self, fights_per_game=2, max_gold_per_action=7, tolerance=1e-9, oracle_batch=4,
+                 opponent_spends_golds=False):
+        self.fights_per_game = fights_per_game
+        self.opponent_spends_golds = opponent_spends_golds
+        self.oracle_batch = oracle_batch
+        self.max_gold_per_action = max_gold_per_action
+        self.tolerance = tolerance
+        self.solutions = {}
+        # Values of the next fight for every pair of golds, per state of the next fight without the golds
+        self.value_grids = {}
+
+    def canonical_state(self, observation):
+        """
+        State of the player receiving an observation of GameEnv._get_observation
+        """
+        observation = [int(value) for value in observation]
+        fight_nb, nb_fights = observation[0], self.fights_per_game
+        forces_me = tuple(force if fight >= fight_nb else 0 for fight, force in enumerate(observation[1:nb_fights + 1]))
+        forces_opp = tuple(force if fight >= fight_nb else 0
+                           for fight, force in enumerate(observation[nb_fights + 1:2 * nb_fights + 1]))
+        golds_me, golds_opp, ronins_me, ronins_opp = observation[2 * nb_fights + 1:]
+        return fight_nb, forces_me, forces_opp, golds_me, golds_opp, ronins_me, ronins_opp
+
+    def solve(self, state):
+        """
+        Returns the value and the equilibrium strategy of a state
+        :param state: (tuple) canonical state, see canonical_state
+        :return value, allocations, probabilities: (float, np.ndarray, np.ndarray) value, (k, 4) allocations in the
+        support of the equilibrium strategy and their probabilities
+        """
+        if state not in self.solutions:
+            self.solutions[state] = self._solve_state(state)
+        return self.solutions[state]
+
+    def value(self, state):
+        return self.solve(state)[0]
+
+    def _caps(self, golds_me, golds_opp):
+        # Putting more golds than the opponent can on an action is enough to surely win it
+        return min(self.max_gold_per_action, golds_opp + 1), min(self.max_gold_per_action, golds_me + 1)
+
+    def _payoffs(self, state, rows, columns):
+        """
+        Payoffs of 'me' for the joint allocations (rows[i], columns[j])
+        """
+        fight_nb, forces_me, forces_opp, golds_me, golds_opp, ronins_me, ronins_opp = state
+        points_diff, captured, fight_winner = assignement_outcomes(forces_me[fight_nb], forces_opp[fight_nb],
+                                                                   ronins_me, ronins_opp)
+        owners = (rows[:, None, :] > columns[None]).astype(np.int64) + 2 * (rows[:, None, :] < columns[None])
+        codes = owners @ (3 ** np.arange(4))
+        payoffs = points_diff[codes]
+
+        if fight_nb == self.fights_per_game - 1:
+            return payoffs
+
+        spent_me, spent_opp = rows.sum(axis=1)[:, None], columns.sum(axis=1)[None] * self.opponent_spends_golds
+        next_golds_me = golds_me - spent_me + captured[codes, 0] + (fight_winner[codes] == OPPONENT) * spent_opp
+        next_golds_opp = golds_opp - spent_opp + captured[codes, 1] + (fight_winner[codes] == ME) * spent_me
+        next_golds_me, next_golds_opp = np.minimum(next_golds_me, MAX_GOLDS), np.minimum(next_golds_opp, MAX_GOLDS)
+        return payoffs + self._next_values(state, next_golds_me, next_golds_opp)
+
+    def _next_values(self, state, next_golds_me, next_golds_opp):
+        """
+        Values of the next fight for arrays of golds of both players
+        """
+        fight_nb, forces_me, forces_opp, golds_me, golds_opp, ronins_me, ronins_opp = state
+        next_forces_me = tuple(0 if fight <= fight_nb else force for fight, force in enumerate(forces_me))
+        next_forces_opp = tuple(0 if fight <= fight_nb else force for fight, force in enumerate(forces_opp))
+        grid_key = (fight_nb + 1, next_forces_me, next_forces_opp, ronins_me, ronins_opp)
+        if grid_key not in self.value_grids:
+            self.value_grids[grid_key] = np.full((MAX_GOLDS + 1, MAX_GOLDS + 1), np.nan)
+        grid = self.value_grids[grid_key]
+
+        values = grid[next_golds_me, next_golds_opp]
+        missing = np.isnan(values)
+        if missing.any():
+            for next_gold_me, next_gold_opp in set(zip(next_golds_me[missing].tolist(), next_golds_opp[missing].tolist())):
+                next_state = (fight_nb + 1, next_forces_me, next_forces_opp, next_gold_me, next_gold_opp,
+                              ronins_me, ronins_opp)
+                grid[next_gold_me, next_gold_opp] = self.value(next_state)
+            values = grid[next_golds_me, next_golds_opp]
+        return values
+
+    def _best_responses(self, payoffs, value, selected):
+        """
+        Indices of the oracle_batch best allocations whose payoff exceeds the value and not yet selected
+        """
+        candidates = np.argsort(-payoffs, kind='stable')[:self.oracle_batch + len(selected)]
+        return [int(idx) for idx in candidates
+                if payoffs[idx] > value + self.tolerance and idx not in selected][:self.oracle_batch]
+
+    def _solve_state(self, state):
+        """
+        Double oracle resolution of the matrix game of a state
+        """
+        fight_nb, forces_me, forces_opp, golds_me, golds_opp, ronins_me, ronins_opp = state
+        cap_me, cap_opp = self._caps(golds_me, golds_opp)
+        rows_allocations, columns_allocations = allocations(golds_me, cap_me), allocations(golds_opp, cap_opp)
+
+        # Payoffs of all the rows against the selected columns, and of the selected rows against all the columns
+        rows, columns = [0], [0]
+        columns_payoffs = self._payoffs(state, rows_allocations, columns_allocations[columns])
+        rows_payoffs = self._payoffs(state, rows_allocations[rows], columns_allocations)
+
+        while True:
+            value, row_strategy, column_strategy = solve_matrix_game(columns_payoffs[rows])
+
+            # Add the best responses to the current strategies that improve on the value
+            new_rows = self._best_responses(columns_payoffs @ column_strategy, value, rows)
+            new_columns = self._best_responses(-(row_strategy @ rows_payoffs), -value, columns)
+            if not new_rows and not new_columns:
+                break
+            if new_rows:
+                rows += new_rows
+                rows_payoffs = np.vstack([rows_payoffs, self._payoffs(state, rows_allocations[new_rows],
+                                                                      columns_allocations)])
+            if new_columns:
+                columns += new_columns
+                columns_payoffs = np.hstack([columns_payoffs, self._payoffs(state, rows_allocations,
+                                                                            columns_allocations[new_columns])])
+
+        support = row_strategy > self.tolerance
+        return value, rows_allocations[np.array(rows)[support]], row_strategy[support] / row_strategy[support].sum()
+
+
+def state_observation(state):
+    """
+    Observation of GameEnv._get_observation corresponding to a canonical state
+    """
+    fight_nb, forces_me, forces_opp, golds_me, golds_opp, ronins_me, ronins_opp = state
+    return np.array((fight_nb, *forces_me, *forces_opp, golds_me, golds_opp, ronins_me, ronins_opp))
+
+
+def save_equilibrium_table(directory, solutions):
+    """
+    Write equilibrium strategies in a policy table, keyed by the observations of the canonical states
+    :param directory: (str) directory of the table
+    :param solutions: (dict) (value, allocations, probabilities) of each canonical state, see GameSolver.solve
+    """
+    states = list(solutions)
+    write_policy_table(directory,
+                       observations=np.stack([state_observation(state) for state in states]),
+                       actions=[solutions[state][1] for state in states],
+                       probabilities=[solutions[state][2] for state in states],
+                       values=np.array([solutions[state][0] for state in states], dtype=np.float32))
+
+
+def equilibrium_table_path(fights_per_game):
+    """
+    Default directory of the equilibrium table written by solve_game.py
+    """
+    return os.path.join("models", "equilibrium", f"{fights_per_game}_fights_per_game")
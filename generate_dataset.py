@@ -0,0 +1,189 @@
+import os
+import glob
+import json
+import time
+import argparse
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from game.game_env import spawn_seed_sequences, projection_modes
+from game.players import TrainedPlayer, bot_player_dict
+from utils.episode_recorder import EpisodeRecorder
+from utils.atomic_write import atomic_write_json
+
+
+def make_player(spec, name, fights_per_game, fast=False):
+    """
+    Player of a dataset
+    :param spec: (str) behavior of bot_player_dict, or path of a model saved by train.py (or of its export)
+    :param fast: (bool) Whether the models are played with their exported actor (see export_policy.py)
+    """
+    if spec in bot_player_dict:
+        return bot_player_dict[spec](name=name, fights_per_game=fights_per_game)
+    return TrainedPlayer(name=name, fights_per_game=fights_per_game, fast=fast, model_path=spec)
+
+
+def shard_name(shard):
+    return f"shard_{shard:05d}"
+
+
+def play_games(player, bot_player, fights_per_game, nb_games, seed, n_envs=1024, projection="random", recorder=None):
+    """
+    Play games between two players on BatchedGameEnvs of n_envs games, each seeded with a child of the seed. The
+    player chooses the actions of the rl player of all the games at once, with the generators of the player of
+    each game, so that each game is the one of a GameEnv reset with its seed and played by the two players
+    :param player: (Player) player whose actions are given to the env
+    :param bot_player: (Player) bot player of the env
+    :param nb_games: (int) Number of games
+    :param seed: (int or np.random.SeedSequence) Random seed of the games
+    :param n_envs: (int) Number of games played in parallel
+    :param recorder: (EpisodeRecorder) recorder of the transitions of the games
+    :return results: (dict) number of games and of wins of each player, and their points
+    """
+    from game.batched_game_env import BatchedGameEnv, PLAYER, BOT
+
+    results = dict.fromkeys(["nb_games", "player_wins", "bot_player_wins", "draws", "player_points",
+                             "bot_player_points"], 0)
+    nb_batches = -(-nb_games // n_envs)
+    batch_sizes = [n_envs] * (nb_games // n_envs) + [nb_games % n_envs] * (nb_games % n_envs > 0)
+    env = None
+    for batch_seed, batch_size in zip(spawn_seed_sequences(seed, nb_batches), batch_sizes):
+        # The env is only created again for the last batch, its generators being seeded again for each batch
+        if env is None or env.num_envs != batch_size:
+            env = BatchedGameEnv(batch_size, "random", fights_per_game, projection=projection, recorder=recorder)
+            env.set_opponents([bot_player])
+        env.seed(batch_seed)
+
+        observations = env.reset()
+        player_rngs = env.players_rngs(PLAYER)
+        for _ in range(fights_per_game):
+            actions = player.choose_actions(observations, env.golds[:, PLAYER], player_rngs)
+            observations, rewards, dones, infos = env.step(actions)
+
+        points = env.episode_nb_points
+        results["nb_games"] += batch_size
+        results["player_wins"] += int(np.sum(points[:, PLAYER] > points[:, BOT]))
+        results["bot_player_wins"] += int(np.sum(points[:, PLAYER] < points[:, BOT]))
+        results["draws"] += int(np.sum(points[:, PLAYER] == points[:, BOT]))
+        results["player_points"] += int(np.sum(points[:, PLAYER]))
+        results["bot_player_points"] += int(np.sum(points[:, BOT]))
+    return results
+
+
+_worker_players = None
+
+
+def _load_worker_players(player, bot_player, fights_per_game, fast):
+    """
+    Initializer of the generation processes : create the players once per process
+    """
+    global _worker_players
+    _worker_players = (make_player(player, 'player', fights_per_game, fast),
+                       make_player(bot_player, 'bot_player', fights_per_game, fast))
+
+
+def _generate_shard(directory, shard, seed, games_per_shard, nb_games, fights_per_game, n_envs, projection):
+    player, bot_player = _worker_players
+    with EpisodeRecorder(directory, fights_per_game, shard_size=games_per_shard * fights_per_game,
+                         name=shard_name(shard), first_episode=shard * games_per_shard) as recorder:
+        return shard, play_games(player, bot_player, fights_per_game, nb_games, seed, n_envs, projection, recorder)
+
+
+def generate_dataset(directory, player, bot_player, fights_per_game, nb_games, games_per_shard=100000, n_envs=1024,
+                     n_workers=None, seed=0, projection="random", fast=False, verbose=True):
+    """
+    Play games between two players across a pool of processes, and record their transitions in a dataset read by
+    ReplayDataset. The games are split in shards of games_per_shard games, each seeded with a child of the seed and
+    recorded by its own EpisodeRecorder, so that the memory used doesn't depend on the number of games.
+
+    The completed shards are listed in the dataset.json file of the directory : an interrupted generation restarted
+    with the same arguments only plays the other shards, giving the same dataset as an uninterrupted one.
+    :param directory: (str) directory of the dataset
+    :param player, bot_player: (str) behaviors of bot_player_dict, or paths of models saved by train.py
+    :param nb_games: (int) Number of games, the last shard playing the games beyond the full shards
+    :param n_envs: (int) Number of games played in parallel by each process
+    :param n_workers: (int) Number of processes, defaults to the number of cpus
+    :param fast: (bool) Whether the models are played with their exported actor (see export_policy.py)
+    :return manifest: (dict) the content of dataset.json
+    """
+    n_workers = n_workers or os.cpu_count()
+    nb_shards = -(-nb_games // games_per_shard)
+    shards_sizes = [min(games_per_shard, nb_games - shard * games_per_shard) for shard in range(nb_shards)]
+    parameters = {"player": player, "bot_player": bot_player, "fights_per_game": fights_per_game,
+                  "nb_games": nb_games, "nb_shards": nb_shards, "games_per_shard": games_per_shard, "n_envs": n_envs, "seed": seed,
+                  "projection": projection}
+    manifest_path = os.path.join(directory, "dataset.json")
+    manifest = dict(parameters, shards={})
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as file:
+            manifest = json.load(file)
+        if {key: manifest.get(key) for key in parameters} != parameters:
+            raise(ValueError(f"The dataset {directory} was generated with other parameters, use another directory"))
+    os.makedirs(directory, exist_ok=True)
+
+    # The shards of an interrupted generation are played again
+    remaining = [shard for shard in range(nb_shards) if str(shard) not in manifest["shards"]]
+    for shard in remaining:
+        for path in glob.glob(os.path.join(directory, f"{shard_name(shard)}[._]*")):
+            os.remove(path)
+    if verbose and len(remaining) < nb_shards:
+        print(f"Resuming the generation of {directory} : {nb_shards - len(remaining)}/{nb_shards} shards done")
+
+    shards_seeds = spawn_seed_sequences(seed, nb_shards)
+    start_time, nb_games_played = time.perf_counter(), 0
+    start_method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+    with ProcessPoolExecutor(max_workers=n_workers, mp_context=mp.get_context(start_method),
+                             initializer=_load_worker_players,
+                             initargs=(player, bot_player, fights_per_game, fast)) as executor:
+        futures = [executor.submit(_generate_shard, directory, shard, shards_seeds[shard], games_per_shard,
+                                   shards_sizes[shard], fights_per_game, n_envs, projection) for shard in remaining]
+        for future in as_completed(futures):
+            shard, results = future.result()
+            manifest["shards"][str(shard)] = results
+            atomic_write_json(manifest_path, manifest)
+
+            nb_games_played += results["nb_games"]
+            if verbose:
+                elapsed = time.perf_counter() - start_time
+                print(f"{len(manifest['shards'])}/{nb_shards} shards  {nb_games_played / elapsed:.0f} games/s  "
+                      f"{nb_games_played * fights_per_game / elapsed:.0f} transitions/s")
+    return manifest
+
+
+def show_results(manifest):
+    nb_games = sum(results["nb_games"] for results in manifest["shards"].values())
+    totals = {key: sum(results[key] for results in manifest["shards"].values())
+              for key in ["player_wins", "bot_player_wins", "draws"]}
+    print(f"{nb_games} games of {manifest['player']} vs {manifest['bot_player']} : "
+          f"{totals['player_wins']} wins, {totals['bot_player_wins']} defeats, {totals['draws']} draws")
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--player', type=str, required=False, default="random",
+                        help="behavior of bot_player_dict or path of a saved model, playing as the rl player")
+    parser.add_argument('--bot_player', type=str, required=False, default="heuristic",
+                        help="behavior of bot_player_dict or path of a saved model")
+    parser.add_argument('--fights_per_game', type=int, required=False, default=2)
+    parser.add_argument('--nb_games', type=int, required=False, default=1000000)
+    parser.add_argument('--games_per_shard', type=int, required=False, default=100000)
+    parser.add_argument('--n_envs', type=int, required=False, default=1024)
+    parser.add_argument('--n_workers', type=int, required=False, default=None)
+    parser.add_argument('--seed', type=int, required=False, default=0)
+    parser.add_argument('--projection', type=str, required=False, default="random", choices=projection_modes)
+    parser.add_argument('--fast', action="store_true", help="play the models with their exported actor")
+    parser.add_argument('--output', type=str, required=False, default=None)
+
+    args = parser.parse_args()
+
+    names = [os.path.splitext(os.path.basename(spec))[0] for spec in (args.player, args.bot_player)]
+    output = args.output or os.path.join("datasets", f"{args.fights_per_game}_fights_per_game", "_vs_".join(names))
+    manifest = generate_dataset(output, args.player, args.bot_player, args.fights_per_game, args.nb_games,
+                                args.games_per_shard, args.n_envs, args.n_workers, args.seed, args.projection,
+                                args.fast)
+    show_results(manifest)
+    print(f"Dataset saved in {output}")
@@ -1,10 +1,8 @@
 import os
 import argparse
 
-from stable_baselines3 import PPO
-
 from game.game_env import GameEnv
-from game.players import HumanPlayer, bot_player_dict
+from game.players import HumanPlayer, TrainedPlayer, bot_player_dict
 
 
 def get_player_name():
@@ -15,22 +13,24 @@ def get_player_name():
     player_name = input("\nEnter your name : ")
     return player_name
 
-def initialize_players(player_name, bot_behavior):
+def initialize_players(player_name, bot_behavior, fights_per_game=2, **trained_player_kwargs):
     """
     Initialize players
     :param player_name: (str) the name of the human player
-    :param bot_behavior: (str) the behavior of the bot
+    :param bot_behavior: (str) the behavior of the bot, or 'trained' for a trained agent
+    :param fights_per_game: (int) the number of fights per game
+    :param trained_player_kwargs: parameters of the trained agent (exp_name, algo, tr_timesteps, tr_bot_behavior, seed, fast)
     :return player: (Player) instance of the human player
     :return bot_player: (Player) instance of the bot player
     """
-    player = HumanPlayer(name=player_name)
+    player = HumanPlayer(name=player_name, fights_per_game=fights_per_game)
     
     if bot_behavior in bot_player_dict:
-        bot_player = bot_player_dict[bot_behavior](name='bot_player')
+        bot_player = bot_player_dict[bot_behavior](name='bot_player', fights_per_game=fights_per_game)
     elif bot_behavior == "trained":
         try:
-            pass
-        except:
+            bot_player = TrainedPlayer(name='bot_player', fights_per_game=fights_per_game, **trained_player_kwargs)
+        except ValueError:
             raise(ValueError("A trained agent with those parameters hasn't been found"))
     else:
         raise(ValueError("Unknown bot bahavior"))
@@ -113,20 +113,26 @@ if __name__ == "__main__":
     parser.add_argument("--nb_games", type=int, required=False, default=3)
     parser.add_argument("--fights_per_game", type=int, required=False, default=2)
     parser.add_argument("--bot_behavior", type=str, required=False, default="random")
+    # Parameters of the trained agent, when bot_behavior is 'trained'
+    parser.add_argument("--exp_name", type=str, required=False, default="")
     parser.add_argument("--training_timesteps", type=int, required=False, default=100000)
+    parser.add_argument("--tr_bot_behavior", type=str, required=False, default="random")
     parser.add_argument("--seed", type=int, required=False, default=42)
     parser.add_argument("--algo", type=str, required=False, default="PPO")
+    parser.add_argument("--fast", action="store_true", help="play against the actor exported by export_policy.py")
 
     args = parser.parse_args()
 
     player_name = get_player_name()
 
-    player, bot_player = initialize_players(player_name, args.bot_behavior)
+    player, bot_player = initialize_players(player_name, args.bot_behavior, args.fights_per_game,
+                                            exp_name=args.exp_name, algo=args.algo, tr_timesteps=args.training_timesteps,
+                                            tr_bot_behavior=args.tr_bot_behavior, seed=args.seed, fast=args.fast)
 
     if ask_displaying_rules():
          display_rules()
         
-    player_won_games, bot_won_games = play_game(player, bot_player, args)
+    player_won_games, bot_won_games = play_game(player, bot_player, args.fights_per_game, args.nb_games)
 
     print_game_result(player_won_games, bot_won_games)
 
@@ -0,0 +1,62 @@
+import time
+import argparse
+import itertools
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from game.solver import GameSolver, save_equilibrium_table, equilibrium_table_path
+
+
+def solve_group(fights_per_game, forces_next_fights, ronins, forces, golds, oracle_batch):
+    """
+    Solve all the initial states sharing the forces of the fights after the first one and the ronins of both players.
+    Grouping them lets the values of the next fights be computed once.
+    :param fights_per_game: (int) Number of fights per game
+    :param forces_next_fights: (((int), (int))) forces of both players in the fights after the first one
+    :param ronins: ((int, int)) ronins of both players
+    :param forces: ([int]) possible forces of the players in the first fight
+    :param golds: ([int]) possible initial golds of the players
+    :param oracle_batch: (int) number of best responses added at each iteration of the solver
+    :return solutions: (dict) (value, allocations, probabilities) of every solved state of all the fights
+    """
+    solver = GameSolver(fights_per_game=fights_per_game, oracle_batch=oracle_batch)
+    for force_me, force_opp, golds_me, golds_opp in itertools.product(forces, forces, golds, golds):
+        state = (0, (force_me, *forces_next_fights[0]), (force_opp, *forces_next_fights[1]), golds_me, golds_opp,
+                 *ronins)
+        solver.solve(state)
+    return solver.solutions
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--fights_per_game', type=int, required=False, default=2)
+    parser.add_argument('--forces', type=int, nargs="+", required=False, default=[1, 2, 3, 4, 5])
+    parser.add_argument('--golds', type=int, nargs="+", required=False, default=[5, 6, 7, 8, 9])
+    parser.add_argument('--ronins', type=int, nargs="+", required=False, default=[0, 1, 2])
+    parser.add_argument('--oracle_batch', type=int, required=False, default=8)
+    parser.add_argument('--n_workers', type=int, required=False, default=None)
+    parser.add_argument('--output', type=str, required=False, default=None)
+
+    args = parser.parse_args()
+
+    output = args.output or equilibrium_table_path(args.fights_per_game)
+    # The initial states of the players are drawn as in Player.reset
+    forces_next_fights = list(itertools.product(args.forces, repeat=args.fights_per_game - 1))
+    groups = list(itertools.product(itertools.product(forces_next_fights, forces_next_fights),
+                                    itertools.product(args.ronins, args.ronins)))
+
+    solutions = {}
+    start_time = time.perf_counter()
+    start_method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+    with ProcessPoolExecutor(max_workers=args.n_workers, mp_context=mp.get_context(start_method)) as executor:
+        futures = [executor.submit(solve_group, args.fights_per_game, forces_next, ronins, args.forces, args.golds,
+                                   args.oracle_batch)
+                   for forces_next, ronins in groups]
+        for nb_done, future in enumerate(as_completed(futures), start=1):
+            solutions.update(future.result())
+            print(f"[{nb_done}/{len(groups)}] {len(solutions)} states solved in {time.perf_counter() - start_time:.0f}s")
+
+    save_equilibrium_table(output, solutions)
+    print(f"Equilibrium table of {len(solutions)} states saved in {output}")
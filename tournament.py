@@ -0,0 +1,221 @@
+import os
+import re
+import json
+import hashlib
+import argparse
+import itertools
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from tabulate import tabulate
+
+from game.players import bot_player_dict, find_saved_models
+from game.batched_game_env import batched_bot_behaviors
+from game.numpy_policy import exported_policy_path
+from generate_dataset import make_player, play_games
+
+
+def find_models(models_dir, fights_per_game):
+    """
+    Models saved by train.py and train_self_play.py for a number of fights per game, in the directories of all the
+    experiments and bot behaviors
+    :return models: ([str]) paths of the models
+    """
+    pattern = re.compile(rf"(^|_){fights_per_game}_fights_per_game_vs_")
+    return [path for path in find_saved_models(models_dir) if pattern.search(os.path.basename(os.path.dirname(path)))]
+
+
+def file_hash(path):
+    """
+    SHA-256 of a file, read by blocks
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(2**20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def participant_key(participant, fast=False):
+    """
+    Identity of a participant in the cache : its behavior for a scripted bot, the hash of the file played for
+    a model, so that a model saved again under the same name plays its matches again
+    """
+    if participant in bot_player_dict:
+        return participant
+    return file_hash(exported_policy_path(participant) if fast or participant.endswith(".npz") else participant)
+
+
+class ResultCache:
+    """
+    Results of the matches of the tournaments, appended to a JSON lines file as they are played. A match is
+    identified by its two participants (see participant_key), the number of fights per game, of games, the seed
+    and the number of games per batch, the seeds of the batches of games depending on their size (see play_games).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.results = {}
+        if os.path.exists(path):
+            with open(path) as file:
+                for line in file:
+                    # The last line of an interrupted tournament may be incomplete
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self.results[record["key"]] = record["results"]
+
+    @staticmethod
+    def key(player_key, bot_player_key, fights_per_game, nb_games, seed, n_envs):
+        return json.dumps([player_key, bot_player_key, fights_per_game, nb_games, seed, n_envs])
+
+    def get(self, key):
+        return self.results.get(key)
+
+    def add(self, key, results):
+        self.results[key] = results
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a") as file:
+            file.write(json.dumps({"key": key, "results": results}) + "\n")
+
+
+def _play_match(player, bot_player, fights_per_game, nb_games, seed, n_envs, fast):
+    # The models are loaded once per process by the policy registry (or the cache of the exported policies)
+    return play_games(make_player(player, 'player', fights_per_game, fast),
+                      make_player(bot_player, 'bot_player', fights_per_game, fast),
+                      fights_per_game, nb_games, seed, n_envs)
+
+
+def play_tournament(participants, fights_per_game, nb_games, cache, seed=0, n_envs=1024, n_workers=None, fast=False,
+                    verbose=True):
+    """
+    Round-robin tournament : each pair of participants plays nb_games games with each of them as the rl player
+    (whose golds aren't spent, see GameEnv), all the matches being seeded with the same seed. The matches in the
+    cache are not played again, the others are played by a pool of processes and added to the cache.
+    :param participants: ([str]) behaviors of bot_player_dict or paths of saved models
+    :param cache: (ResultCache) cache of the results of the matches
+    :param fast: (bool) Whether the models are played with their exported actor (see export_policy.py)
+    :return matches: ([(str, str, dict)]) player, bot player and results of each match
+    """
+    keys = {participant: participant_key(participant, fast) for participant in participants}
+    matches = {(player, bot_player): cache.key(keys[player], keys[bot_player], fights_per_game, nb_games, seed, n_envs)
+               for player, bot_player in itertools.permutations(participants, 2)}
+    remaining = [match for match, key in matches.items() if cache.get(key) is None]
+    if verbose:
+        print(f"{len(matches)} matches, {len(matches) - len(remaining)} in the cache, {len(remaining)} to play")
+
+    if remaining:
+        n_workers = n_workers or os.cpu_count()
+        start_method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=mp.get_context(start_method)) as executor:
+            futures = {executor.submit(_play_match, player, bot_player, fights_per_game, nb_games, seed, n_envs, fast):
+                       (player, bot_player) for player, bot_player in remaining}
+            for future in as_completed(futures):
+                player, bot_player = futures[future]
+                results = future.result()
+                cache.add(matches[(player, bot_player)], results)
+                if verbose:
+                    print(f"{player} vs {bot_player} : {results['player_wins']} wins, "
+                          f"{results['bot_player_wins']} defeats, {results['draws']} draws")
+    return [(player, bot_player, cache.get(key)) for (player, bot_player), key in matches.items()]
+
+
+def elo_ratings(participants, matches, nb_iterations=1000, tolerance=1e-10, mean_rating=1500):
+    """
+    Elo ratings fitted on all the games at once : the maximum likelihood ratings of the Bradley-Terry model,
+    where participant i scores against participant j with probability 1 / (1 + 10 ** ((r_j - r_i) / 400)),
+    a draw counting as half a win for both. They don't depend on the order of the matches, unlike sequential Elo
+    updates. The ratings of participants who won or lost all their games are pulled toward the mean by a virtual
+    draw against every other participant.
+    :param participants: ([str]) the participants
+    :param matches: ([(str, str, dict)]) player, bot player and results of each match, see play_tournament
+    :return ratings: (dict) rating of each participant, their mean being mean_rating
+    """
+    index = {participant: i for i, participant in enumerate(participants)}
+    nb_participants = len(participants)
+    # Number of games and score of i against j, with a virtual draw between every pair
+    nb_games = np.ones((nb_participants, nb_participants)) - np.eye(nb_participants)
+    scores = nb_games / 2
+    for player, bot_player, results in matches:
+        i, j = index[player], index[bot_player]
+        for a, b, wins in ((i, j, results["player_wins"]), (j, i, results["bot_player_wins"])):
+            nb_games[a, b] += results["nb_games"]
+            scores[a, b] += wins + results["draws"] / 2
+
+    # Minorization-maximization updates of the strengths (Hunter, 2004)
+    strengths = np.ones(nb_participants)
+    total_scores = scores.sum(axis=1)
+    for _ in range(nb_iterations):
+        new_strengths = total_scores / np.sum(nb_games / (strengths[:, None] + strengths[None, :]), axis=1)
+        new_strengths /= np.exp(np.mean(np.log(new_strengths)))
+        converged = np.max(np.abs(new_strengths - strengths)) < tolerance
+        strengths = new_strengths
+        if converged:
+            break
+    ratings = 400 * np.log10(strengths)
+    return {participant: float(mean_rating + rating - np.mean(ratings)) for participant, rating in zip(participants, ratings)}
+
+
+def standings(participants, matches):
+    """
+    Number of games, wins, draws and defeats of each participant, on both sides of the games
+    :return standings: (dict) statistics of each participant
+    """
+    table = {participant: dict.fromkeys(["games", "wins", "draws", "defeats"], 0) for participant in participants}
+    for player, bot_player, results in matches:
+        for participant, wins, defeats in ((player, "player_wins", "bot_player_wins"),
+                                           (bot_player, "bot_player_wins", "player_wins")):
+            table[participant]["games"] += results["nb_games"]
+            table[participant]["wins"] += results[wins]
+            table[participant]["defeats"] += results[defeats]
+            table[participant]["draws"] += results["draws"]
+    return table
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--fights_per_game', type=int, required=False, default=2)
+    parser.add_argument('--models_dir', type=str, required=False, default="models")
+    parser.add_argument("--bots", type=str, nargs="*", required=False, default=batched_bot_behaviors,
+                        choices=list(bot_player_dict), help="scripted bots of bot_player_dict taking part in the tournament")
+    parser.add_argument('--models', type=str, nargs="*", required=False, default=None,
+                        help="models taking part in the tournament, all the ones of models_dir by default")
+    parser.add_argument('--nb_games', type=int, required=False, default=10000)
+    parser.add_argument('--seed', type=int, required=False, default=0)
+    parser.add_argument('--n_envs', type=int, required=False, default=1024)
+    parser.add_argument('--n_workers', type=int, required=False, default=None)
+    parser.add_argument('--fast', action="store_true", help="play the models with their exported actor")
+    parser.add_argument('--cache', type=str, required=False, default=os.path.join("logs", "tournament_cache.jsonl"))
+    parser.add_argument('--output', type=str, required=False, default=None,
+                        help="JSON file of the ratings and of the results of the matches")
+
+    args = parser.parse_args()
+
+    models = args.models if args.models is not None else find_models(args.models_dir, args.fights_per_game)
+    participants = list(args.bots) + models
+    if len(participants) < 2:
+        raise(ValueError("A tournament needs at least 2 participants"))
+
+    matches = play_tournament(participants, args.fights_per_game, args.nb_games, ResultCache(args.cache), args.seed,
+                              args.n_envs, args.n_workers, args.fast)
+    ratings = elo_ratings(participants, matches)
+    table = standings(participants, matches)
+
+    ranking = sorted(participants, key=ratings.get, reverse=True)
+    print(tabulate([[rank + 1, participant, f"{ratings[participant]:.0f}", table[participant]["games"],
+                     table[participant]["wins"], table[participant]["draws"], table[participant]["defeats"]]
+                    for rank, participant in enumerate(ranking)],
+                   headers=["rank", "participant", "elo", "games", "wins", "draws", "defeats"]))
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as file:
+            json.dump({"fights_per_game": args.fights_per_game, "nb_games": args.nb_games, "seed": args.seed,
+                       "ratings": ratings, "standings": table,
+                       "matches": [{"player": player, "bot_player": bot_player, **results}
+                                   for player, bot_player, results in matches]}, file, indent=1)
+        print(f"Tournament saved in {args.output}")
@@ -1,43 +1,96 @@
 import os
+import time
 import argparse
 
 from stable_baselines3 import PPO, DDPG, A2C, TD3, SAC
 from stable_baselines3.common.env_checker import check_env
 
-from game.game_env import initialize_players, initialize_game
+from game.game_env import initialize_players_eval, initialize_game, projection_modes
 from game.players import create_agent_name
 from utils.utils import create_saving_directories
 from utils.algos import algos
+from utils.scheduler import create_jobs, run_jobs
+from utils.vec_env import make_vec_env, seed_vec_env, report_throughput, vec_backends
+
+
+def train_agent(exp_name, algo, bot_behavior, fights_per_game, total_timesteps, seed,
+                n_envs=1, vec_backend="dummy", n_workers=None, projection="random", verbose=1):
+    """
+    Train an agent against a bot and save its policy. Each call only uses its own players and
+    environments, so several agents can be trained concurrently.
+    :param exp_name: (str) Name of the experiment
+    :param algo: (str) RL algorithm used
+    :param bot_behavior: (str) Behavior of the opponent bot
+    :param fights_per_game: (int) Number of fights per game
+    :param total_timesteps: (int) Number of training timesteps
+    :param seed: (int) Random seed of the training
+    :param n_envs: (int) Number of games played in parallel
+    :param vec_backend: (str) Backend of the vectorized environment
+    :param n_workers: (int) Number of worker processes of the 'shm' backend
+    :param projection: (str) Reduction of the actions using more golds than possessed, see project_actions
+    :param verbose: (int) Verbosity of the stable-baselines3 model
+    :return model_path: (str) Path of the saved model
+    """
+    logs_dir, models_dir = create_saving_directories(exp_name, fights_per_game, bot_behavior)
+    agent_name = create_agent_name(algo, total_timesteps)
+
+    # Each of the n_envs games has its own player / bot player pair
+    env = make_vec_env(bot_behavior, fights_per_game, n_envs, vec_backend, n_workers, projection=projection)
+
+    model = algos[algo]('MlpPolicy', env=env, verbose=verbose, tensorboard_log=logs_dir, seed=seed)
+    # The model seeds the games with seed + i, replace it by the children of the seed
+    seed_vec_env(env, seed)
+
+    start_time = time.perf_counter()
+    model.learn(total_timesteps=total_timesteps, tb_log_name=f"{agent_name}_seed_{seed}")
+    report_throughput(env, model.num_timesteps, time.perf_counter() - start_time)
+
+    # Save under a temporary name first, so that an interrupted job is never mistaken for a trained model
+    model_path = os.path.join(models_dir, f"{agent_name}__seed_{seed}")
+    model.save(f"{model_path}.partial.zip")
+    os.replace(f"{model_path}.partial.zip", f"{model_path}.zip")
+    env.close()
+    return model_path
+
 
 if __name__ == '__main__':
 
     parser = argparse.ArgumentParser()
 
     parser.add_argument('--exp_name', type=str, required=False, default="")
-    parser.add_argument('--algo', type=str, required=False, default="PPO")
+    parser.add_argument('--algo', type=str, nargs="+", required=False, default=["PPO"])
     parser.add_argument('--fights_per_game', type=int, required=False, default=2)
-    parser.add_argument("--bot_behavior", type=str, required=False, default="random")
+    parser.add_argument("--bot_behavior", type=str, nargs="+", required=False, default=["random"])
     parser.add_argument('--total_timesteps', type=int, required=False, default=100000)
     parser.add_argument('--nb_seeds', type=int, required=False, default=3)
     parser.add_argument('--verbose', type=str, required=False, default="True")
+    parser.add_argument('--n_envs', type=int, required=False, default=1)
+    parser.add_argument('--vec_backend', type=str, required=False, default="dummy", choices=vec_backends)
+    parser.add_argument('--n_workers', type=int, required=False, default=None)
+    parser.add_argument('--projection', type=str, required=False, default="random", choices=projection_modes)
+    parser.add_argument('--max_concurrent_jobs', type=int, required=False, default=1)
+    parser.add_argument('--pin_cpus', action="store_true")
+    parser.add_argument('--no_resume', action="store_true")
 
     args = parser.parse_args()
 
-    logs_dir, models_dir = create_saving_directories(args.exp_name, args.fights_per_game, args.bot_behavior)
-    agent_name = create_agent_name(args.algo, args.total_timesteps)
-    
-    rl_player, bot_player = initialize_players(args.bot_behavior)
-    
     # Checking of the environment
-    env = initialize_game(rl_player, bot_player, args.fights_per_game)
-    check_env(env, warn=True)
-
-    for seed in range(args.nb_seeds):
-        env = initialize_game(rl_player, bot_player, args.fights_per_game, verbose=False)
-
-        model = algos[args.algo]('MlpPolicy', env=env, verbose=1, tensorboard_log=logs_dir)
-
-        model.learn(total_timesteps=args.total_timesteps, tb_log_name=f"{agent_name}_seed_{seed}")
-        model.save(os.path.join(models_dir, f"{agent_name}__seed_{seed}"))
+    for bot_behavior in args.bot_behavior:
+        rl_player, bot_player = initialize_players_eval(bot_behavior, fights_per_game=args.fights_per_game)
+        env = initialize_game(rl_player, bot_player, args.fights_per_game, verbose=args.verbose == "True")
+        check_env(env, warn=True)
 
+    # One job per (algo, bot behavior, seed), skipping the models already saved
+    jobs = create_jobs(args.exp_name, args.algo, args.bot_behavior, args.fights_per_game, args.total_timesteps,
+                       args.nb_seeds, resume=not args.no_resume)
+    for job in jobs:
+        job.update(n_envs=args.n_envs, vec_backend=args.vec_backend, n_workers=args.n_workers,
+                   projection=args.projection)
 
+    if args.max_concurrent_jobs == 1:
+        for job in jobs:
+            train_agent(**job)
+    else:
+        for job in jobs:
+            job.update(verbose=0)
+        run_jobs(train_agent, jobs, max_workers=args.max_concurrent_jobs, pin_cpus=args.pin_cpus)
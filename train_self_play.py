@@ -0,0 +1,83 @@
+import os
+import time
+import argparse
+
+from stable_baselines3.common.vec_env import VecMonitor
+
+from game.game_env import projection_modes
+from game.batched_game_env import BatchedGameEnv, batched_bot_behaviors
+from game.players import create_agent_name
+from utils.utils import create_saving_directories
+from utils.algos import algos
+from utils.league import League, SelfPlayCallback
+from utils.vec_env import report_throughput
+
+
+def train_self_play(exp_name, algo, fights_per_game, total_timesteps, seed, n_envs=64, snapshot_interval=10000,
+                    max_snapshots=10, bot_behaviors=batched_bot_behaviors, bots_probability=0.2,
+                    projection="random", verbose=1):
+    """
+    Train an agent by self-play against a league of its past snapshots and of scripted bots, and save its policy
+    in the models directory of the 'self_play' bot behavior (see create_saving_directories). The games are
+    played in a BatchedGameEnv, each snapshot predicting the actions of all the games it plays in one call.
+    :param exp_name: (str) Name of the experiment
+    :param algo: (str) RL algorithm used
+    :param fights_per_game: (int) Number of fights per game
+    :param total_timesteps: (int) Number of training timesteps
+    :param seed: (int) Random seed of the training
+    :param n_envs: (int) Number of games played in parallel
+    :param snapshot_interval: (int) Number of training timesteps between two snapshots of the policy
+    :param max_snapshots: (int) Number of snapshots kept in the league
+    :param bot_behaviors: ([str]) Behaviors of the scripted bots of the league, in batched_bot_behaviors
+    :param bots_probability: (float) Probability of playing a game against a scripted bot
+    :param projection: (str) Reduction of the actions using more golds than possessed, see project_actions
+    :param verbose: (int) Verbosity of the stable-baselines3 model
+    :return model_path: (str) Path of the saved model
+    """
+    logs_dir, models_dir = create_saving_directories(exp_name, fights_per_game, "self_play")
+    agent_name = create_agent_name(algo, total_timesteps)
+
+    env = BatchedGameEnv(n_envs, bot_behaviors[0] if bot_behaviors else "random", fights_per_game,
+                         seed=seed, projection=projection)
+    league = League(bot_behaviors, max_snapshots, bots_probability)
+    callback = SelfPlayCallback(env, league, snapshot_interval, seed=seed, verbose=verbose)
+
+    # The monitor logs the episode rewards, whatever the opponent
+    model = algos[algo]('MlpPolicy', env=VecMonitor(env), verbose=verbose, tensorboard_log=logs_dir, seed=seed)
+
+    start_time = time.perf_counter()
+    model.learn(total_timesteps=total_timesteps, tb_log_name=f"{agent_name}_seed_{seed}", callback=callback)
+    report_throughput(env, model.num_timesteps, time.perf_counter() - start_time)
+
+    # Save under a temporary name first, so that an interrupted training is never mistaken for a trained model
+    model_path = os.path.join(models_dir, f"{agent_name}__seed_{seed}")
+    model.save(f"{model_path}.partial.zip")
+    os.replace(f"{model_path}.partial.zip", f"{model_path}.zip")
+    env.close()
+    return model_path
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--exp_name', type=str, required=False, default="")
+    parser.add_argument('--algo', type=str, required=False, default="PPO")
+    parser.add_argument('--fights_per_game', type=int, required=False, default=2)
+    parser.add_argument('--total_timesteps', type=int, required=False, default=100000)
+    parser.add_argument('--nb_seeds', type=int, required=False, default=1)
+    parser.add_argument('--n_envs', type=int, required=False, default=64)
+    parser.add_argument('--snapshot_interval', type=int, required=False, default=10000)
+    parser.add_argument('--max_snapshots', type=int, required=False, default=10)
+    parser.add_argument("--bot_behavior", type=str, nargs="*", required=False, default=batched_bot_behaviors,
+                        choices=batched_bot_behaviors, help="scripted bots of the league")
+    parser.add_argument('--bots_probability', type=float, required=False, default=0.2)
+    parser.add_argument('--projection', type=str, required=False, default="random", choices=projection_modes)
+    parser.add_argument('--verbose', type=int, required=False, default=1)
+
+    args = parser.parse_args()
+
+    for seed in range(args.nb_seeds):
+        train_self_play(args.exp_name, args.algo, args.fights_per_game, args.total_timesteps, seed, args.n_envs,
+                        args.snapshot_interval, args.max_snapshots, args.bot_behavior, args.bots_probability,
+                        args.projection, args.verbose)
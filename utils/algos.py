@@ -1,7 +1,34 @@
-from stable_baselines3 import PPO, DDPG, A2C, TD3, SAC
+import importlib
+from collections.abc import Mapping
 
-algos = {"PPO": PPO,
-         "DDPG": DDPG,
-         "A2C": A2C,
-         "TD3": TD3,
-         "SAC": SAC}
\ No newline at end of file
+
+class LazyAlgos(Mapping):
+    """
+    Mapping of the stable-baselines3 algorithms by name, importing stable-baselines3 (and torch) only when an
+    algorithm is first used, so that the scripted bots, the game and the web application start without them
+    """
+
+    def __init__(self):
+        self._algos = {}
+
+    def __getitem__(self, name):
+        if name not in algo_names:
+            raise(KeyError(f"Unknown algorithm {name}, choose among {algo_names}"))
+        if name not in self._algos:
+            self._algos[name] = getattr(importlib.import_module("stable_baselines3"), name)
+        return self._algos[name]
+
+    def __contains__(self, name):
+        # Checking a name doesn't import its algorithm
+        return name in algo_names
+
+    def __iter__(self):
+        return iter(algo_names)
+
+    def __len__(self):
+        return len(algo_names)
+
+
+algo_names = ["PPO", "DDPG", "A2C", "TD3", "SAC"]
+
+algos = LazyAlgos()
@@ -0,0 +1,35 @@
+import os
+import json
+
+import numpy as np
+
+
+def _tmp_path(path, extension=""):
+    # Unique per process, so that concurrent writers of the same file don't write in the same temporary file
+    return f"{path}.{os.getpid()}.tmp{extension}"
+
+
+def atomic_write_json(path, content, **kwargs):
+    """
+    Write a JSON file next to its final path then rename it, so that a reader never sees a partial file and an
+    interruption never corrupts the previous one
+    :param path: (str) path of the file
+    :param content: the JSON serializable content
+    :param kwargs: arguments of json.dump
+    """
+    tmp_path = _tmp_path(path)
+    with open(tmp_path, "w") as file:
+        json.dump(content, file, **kwargs)
+    os.replace(tmp_path, path)
+
+
+def atomic_savez(path, **arrays):
+    """
+    Same as atomic_write_json for a .npz file of arrays written by np.savez. The temporary files end with .tmp.npz.
+    :param path: (str) path of the file, ending with .npz
+    :param arrays: (np.ndarray) arrays saved by name
+    """
+    # np.savez adds the .npz extension to the paths not ending with it
+    tmp_path = _tmp_path(path, ".npz")
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
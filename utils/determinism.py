@@ -0,0 +1,126 @@
+import argparse
+
+import numpy as np
+
+from game.game_env import spawn_seed_sequences, projection_modes, observation_size
+from game.batched_game_env import BatchedGameEnv, batched_bot_behaviors
+from utils.vec_env import make_env_fn, make_vec_env
+
+
+def random_actions(n_envs, nb_steps, seed=0):
+    """
+    Draw the float actions played in every game, so that all the runs compared play the same ones
+    :param n_envs: (int) Number of games
+    :param nb_steps: (int) Number of steps
+    :param seed: (int) Random seed of the actions
+    :return actions: (np.ndarray) (nb_steps, n_envs, 4) actions
+    """
+    return np.random.default_rng(seed).uniform(0, 7, size=(nb_steps, n_envs, 4))
+
+
+def play_serial(bot_behavior, fights_per_game, actions, seed, projection="random"):
+    """
+    Reference run : play the games one after the other, game i being reset with the i-th child of the seed
+    :param bot_behavior: (str) the bot_behavior (i.e. its action policy)
+    :param fights_per_game: (int) the number of fights per game
+    :param actions: (np.ndarray) (nb_steps, n_envs, 4) actions of the games
+    :param seed: (int) the seed of the games
+    :param projection: (str) reduction of the actions exceeding the golds of the player, see project_actions
+    :return observations, rewards, dones: (np.ndarray) (nb_steps + 1, n_envs, nb_fields), (nb_steps, n_envs) and
+    (nb_steps, n_envs) arrays, with the observations of the reset games after the last step of a game
+    """
+    nb_steps, n_envs = actions.shape[:2]
+    observations = np.zeros((nb_steps + 1, n_envs, observation_size(fights_per_game)), dtype=np.int64)
+    rewards = np.zeros((nb_steps, n_envs))
+    dones = np.zeros((nb_steps, n_envs), dtype=bool)
+    for i, game_seed in enumerate(spawn_seed_sequences(seed, n_envs)):
+        env = make_env_fn(bot_behavior, fights_per_game, projection)()
+        observations[0, i], info = env.reset(seed=game_seed)
+        for t in range(nb_steps):
+            observation, rewards[t, i], dones[t, i], truncated, info = env.step(actions[t, i].copy())
+            if dones[t, i]:
+                observation, info = env.reset()
+            observations[t + 1, i] = observation
+    return observations, rewards, dones
+
+
+def play_vec_env(vec_env, actions):
+    """
+    Play the same games on a vectorized environment, already seeded
+    :param vec_env: (VecEnv) the vectorized environment
+    :param actions: (np.ndarray) (nb_steps, n_envs, 4) actions of the games
+    :return observations, rewards, dones: see play_serial
+    """
+    observations, rewards, dones = [vec_env.reset().copy()], [], []
+    for step_actions in actions:
+        observation, reward, done, infos = vec_env.step(step_actions.copy())
+        # The arrays of some backends are overwritten by the next steps
+        observations.append(observation.copy())
+        rewards.append(reward.copy())
+        dones.append(done.copy())
+    vec_env.close()
+    return np.stack(observations), np.stack(rewards), np.stack(dones)
+
+
+def check_determinism(bot_behavior, fights_per_game, n_envs, nb_steps, seed=0, backends=None, n_workers=None,
+                      projection="random", verbose=True):
+    """
+    Check that the batched and parallel environments reproduce exactly the serial run of the same games
+    :param bot_behavior: (str) the bot_behavior (i.e. its action policy)
+    :param fights_per_game: (int) the number of fights per game
+    :param n_envs: (int) the number of games
+    :param nb_steps: (int) the number of steps played in each game
+    :param seed: (int) the seed of the games
+    :param backends: ([str]) the runs compared to the serial one, among 'serial' (a second serial run), 'batched'
+    (BatchedGameEnv) and the backends of make_vec_env. Defaults to all of them
+    :param n_workers: (int) number of worker processes of the 'shm' backend
+    :param projection: (str) reduction of the actions exceeding the golds of the player, see project_actions
+    :param verbose: (bool) whether to print the result of each run
+    :return results: (dict) True for each backend reproducing the serial run
+    """
+    backends = backends or ["serial", "batched", "dummy", "subproc", "shm"]
+    actions = random_actions(n_envs, nb_steps, seed)
+    reference = play_serial(bot_behavior, fights_per_game, actions, seed, projection)
+
+    results = {}
+    for backend in backends:
+        if backend == "serial":
+            run = play_serial(bot_behavior, fights_per_game, actions, seed, projection)
+        elif backend == "batched":
+            if bot_behavior not in batched_bot_behaviors:
+                continue
+            run = play_vec_env(BatchedGameEnv(n_envs, bot_behavior, fights_per_game, seed=seed,
+                                              projection=projection), actions)
+        else:
+            run = play_vec_env(make_vec_env(bot_behavior, fights_per_game, n_envs, backend, n_workers, seed=seed,
+                                            projection=projection), actions)
+        results[backend] = all(np.array_equal(ref_array, run_array) for ref_array, run_array in zip(reference, run))
+        if verbose:
+            print(f"{backend:>8} : {'identical to' if results[backend] else 'DIFFERENT from'} the serial run")
+    return results
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--bot_behavior", type=str, nargs="+", required=False, default=batched_bot_behaviors)
+    parser.add_argument('--fights_per_game', type=int, required=False, default=2)
+    parser.add_argument('--n_envs', type=int, required=False, default=8)
+    parser.add_argument('--nb_steps', type=int, required=False, default=100)
+    parser.add_argument('--seed', type=int, required=False, default=0)
+    parser.add_argument('--backends', type=str, nargs="+", required=False, default=None)
+    parser.add_argument('--n_workers', type=int, required=False, default=2)
+    parser.add_argument('--projection', type=str, required=False, default="random", choices=projection_modes)
+
+    args = parser.parse_args()
+
+    all_identical = True
+    for bot_behavior in args.bot_behavior:
+        print(f"\n{bot_behavior} bot, {args.n_envs} games of {args.nb_steps} steps")
+        results = check_determinism(bot_behavior, args.fights_per_game, args.n_envs, args.nb_steps, args.seed,
+                                    args.backends, args.n_workers, args.projection)
+        all_identical &= all(results.values())
+
+    if not all_identical:
+        raise SystemExit(1)
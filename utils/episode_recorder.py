@@ -0,0 +1,195 @@
+import os
+import json
+import glob
+
+import numpy as np
+
+from game.game_env import observation_size
+from utils.atomic_write import atomic_write_json
+
+
+def transition_dtype(fights_per_game):
+    """
+    Fixed-width record of a transition of a game : the episode it belongs to, the observations of both players
+    before the fight, the golds they used on each game action, the player getting each action (0 : none, 1 : the
+    player, 2 : the bot player), the reward of the player, its next observation and whether the game is over
+    :param fights_per_game: (int) Number of fights per game
+    :return dtype: (np.dtype) the packed structured dtype of the transitions
+    """
+    observation = (np.int16, (observation_size(fights_per_game),))
+    return np.dtype([("episode", np.int64),
+                     ("observation", observation),
+                     ("bot_observation", observation),
+                     ("action", np.int8, (4,)),
+                     ("bot_action", np.int8, (4,)),
+                     ("assignment", np.int8, (4,)),
+                     ("reward", np.float32),
+                     ("next_observation", observation),
+                     ("done", np.bool_)])
+
+
+class EpisodeRecorder:
+    """
+    Opt-in recorder of the transitions played in a GameEnv (see its recorder argument) or given in batches.
+
+    The transitions are buffered in a preallocated structured array, then appended to raw shard files of at most
+    shard_size fixed-width records (<name>_<shard>.bin) when the buffer is full or the recorder is flushed. The
+    small JSON index <name>.index.json lists the shards and their number of records, and is rewritten after the
+    records it lists are on the disk : a shard is never read past its indexed length, so the dataset stays
+    consistent if the process is interrupted. Several recorders (e.g. one per process) write in the same
+    directory under different names, and a recorder reopened with the same name appends to its shards.
+    """
+
+    def __init__(self, directory, fights_per_game=2, shard_size=1000000, buffer_size=65536, name="transitions",
+                 first_episode=0):
+        """
+        :param directory: (str) directory of the dataset
+        :param fights_per_game: (int) Number of fights per game
+        :param shard_size: (int) maximum number of transitions per shard
+        :param buffer_size: (int) number of transitions kept in memory before being written
+        :param name: (str) name of the recorder, prefix of its shards and of its index
+        :param first_episode: (int) number of the first episode recorded, when reopened the one after the last
+        """
+        self.directory = directory
+        self.name = name
+        self.dtype = transition_dtype(fights_per_game)
+        self.shard_size = shard_size
+        self.index_path = os.path.join(directory, f"{name}.index.json")
+        os.makedirs(directory, exist_ok=True)
+
+        self.index = {"fights_per_game": fights_per_game, "dtype": self.dtype.descr, "shard_size": shard_size,
+                      "nb_episodes": first_episode, "shards": []}
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as file:
+                self.index = json.load(file)
+            if self.index["fights_per_game"] != fights_per_game:
+                raise(ValueError(f"The dataset {self.index_path} has {self.index['fights_per_game']} fights per game"))
+            # Records written after the last update of the index are dropped
+            for shard in self.index["shards"]:
+                with open(os.path.join(directory, shard["file"]), "r+b") as file:
+                    file.truncate(shard["nb_transitions"] * self.dtype.itemsize)
+        self.next_episode = self.index["nb_episodes"]
+
+        self._buffer = np.zeros(buffer_size, dtype=self.dtype)
+        self._nb_buffered = 0
+
+    def new_episodes(self, nb_episodes=1):
+        """
+        Numbers of new episodes, to be given with their transitions
+        :return episodes: (np.ndarray) the numbers of the episodes
+        """
+        episodes = np.arange(self.next_episode, self.next_episode + nb_episodes)
+        self.next_episode += nb_episodes
+        return episodes
+
+    def add(self, episode, observation, bot_observation, action, bot_action, assignment, reward, next_observation,
+            done):
+        """
+        Add a transition, or a batch of transitions whose fields are arrays with the transitions along their first axis
+        (see transition_dtype for the fields)
+        """
+        nb_transitions = len(np.atleast_1d(episode))
+        fields = {"episode": episode, "observation": observation, "bot_observation": bot_observation,
+                  "action": action, "bot_action": bot_action, "assignment": assignment, "reward": reward,
+                  "next_observation": next_observation, "done": done}
+        start = 0
+        while start < nb_transitions:
+            count = min(nb_transitions - start, len(self._buffer) - self._nb_buffered)
+            records = self._buffer[self._nb_buffered:self._nb_buffered + count]
+            for field, values in fields.items():
+                values = np.asarray(values)
+                records[field] = values[start:start + count] if values.ndim == self.dtype[field].ndim + 1 else values
+            self._nb_buffered += count
+            start += count
+            if self._nb_buffered == len(self._buffer):
+                self.flush()
+
+    def flush(self):
+        """
+        Append the buffered transitions to the shards, then update the index
+        """
+        start = 0
+        while start < self._nb_buffered:
+            shards = self.index["shards"]
+            if not shards or shards[-1]["nb_transitions"] >= self.shard_size:
+                shards.append({"file": f"{self.name}_{len(shards):05d}.bin", "nb_transitions": 0})
+            count = min(self._nb_buffered - start, self.shard_size - shards[-1]["nb_transitions"])
+            # A new shard overwrites the file left by a recorder interrupted before writing its index
+            mode = "ab" if shards[-1]["nb_transitions"] else "wb"
+            with open(os.path.join(self.directory, shards[-1]["file"]), mode) as file:
+                self._buffer[start:start + count].tofile(file)
+            shards[-1]["nb_transitions"] += count
+            start += count
+        self._nb_buffered = 0
+        self.index["nb_episodes"] = self.next_episode
+        atomic_write_json(self.index_path, self.index)
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ReplayDataset:
+    """
+    Transitions recorded by the EpisodeRecorders of a directory, read from their shards memory-mapped.
+
+    Nothing but the indices is read when the dataset is opened : the records are read from the page cache when
+    they are accessed, so that minibatches can be sampled from datasets much larger than the memory.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.shards = []
+        self.fights_per_game = None
+        for index_path in sorted(glob.glob(os.path.join(directory, "*.index.json"))):
+            with open(index_path) as file:
+                index = json.load(file)
+            if self.fights_per_game not in (None, index["fights_per_game"]):
+                raise(ValueError(f"The recorders of {directory} have different numbers of fights per game"))
+            self.fights_per_game = index["fights_per_game"]
+            self.dtype = np.dtype([tuple(field) for field in index["dtype"]])
+            for shard in index["shards"]:
+                if shard["nb_transitions"]:
+                    self.shards.append(np.memmap(os.path.join(directory, shard["file"]), dtype=self.dtype, mode="r",
+                                                 shape=(shard["nb_transitions"],)))
+        if not self.shards:
+            raise(ValueError(f"No transition recorded in {directory}"))
+        # Index of the first transition of each shard, and total number of transitions
+        self.offsets = np.cumsum([0] + [len(shard) for shard in self.shards])
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def __getitem__(self, indices):
+        """
+        :param indices: (np.ndarray or int) indices of transitions in the dataset, negative ones counting from the end
+        :return transitions: (np.ndarray) copy of the transitions, with the structured dtype of the dataset
+        """
+        indices = np.asarray(indices)
+        scalar = indices.ndim == 0
+        indices = np.atleast_1d(indices)
+        out_of_range = (indices < -len(self)) | (indices >= len(self))
+        if out_of_range.any():
+            raise(IndexError(f"Index {indices[out_of_range][0]} out of range for a dataset of {len(self)} transitions"))
+        indices = np.where(indices < 0, indices + len(self), indices)
+        shard_ids = np.searchsorted(self.offsets, indices, side="right") - 1
+        transitions = np.empty(len(indices), dtype=self.dtype)
+        for shard_id in np.unique(shard_ids):
+            selected = shard_ids == shard_id
+            transitions[selected] = self.shards[shard_id][indices[selected] - self.offsets[shard_id]]
+        return transitions[0] if scalar else transitions
+
+    def sample(self, batch_size, rng=None):
+        """
+        Minibatch of transitions drawn uniformly with replacement
+        :param batch_size: (int) number of transitions
+        :param rng: (np.random.Generator) generator of the draws
+        :return transitions: (np.ndarray) the transitions, with the structured dtype of the dataset
+        """
+        rng = rng if rng is not None else np.random.default_rng()
+        return self[rng.integers(0, len(self), batch_size)]
@@ -0,0 +1,226 @@
+import os
+import struct
+import hashlib
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from utils.atomic_write import atomic_savez
+
+# Field numbers of the protobuf messages of the TensorBoard event files (tensorflow/core/util/event.proto,
+# tensorflow/core/framework/summary.proto and tensor.proto)
+EVENT_STEP, EVENT_SUMMARY = 2, 5
+SUMMARY_VALUE = 1
+VALUE_TAG, VALUE_SIMPLE_VALUE, VALUE_TENSOR = 1, 2, 8
+TENSOR_DTYPE, TENSOR_CONTENT, TENSOR_FLOAT_VAL, TENSOR_DOUBLE_VAL = 1, 4, 5, 6
+DT_FLOAT, DT_DOUBLE = 1, 2
+
+WIRE_VARINT, WIRE_FIXED64, WIRE_BYTES, WIRE_FIXED32 = 0, 1, 2, 5
+
+cache_version = 1
+
+
+def _read_varint(buffer, pos):
+    result = shift = 0
+    while True:
+        byte = buffer[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _iter_fields(buffer):
+    """
+    Iterate over the fields of a serialized protobuf message
+    :return: (int, int, int or bytes) field number, wire type and value (a memoryview for the bytes fields)
+    """
+    pos, end = 0, len(buffer)
+    while pos < end:
+        key, pos = _read_varint(buffer, pos)
+        field, wire_type = key >> 3, key & 7
+        if wire_type == WIRE_VARINT:
+            value, pos = _read_varint(buffer, pos)
+        elif wire_type == WIRE_FIXED64:
+            value, pos = buffer[pos:pos + 8], pos + 8
+        elif wire_type == WIRE_BYTES:
+            length, pos = _read_varint(buffer, pos)
+            value, pos = buffer[pos:pos + length], pos + length
+        elif wire_type == WIRE_FIXED32:
+            value, pos = buffer[pos:pos + 4], pos + 4
+        else:
+            raise(ValueError(f"Unsupported protobuf wire type {wire_type}"))
+        yield field, wire_type, value
+
+
+def _tensor_scalar(buffer):
+    """
+    Value of a scalar float TensorProto, as written by the summaries of TensorFlow 2
+    """
+    dtype = DT_FLOAT
+    for field, wire_type, value in _iter_fields(buffer):
+        if field == TENSOR_DTYPE:
+            dtype = value
+        elif field == TENSOR_CONTENT:
+            return struct.unpack("<f" if dtype == DT_FLOAT else "<d", value[:4 if dtype == DT_FLOAT else 8])[0]
+        elif field == TENSOR_FLOAT_VAL:
+            return struct.unpack("<f", value[:4])[0]
+        elif field == TENSOR_DOUBLE_VAL:
+            return struct.unpack("<d", value[:8])[0]
+    return None
+
+
+def iter_records(path, offset=0):
+    """
+    Iterate over the records of a TFRecord file, streaming it from the disk. The CRCs are not checked, and a
+    truncated last record (file being written) is ignored
+    :param path: (str) path of the file
+    :param offset: (int) position in the file of the first record to read
+    :return: (bytes, int) the serialized records, and the position of the end of each of them
+    """
+    with open(path, "rb") as file:
+        file.seek(offset)
+        while True:
+            header = file.read(12)
+            if len(header) < 12:
+                return
+            length, = struct.unpack("<Q", header[:8])
+            data = file.read(length + 4)
+            if len(data) < length + 4:
+                return
+            offset += 12 + length + 4
+            yield data[:length], offset
+
+
+def read_event_file(path, tags, offset=0):
+    """
+    Read the scalars of some tags in a TensorBoard event file
+    :param path: (str) path of the event file
+    :param tags: ([str]) tags to read (e.g. 'rollout/ep_rew_mean'), the values of the other ones aren't decoded
+    :param offset: (int) position in the file of the first event to read, to read only the events appended
+        since a previous read
+    :return scalars, end: (dict, int) tag -> (steps, values), (np.ndarray, np.ndarray) in the order of the file,
+        and the position of the end of the last event read
+    """
+    encoded_tags = {tag.encode(): tag for tag in tags}
+    steps, values = {tag: [] for tag in tags}, {tag: [] for tag in tags}
+    end = offset
+    for record, end in iter_records(path, offset):
+        # Most events hold other tags, skipped without decoding them
+        if not any(tag in record for tag in encoded_tags):
+            continue
+        record = memoryview(record)
+        step, summaries = 0, []
+        for field, wire_type, value in _iter_fields(record):
+            if field == EVENT_STEP:
+                step = value
+            elif field == EVENT_SUMMARY:
+                summaries.append(value)
+        for summary in summaries:
+            for field, wire_type, summary_value in _iter_fields(summary):
+                if field != SUMMARY_VALUE:
+                    continue
+                tag, scalar = None, None
+                for value_field, value_wire_type, value in _iter_fields(summary_value):
+                    if value_field == VALUE_TAG:
+                        tag = encoded_tags.get(bytes(value))
+                        if tag is None:
+                            break
+                    elif value_field == VALUE_SIMPLE_VALUE:
+                        scalar = struct.unpack("<f", value)[0]
+                    elif value_field == VALUE_TENSOR:
+                        scalar = _tensor_scalar(value)
+                if tag is not None and scalar is not None:
+                    steps[tag].append(step)
+                    values[tag].append(scalar)
+    scalars = {tag: (np.array(steps[tag], dtype=np.int64), np.array(values[tag], dtype=np.float64)) for tag in tags}
+    return scalars, end
+
+
+def _cache_path(cache_dir, path, tag):
+    key = hashlib.sha1(f"{os.path.abspath(path)}\n{tag}".encode()).hexdigest()
+    return os.path.join(cache_dir, f"{key}.npz")
+
+
+def read_event_file_cached(path, tags, cache_dir=None):
+    """
+    Same as read_event_file, but the series are cached in a npz file per event file and tag (steps and values
+    columns). The cache is reused as long as the modification time and size of the event file don't change,
+    and when the file grew (training still running) only the events appended since are parsed
+    :param cache_dir: (str) directory of the cache, no cache if None
+    :return scalars: (dict) tag -> (steps, values), (np.ndarray, np.ndarray)
+    """
+    if cache_dir is None:
+        return read_event_file(path, tags)[0]
+
+    stat = os.stat(path)
+    signature = np.array([cache_version, stat.st_mtime_ns, stat.st_size], dtype=np.int64)
+    # Position from which each tag must be parsed, the ones up to date in the cache having none
+    scalars, offsets = {}, {}
+    for tag in tags:
+        scalars[tag], offsets[tag] = (np.zeros(0, dtype=np.int64), np.zeros(0)), 0
+        try:
+            with np.load(_cache_path(cache_dir, path, tag)) as cached:
+                if np.array_equal(cached["signature"], signature):
+                    scalars[tag] = (cached["steps"], cached["values"])
+                    del offsets[tag]
+                # Event files are only appended to, the events already parsed are kept
+                elif cached["signature"][0] == cache_version and cached["signature"][2] <= stat.st_size:
+                    scalars[tag], offsets[tag] = (cached["steps"], cached["values"]), int(cached["offset"])
+        except (OSError, KeyError, ValueError):
+            pass
+
+    if offsets:
+        os.makedirs(cache_dir, exist_ok=True)
+    for offset in sorted(set(offsets.values())):
+        offset_tags = [tag for tag, tag_offset in offsets.items() if tag_offset == offset]
+        new_scalars, end = read_event_file(path, offset_tags, offset)
+        for tag, (new_steps, new_values) in new_scalars.items():
+            steps, values = scalars[tag]
+            scalars[tag] = (np.concatenate([steps, new_steps]), np.concatenate([values, new_values]))
+            cache_path = _cache_path(cache_dir, path, tag)
+            atomic_savez(cache_path, signature=signature, offset=end, steps=scalars[tag][0], values=scalars[tag][1])
+    return scalars
+
+
+def read_run(run_dir, tags, cache_dir=None):
+    """
+    Read the scalars of some tags in all the event files of a run directory (one per training, e.g.
+    logs/2_fights_per_game_vs_random/PPO_100k_steps_seed_0_1), sorted by step
+    :param run_dir: (str) the run directory
+    :param tags: ([str]) tags to read
+    :param cache_dir: (str) directory of the cache, no cache if None
+    :return scalars: (dict) tag -> (steps, values), (np.ndarray, np.ndarray)
+    """
+    files = sorted(os.path.join(run_dir, file) for file in os.listdir(run_dir) if ".tfevents." in file)
+    parts = {tag: [] for tag in tags}
+    for path in files:
+        for tag, series in read_event_file_cached(path, tags, cache_dir).items():
+            parts[tag].append(series)
+
+    scalars = {}
+    for tag in tags:
+        steps = np.concatenate([steps for steps, values in parts[tag]] or [np.zeros(0, dtype=np.int64)])
+        values = np.concatenate([values for steps, values in parts[tag]] or [np.zeros(0)])
+        order = np.argsort(steps, kind="stable")
+        scalars[tag] = (steps[order], values[order])
+    return scalars
+
+
+def read_runs(run_dirs, tags, cache_dir=None, n_workers=None):
+    """
+    Read several run directories, in parallel on a pool of processes when there are more than one
+    :param run_dirs: ([str]) the run directories
+    :param n_workers: (int) number of processes, defaults to the number of cpus (no pool if 1)
+    :return scalars: (dict) run directory -> the scalars of read_run
+    """
+    n_workers = min(n_workers or os.cpu_count(), len(run_dirs))
+    if n_workers <= 1:
+        return {run_dir: read_run(run_dir, tags, cache_dir) for run_dir in run_dirs}
+
+    start_method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+    with ProcessPoolExecutor(max_workers=n_workers, mp_context=mp.get_context(start_method)) as executor:
+        results = executor.map(read_run, run_dirs, [tags] * len(run_dirs), [cache_dir] * len(run_dirs))
+        return dict(zip(run_dirs, results))
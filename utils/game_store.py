@@ -0,0 +1,313 @@
+import os
+import time
+import fcntl
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+from game.game_env import GameEnv
+from play_vs_bot import initialize_players
+
+
+game_store_backends = ["memory", "disk"]
+
+
+class GameSession:
+    """
+    Game of a player of the web application, with its own GameEnv and players.
+
+    The parameters chosen by the player are kept between games, so that a rematch starts a new game with them.
+    When pickled (by the disk store), only the parameters and the statistics and random states of the game are
+    saved, and the env and players are rebuilt from them when loaded.
+    """
+
+    def __init__(self, player_name, bot_behavior, fights_per_game=2, trained_player_kwargs=None):
+        self.player_name = player_name
+        self.bot_behavior = bot_behavior
+        self.fights_per_game = fights_per_game
+        self.trained_player_kwargs = trained_player_kwargs or {}
+        self.game_initialized = False
+        # Fight being played in the background, and changes made by the last fight (see the API of app.py)
+        self.pending = False
+        self.last_step = None
+        self.env = None
+
+    @property
+    def player(self):
+        return self.env.player
+
+    @property
+    def bot_player(self):
+        return self.env.bot_player
+
+    def player_state(self, player):
+        """
+        JSON serializable statistics of a player
+        """
+        return {"name": player.name,
+                "golds": int(player.golds),
+                "force_per_fights": player.force_per_fights.tolist(),
+                "nb_ronins": int(player.nb_ronins),
+                "nb_points": int(player.nb_points)}
+
+    def state(self):
+        """
+        JSON serializable state of the game, as displayed by the web interface
+        """
+        return {"fight_nb": int(self.env.fight_nb),
+                "fights_per_game": self.fights_per_game,
+                "game_over": not self.game_initialized,
+                "player": self.player_state(self.player),
+                "bot_player": self.player_state(self.bot_player)}
+
+    def step(self, action):
+        """
+        Play a fight of the game
+        :param action: ([int]) golds used by the player on each game action
+        :return diff: (dict) the fields of the state changed by the fight, and the reward of the player
+        """
+        before = self.state()
+        obs, reward, done, truncated, info = self.env.step(np.array(action))
+        if done or truncated:
+            self.game_initialized = False
+        after = self.state()
+
+        diff = {key: value for key, value in after.items() if key not in ("player", "bot_player") and value != before[key]}
+        for player in ("player", "bot_player"):
+            changes = {key: value for key, value in after[player].items() if value != before[player][key]}
+            if changes:
+                diff[player] = changes
+        diff["reward"] = float(reward)
+        return diff
+
+    def new_game(self, seed=None):
+        """
+        Initialize two players and an instance of the game environment
+        :param seed: (int) random seed of the game
+        """
+        player, bot_player = initialize_players(self.player_name, self.bot_behavior, self.fights_per_game,
+                                                **self.trained_player_kwargs)
+        self.env = GameEnv(player=player, bot_player=bot_player, fights_per_game=self.fights_per_game, verbose=False)
+        self.env.reset(seed=seed)
+
+    def __getstate__(self):
+        state = {"player_name": self.player_name, "bot_behavior": self.bot_behavior,
+                 "fights_per_game": self.fights_per_game, "trained_player_kwargs": self.trained_player_kwargs,
+                 "game_initialized": self.game_initialized, "pending": self.pending, "last_step": self.last_step,
+                 "game": None}
+        if self.env is not None:
+            state["game"] = {"fight_nb": self.env.fight_nb,
+                             "death_per_fights": self.env.death_per_fights,
+                             "player_gold": self.env.player_gold,
+                             "rng": self.env.np_random.bit_generator.state,
+                             "players": [(player._state, player.rng.bit_generator.state)
+                                         for player in (self.player, self.bot_player)]}
+        return state
+
+    def __setstate__(self, state):
+        game = state.pop("game")
+        self.__dict__.update(state)
+        self.env = None
+        if game is not None:
+            self.new_game()
+            self.env.fight_nb = game["fight_nb"]
+            self.env.death_per_fights = game["death_per_fights"]
+            self.env.player_gold = game["player_gold"]
+            self.env.np_random.bit_generator.state = game["rng"]
+            for player, (player_state, rng_state) in zip((self.player, self.bot_player), game["players"]):
+                player._state[:] = player_state
+                player.rng.bit_generator.state = rng_state
+
+
+class MemoryGameStore:
+    """
+    In-process store of the game sessions, for a single worker process serving requests with several threads.
+
+    The sessions are kept in a LRU dict of at most max_sessions entries, and the ones unused for more than ttl
+    seconds are evicted. Each session has its own lock, so that only the requests of the same session wait
+    for each other. The locks are counted by the requests holding or waiting for them, and dropped by the last
+    one, so that there is at most one lock per session and only for the sessions of the requests in progress.
+    """
+
+    def __init__(self, max_sessions=1024, ttl=3600):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.sessions = OrderedDict()
+        # Lock of each session and number of requests holding or waiting for it
+        self.locks = {}
+        self.store_lock = threading.Lock()
+        self.last_eviction = time.monotonic()
+
+    @contextmanager
+    def lock(self, session_id):
+        """
+        Hold the lock of a session, while its game is read, played and written back
+        """
+        with self.store_lock:
+            session_lock, nb_users = self.locks.get(session_id, (None, 0))
+            session_lock = session_lock or threading.Lock()
+            self.locks[session_id] = (session_lock, nb_users + 1)
+        try:
+            with session_lock:
+                yield
+        finally:
+            with self.store_lock:
+                session_lock, nb_users = self.locks[session_id]
+                if nb_users == 1:
+                    del self.locks[session_id]
+                else:
+                    self.locks[session_id] = (session_lock, nb_users - 1)
+
+    def get(self, session_id):
+        """
+        Returns the game session, or None if it doesn't exist or expired
+        """
+        with self.store_lock:
+            entry = self.sessions.get(session_id)
+            if entry is None:
+                return None
+            last_access, game = entry
+            if time.monotonic() - last_access > self.ttl:
+                self._delete(session_id)
+                return None
+            self.sessions.move_to_end(session_id)
+            return game
+
+    def set(self, session_id, game):
+        with self.store_lock:
+            self.sessions[session_id] = (time.monotonic(), game)
+            self.sessions.move_to_end(session_id)
+            while len(self.sessions) > self.max_sessions:
+                self._delete(next(iter(self.sessions)))
+            if time.monotonic() - self.last_eviction > self.ttl / 10:
+                self._evict_expired()
+
+    def delete(self, session_id):
+        with self.store_lock:
+            self._delete(session_id)
+
+    def _delete(self, session_id):
+        self.sessions.pop(session_id, None)
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        self.last_eviction = now
+        # The sessions are ordered from the least to the most recently used
+        while self.sessions:
+            session_id, (last_access, game) = next(iter(self.sessions.items()))
+            if now - last_access <= self.ttl:
+                break
+            self._delete(session_id)
+
+
+class DiskGameStore:
+    """
+    Store of the game sessions in a local directory, shared by all the worker processes of a WSGI server.
+
+    Each session is pickled in its own file, written atomically, and protected by a file lock held while its
+    game is played. The sessions whose file has not been modified for more than ttl seconds are evicted, as well
+    as the least recently used ones beyond max_sessions.
+    """
+
+    def __init__(self, directory=None, max_sessions=100000, ttl=3600):
+        self.directory = directory or os.path.join(tempfile.gettempdir(), "rising_sun_games")
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.last_eviction = time.monotonic()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, session_id, extension):
+        # Session ids come from cookies, they can't be trusted to be file names
+        if not session_id.isalnum():
+            raise(ValueError(f"Invalid session id {session_id!r}"))
+        return os.path.join(self.directory, f"{session_id}.{extension}")
+
+    @contextmanager
+    def lock(self, session_id):
+        """
+        Hold the lock of a session, across threads and processes, while its game is read, played and written back
+        """
+        with open(self._path(session_id, "lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def get(self, session_id):
+        """
+        Returns the game session, or None if it doesn't exist or expired
+        """
+        path = self._path(session_id, "pkl")
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                self.delete(session_id)
+                return None
+            with open(path, "rb") as file:
+                return pickle.load(file)
+        except FileNotFoundError:
+            return None
+
+    def set(self, session_id, game):
+        path = self._path(session_id, "pkl")
+        with tempfile.NamedTemporaryFile(dir=self.directory, suffix=".tmp", delete=False) as file:
+            pickle.dump(game, file)
+        os.replace(file.name, path)
+        if time.monotonic() - self.last_eviction > self.ttl / 10:
+            self.evict_expired()
+
+    def delete(self, session_id):
+        # The lock file is kept, as other requests of the session may be waiting for it
+        try:
+            os.remove(self._path(session_id, "pkl"))
+        except FileNotFoundError:
+            pass
+
+    def evict_expired(self):
+        """
+        Remove the expired sessions, and the least recently used ones beyond max_sessions
+        """
+        self.last_eviction = time.monotonic()
+        sessions = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".pkl"):
+                try:
+                    sessions.append((entry.stat().st_mtime, entry.name[:-len(".pkl")]))
+                except FileNotFoundError:
+                    pass
+        sessions.sort(reverse=True)
+        now = time.time()
+        for rank, (last_access, session_id) in enumerate(sessions):
+            if rank >= self.max_sessions or now - last_access > self.ttl:
+                self.delete(session_id)
+        # Lock files of sessions without game, unused for more than ttl seconds
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".lock") and not os.path.exists(entry.path[:-len(".lock")] + ".pkl"):
+                try:
+                    if now - entry.stat().st_mtime > self.ttl:
+                        os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+
+def make_game_store(backend="memory", directory=None, max_sessions=None, ttl=3600):
+    """
+    Create the store of the game sessions of the web application
+    :param backend: (str) 'memory' (in-process LRU, for a single worker process) or 'disk' (shared by all workers)
+    :param directory: (str) directory of the 'disk' store
+    :param max_sessions: (int) maximum number of sessions kept, defaults to the one of the backend
+    :param ttl: (float) seconds after which an unused session is evicted
+    :return store: (MemoryGameStore or DiskGameStore) the store
+    """
+    kwargs = {"ttl": ttl}
+    if max_sessions is not None:
+        kwargs["max_sessions"] = max_sessions
+    if backend == "memory":
+        return MemoryGameStore(**kwargs)
+    elif backend == "disk":
+        return DiskGameStore(directory, **kwargs)
+    raise(ValueError(f"Unknown game store backend {backend}, choose among {game_store_backends}"))
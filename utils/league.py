@@ -0,0 +1,117 @@
+from collections import deque
+
+import numpy as np
+from stable_baselines3.common.callbacks import BaseCallback
+
+from game.batched_game_env import batched_bot_behaviors, PLAYER, BOT
+
+
+def snapshot_policy(policy):
+    """
+    Frozen copy of a stable-baselines3 policy on the CPU, whose weights don't follow the training anymore
+    :param policy: (BasePolicy) the policy of a model being trained
+    :return snapshot: (BasePolicy) the copy, in evaluation mode
+    """
+    snapshot = policy.__class__(**policy._get_constructor_parameters())
+    snapshot.load_state_dict(policy.state_dict())
+    snapshot.set_training_mode(False)
+    for parameter in snapshot.parameters():
+        parameter.requires_grad_(False)
+    return snapshot
+
+
+class League:
+    """
+    Pool of opponents of a self-play training : scripted bots, and frozen snapshots of the policy being trained.
+
+    Only the max_snapshots most recent snapshots are kept. Each game draws a scripted bot with probability
+    bots_probability (a snapshot otherwise, or a bot as long as there is no snapshot), uniformly among them.
+    """
+
+    def __init__(self, bot_behaviors=batched_bot_behaviors, max_snapshots=10, bots_probability=0.2):
+        self.bot_behaviors = list(bot_behaviors)
+        self.snapshots = deque(maxlen=max_snapshots)
+        self.bots_probability = bots_probability
+
+    def add_snapshot(self, policy, name):
+        """
+        Add a frozen copy of a policy to the league, removing the oldest snapshot if it is full
+        :param policy: (BasePolicy) the policy of the model being trained
+        :param name: (str) name of the snapshot (e.g. its number of training steps)
+        """
+        self.snapshots.append((name, snapshot_policy(policy)))
+
+    @property
+    def opponents(self):
+        """
+        Opponents of the league, as given to BatchedGameEnv.set_opponents : the bot behaviors then the snapshots
+        """
+        return self.bot_behaviors + [policy for name, policy in self.snapshots]
+
+    @property
+    def opponent_names(self):
+        return self.bot_behaviors + [name for name, policy in self.snapshots]
+
+    def probabilities(self):
+        """
+        :return probabilities: (np.ndarray) probability of drawing each opponent of the league
+        """
+        nb_bots, nb_snapshots = len(self.bot_behaviors), len(self.snapshots)
+        if not nb_snapshots or not nb_bots:
+            return np.full(nb_bots + nb_snapshots, 1 / (nb_bots + nb_snapshots))
+        return np.concatenate([np.full(nb_bots, self.bots_probability / nb_bots),
+                               np.full(nb_snapshots, (1 - self.bots_probability) / nb_snapshots)])
+
+
+class SelfPlayCallback(BaseCallback):
+    """
+    Callback of a self-play training on a BatchedGameEnv : the policy being trained is added to the league
+    at the start of the training and every snapshot_interval steps, and the opponents of the env are updated
+    with it. The win rates of the player against the bots and against the snapshots are logged at the end of
+    each rollout (self_play/win_rate_vs_bots and self_play/win_rate_vs_snapshots).
+    """
+
+    def __init__(self, env, league, snapshot_interval=10000, seed=None, verbose=0):
+        """
+        :param env: (BatchedGameEnv) the env of the training, without its wrappers
+        :param league: (League) the league of opponents
+        :param snapshot_interval: (int) number of training steps between two snapshots
+        :param seed: (int) seed of the draws of the opponents
+        """
+        super().__init__(verbose)
+        self.env = env
+        self.league = league
+        self.snapshot_interval = snapshot_interval
+        self.seed = seed
+        self.last_snapshot_step = 0
+        self.results = {"bots": [0, 0], "snapshots": [0, 0]}
+
+    def _add_snapshot(self, seed=None):
+        self.league.add_snapshot(self.model.policy, f"{self.num_timesteps}_steps")
+        self.env.set_opponents(self.league.opponents, self.league.probabilities(), seed=seed)
+        self.last_snapshot_step = self.num_timesteps
+        if self.verbose:
+            print(f"Snapshot of the policy at {self.num_timesteps} steps, league : {self.league.opponent_names}")
+
+    def _on_training_start(self):
+        self._add_snapshot(seed=self.seed)
+
+    def _on_step(self):
+        done_games = np.flatnonzero(self.locals["dones"])
+        if len(done_games):
+            points = self.env.episode_nb_points[done_games]
+            wins = points[:, PLAYER] > points[:, BOT]
+            against_bots = self.env.episode_opponent_ids[done_games] < len(self.league.bot_behaviors)
+            for kind, games in (("bots", against_bots), ("snapshots", ~against_bots)):
+                self.results[kind][0] += int(np.sum(wins[games]))
+                self.results[kind][1] += int(np.sum(games))
+
+        if self.num_timesteps - self.last_snapshot_step >= self.snapshot_interval:
+            self._add_snapshot()
+        return True
+
+    def _on_rollout_end(self):
+        for kind, (nb_wins, nb_games) in self.results.items():
+            if nb_games:
+                self.logger.record(f"self_play/win_rate_vs_{kind}", nb_wins / nb_games)
+        self.results = {"bots": [0, 0], "snapshots": [0, 0]}
@@ -0,0 +1,171 @@
+import os
+import io
+import html
+import json
+import base64
+
+import numpy as np
+
+
+def new_figure(nb_rows=1, nb_cols=1, figsize=(15, 5)):
+    """
+    Matplotlib figure which isn't attached to pyplot, so that it is rendered without any GUI backend
+    :return figure, axes: (Figure, Axes or np.ndarray) the figure and its subplots
+    """
+    from matplotlib.figure import Figure
+    figure = Figure(figsize=figsize)
+    return figure, figure.subplots(nb_rows, nb_cols)
+
+
+def save_figure(figure, output, title=None, summary=None):
+    """
+    Save a figure in a PNG file, or in a HTML page embedding it when the output ends with .html
+    :param figure: (Figure) the figure
+    :param output: (str) path of the file
+    :param title: (str) title of the HTML page
+    :param summary: (dict) values displayed in a table under the figure of the HTML page
+    """
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    if not output.endswith(".html"):
+        figure.savefig(output, bbox_inches="tight")
+        return
+
+    image = io.BytesIO()
+    figure.savefig(image, format="png", bbox_inches="tight")
+    rows = "".join(f"<tr><td>{html.escape(str(name))}</td><td>{html.escape(str(value))}</td></tr>"
+                   for name, value in (summary or {}).items())
+    title = html.escape(title or "")
+    with open(output, "w") as file:
+        file.write(f"<!DOCTYPE html>\n<html><head><meta charset='utf-8'><title>{title}</title></head><body>\n"
+                   f"<h1>{title}</h1>\n"
+                   f"<img src='data:image/png;base64,{base64.b64encode(image.getvalue()).decode()}'>\n"
+                   f"<table>{rows}</table>\n</body></html>\n")
+
+
+def downsample(values, max_points=1000):
+    """
+    Evenly spaced points of a curve, always keeping its last one
+    :param values: (np.ndarray) the curve
+    :return indices, values: (np.ndarray, np.ndarray) indices of the kept points and their values
+    """
+    values = np.asarray(values)
+    indices = np.unique(np.linspace(0, len(values) - 1, min(len(values), max_points)).astype(np.int64))
+    return indices, values[indices]
+
+
+class EvaluationReport:
+    """
+    Append-only report of an evaluation, written while the games are played : a JSON line of metadata, then one
+    line per batch of games with its wins, draws, points and rewards per fight. It holds nothing in memory, so
+    that the statistics of evaluations of millions of games can be followed and plotted while they run.
+    """
+
+    def __init__(self, path, **metadata):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as file:
+            file.write(json.dumps({"metadata": metadata}) + "\n")
+
+    def add_batch(self, player_points, bot_points, fight_rewards=None):
+        """
+        Append the results of a batch of games
+        :param player_points: (np.ndarray) final points of the player in each game
+        :param bot_points: (np.ndarray) final points of the bot player in each game
+        :param fight_rewards: (np.ndarray) (nb_games, fights_per_game) rewards of the player at each fight
+        """
+        record = {"nb_games": len(player_points),
+                  "player_wins": int(np.sum(player_points > bot_points)),
+                  "bot_player_wins": int(np.sum(player_points < bot_points)),
+                  "draws": int(np.sum(player_points == bot_points)),
+                  "player_points": float(np.sum(player_points)),
+                  "bot_player_points": float(np.sum(bot_points))}
+        if fight_rewards is not None:
+            record["fight_rewards"] = np.sum(fight_rewards, axis=0).tolist()
+        with open(self.path, "a") as file:
+            file.write(json.dumps(record) + "\n")
+
+
+def read_report(path, max_points=1000):
+    """
+    Read an evaluation report, streaming its lines. The cumulative statistics are kept after every batch at first,
+    then after fewer and fewer of them so that at most 2 * max_points are held whatever the number of batches
+    :param path: (str) path of the report
+    :param max_points: (int) number of points of the curves under which no point is dropped
+    :return metadata, curves, totals: (dict, dict, dict) metadata of the report, cumulative statistics
+        (np.ndarray) after some of the batches, and the totals of all the batches
+    """
+    keys = ["nb_games", "player_wins", "bot_player_wins", "draws", "player_points", "bot_player_points"]
+    metadata = {}
+    totals = dict.fromkeys(keys, 0)
+    fight_rewards = None
+    curves = {key: [] for key in keys}
+    stride, nb_batches = 1, 0
+    with open(path) as file:
+        for line in file:
+            record = json.loads(line)
+            if "metadata" in record:
+                metadata = record["metadata"]
+                continue
+            for key in keys:
+                totals[key] += record[key]
+            if "fight_rewards" in record:
+                fight_rewards = np.add(fight_rewards if fight_rewards is not None else 0, record["fight_rewards"])
+            nb_batches += 1
+            if nb_batches % stride == 0:
+                for key in keys:
+                    curves[key].append(totals[key])
+                if len(curves["nb_games"]) >= 2 * max_points:
+                    curves = {key: values[1::2] for key, values in curves.items()}
+                    stride *= 2
+    # The last batch is always part of the curves
+    if nb_batches % stride != 0:
+        for key in keys:
+            curves[key].append(totals[key])
+    if fight_rewards is not None:
+        totals["mean_fight_rewards"] = (fight_rewards / max(totals["nb_games"], 1)).tolist()
+    return metadata, {key: np.array(values) for key, values in curves.items()}, totals
+
+
+def plot_report(path, output, max_points=1000):
+    """
+    Plot an evaluation report, without GUI, in a PNG file or a HTML page : the cumulative wins of the players,
+    the win rate of the player as the games are played and its mean reward at each fight
+    :param path: (str) path of the report
+    :param output: (str) path of the plot, a HTML page if it ends with .html
+    :param max_points: (int) maximum number of points of the curves
+    """
+    metadata, curves, totals = read_report(path, max_points)
+    if not totals["nb_games"]:
+        print(f"No game in the report {path}")
+        return
+
+    nb_plots = 3 if "mean_fight_rewards" in totals else 2
+    figure, axes = new_figure(1, nb_plots, figsize=(6 * nb_plots, 5))
+    nb_games = curves["nb_games"]
+    axes[0].set_title("Number of wins")
+    axes[0].set_xlabel("Game number")
+    axes[0].plot(nb_games, curves["player_wins"], label="rl_player")
+    axes[0].plot(nb_games, curves["bot_player_wins"], label="bot_player")
+    axes[0].plot(nb_games, curves["draws"], label="draws")
+    axes[0].legend()
+
+    axes[1].set_title("Win rate of the rl player")
+    axes[1].set_xlabel("Game number")
+    axes[1].plot(nb_games, curves["player_wins"] / nb_games)
+    axes[1].set_ylim(0, 1)
+
+    if nb_plots == 3:
+        axes[2].set_title("Mean reward of the rl player per fight")
+        axes[2].set_xlabel("Fight")
+        fights = np.arange(1, len(totals["mean_fight_rewards"]) + 1)
+        axes[2].bar(fights, totals["mean_fight_rewards"])
+        axes[2].set_xticks(fights)
+
+    summary = dict(metadata)
+    summary.update({"games": totals["nb_games"],
+                    "player win rate": f"{totals['player_wins'] / totals['nb_games']:.4f}",
+                    "bot_player win rate": f"{totals['bot_player_wins'] / totals['nb_games']:.4f}",
+                    "draws": totals["draws"],
+                    "mean player points": f"{totals['player_points'] / totals['nb_games']:.3f}",
+                    "mean bot_player points": f"{totals['bot_player_points'] / totals['nb_games']:.3f}"})
+    save_figure(figure, output, title="Evaluation report", summary=summary)
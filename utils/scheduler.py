@@ -0,0 +1,79 @@
+import os
+import itertools
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from game.players import load_agent_name
+from utils.utils import create_saving_directories
+
+
+def create_jobs(exp_name, algos, bot_behaviors, fights_per_game, total_timesteps, nb_seeds, resume=True):
+    """
+    Create the grid of training jobs, one per (algo, bot behavior, seed)
+    :param exp_name: (str) Name of the experiment
+    :param algos: ([str]) RL algorithms to train
+    :param bot_behaviors: ([str]) Behaviors of the opponent bots
+    :param fights_per_game: (int) Number of fights per game
+    :param total_timesteps: (int) Number of training timesteps of each job
+    :param nb_seeds: (int) Number of random seeds per (algo, bot behavior)
+    :param resume: (bool) Skip the jobs whose model has already been saved
+    :return jobs: ([dict]) Keyword arguments of each job
+    """
+    jobs = []
+    for algo, bot_behavior, seed in itertools.product(algos, bot_behaviors, range(nb_seeds)):
+        logs_dir, models_dir = create_saving_directories(exp_name, fights_per_game, bot_behavior)
+        model_path = os.path.join(models_dir, load_agent_name(algo, total_timesteps, seed))
+        if resume and os.path.exists(f"{model_path}.zip"):
+            print(f"Skipping {model_path}, already trained")
+            continue
+        jobs.append(dict(exp_name=exp_name, algo=algo, bot_behavior=bot_behavior, fights_per_game=fights_per_game,
+                         total_timesteps=total_timesteps, seed=seed))
+    return jobs
+
+
+def _pin_worker(worker_counter, cpus_per_worker):
+    """
+    Initializer of the pool processes : pin each worker on its own block of cpus, and limit the
+    number of torch threads accordingly so that concurrent jobs do not oversubscribe the cores
+    """
+    with worker_counter.get_lock():
+        worker_idx = worker_counter.value
+        worker_counter.value += 1
+    cpus = sorted(os.sched_getaffinity(0))
+    first_cpu = (worker_idx * cpus_per_worker) % len(cpus)
+    worker_cpus = cpus[first_cpu:first_cpu + cpus_per_worker]
+    os.sched_setaffinity(0, worker_cpus)
+
+    import torch
+    torch.set_num_threads(len(worker_cpus))
+
+
+def run_jobs(job_fn, jobs, max_workers=None, pin_cpus=False):
+    """
+    Run independent jobs on a pool of processes
+    :param job_fn: (Callable) function called with the keyword arguments of each job
+    :param jobs: ([dict]) Keyword arguments of each job
+    :param max_workers: (int) Maximum number of concurrent jobs, defaults to the number of cpus
+    :param pin_cpus: (bool) Pin each worker process on its own block of cpus
+    :return results: ([Any]) Results of the jobs, in the same order
+    """
+    if not jobs:
+        return []
+    max_workers = min(max_workers or os.cpu_count(), len(jobs))
+
+    start_method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+    ctx = mp.get_context(start_method)
+    initializer, initargs = None, ()
+    if pin_cpus and hasattr(os, "sched_setaffinity"):
+        cpus_per_worker = max(len(os.sched_getaffinity(0)) // max_workers, 1)
+        initializer, initargs = _pin_worker, (ctx.Value('i', 0), cpus_per_worker)
+
+    results = [None] * len(jobs)
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=ctx, initializer=initializer,
+                             initargs=initargs) as executor:
+        futures = {executor.submit(job_fn, **job): job_idx for job_idx, job in enumerate(jobs)}
+        for nb_done, future in enumerate(as_completed(futures), start=1):
+            job = jobs[futures[future]]
+            results[futures[future]] = future.result()
+            print(f"[{nb_done}/{len(jobs)}] done : {job['algo']} vs {job['bot_behavior']} seed {job['seed']}")
+    return results
@@ -0,0 +1,143 @@
+import os
+import re
+import json
+import hashlib
+
+import numpy as np
+
+from utils.event_reader import read_runs
+from utils.atomic_write import atomic_savez
+
+curve_stats = ["mean", "std", "low", "high", "count"]
+
+
+def find_runs(logdir, models, nb_seeds=None):
+    """
+    Find the run directories of each model and seed, named by train.py {agent_name}_seed_{seed} and suffixed by
+    the run number of stable-baselines3 (the last run is kept when a model has been trained several times)
+    :param logdir: (str) log directory
+    :param models: ([str]) models names list, each matching the run directories starting with it
+    :param nb_seeds: (int) only keep the seeds below nb_seeds, all the seeds found if None
+    :return run_dirs: (dict) (model, seed) -> run directory
+    """
+    run_pattern = re.compile(r"_seed_(\d+)_(\d+)$")
+    runs = {}
+    for dir in sorted(os.listdir(logdir)):
+        match = run_pattern.search(dir)
+        if match is None or not os.path.isdir(os.path.join(logdir, dir)):
+            continue
+        seed, run_nb = int(match.group(1)), int(match.group(2))
+        if nb_seeds is not None and seed >= nb_seeds:
+            continue
+        for model in models:
+            if dir.startswith(model) and run_nb >= runs.get((model, seed), (-1, None))[0]:
+                runs[(model, seed)] = (run_nb, os.path.join(logdir, dir))
+    return {key: run_dir for key, (run_nb, run_dir) in sorted(runs.items())}
+
+
+def aggregate_series(series, grid, confidence=0.95):
+    """
+    Align the series of several runs on a step grid by linear interpolation, and compute their statistics
+    at each step of the grid. A run only counts on the steps between its first and last logged ones.
+    :param series: ([(np.ndarray, np.ndarray)]) steps and values of each run, sorted by step
+    :param grid: (np.ndarray) the steps of the grid
+    :param confidence: (float) confidence level of the band of the mean (Student's t interval)
+    :return stats: (dict) stat name (see curve_stats) -> (np.ndarray) its value at each step of the grid,
+        NaN where no run covers the step (std and bounds of the band need 1 and 2 runs)
+    """
+    from scipy.stats import t
+
+    values = np.full((len(series), len(grid)), np.nan)
+    for run_values, (steps, run_series) in zip(values, series):
+        if len(steps):
+            covered = (grid >= steps[0]) & (grid <= steps[-1])
+            run_values[covered] = np.interp(grid[covered], steps, run_series)
+
+    observed = ~np.isnan(values)
+    count = observed.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(observed, values, 0.).sum(axis=0) / count
+        squares = np.where(observed, (values - mean) ** 2, 0.).sum(axis=0)
+        std = np.sqrt(squares / count)
+        half_width = t.ppf(0.5 + confidence / 2, count - 1) * np.sqrt(squares / (count - 1) / count)
+    half_width[count < 2] = np.nan
+    return {"mean": mean, "std": std, "low": mean - half_width, "high": mean + half_width,
+            "count": count.astype(np.float64)}
+
+
+def _logs_signature(run_dirs):
+    """
+    Hash of the names, sizes and modification times of the event files of the runs
+    """
+    files = []
+    for key, run_dir in sorted(run_dirs.items()):
+        for file in sorted(os.listdir(run_dir)):
+            if ".tfevents." in file:
+                stat = os.stat(os.path.join(run_dir, file))
+                files.append([*key, file, stat.st_mtime_ns, stat.st_size])
+    return hashlib.sha1(json.dumps(files).encode()).hexdigest()
+
+
+def load_training_curves(logdir, models, nb_seeds=None, tag='rollout/ep_rew_mean', grid_size=500, confidence=0.95,
+                         cache_dir=None, n_workers=None):
+    """
+    Training curves of several models, aggregated over their seeds on a step grid shared by all the models.
+
+    The aggregates are saved in cache_dir (logdir/.event_cache by default) with a hash of the event files they
+    come from, and are loaded back as long as no event file changed. Otherwise only the events logged since
+    the last call are parsed (see read_event_file_cached) before aggregating the series again.
+
+    :param logdir: (str) log directory
+    :param models: ([str]) models names list
+    :param nb_seeds: (int) number of seeds of each model, all the seeds found if None
+    :param tag: (str) tag of the scalar to aggregate
+    :param grid_size: (int) maximum number of steps of the grid
+    :param confidence: (float) confidence level of the band of the mean
+    :param cache_dir: (str) directory of the cache
+    :param n_workers: (int) number of processes reading the run directories, defaults to the number of cpus
+    :return grid, curves: (np.ndarray, dict) the steps of the grid, and model -> stats of aggregate_series for
+        the models having logs
+    """
+    cache_dir = cache_dir or os.path.join(logdir, ".event_cache")
+    run_dirs = find_runs(logdir, models, nb_seeds)
+    for model in models:
+        for seed in range(nb_seeds or 0):
+            if (model, seed) not in run_dirs:
+                print(f"data missing for {model} seed {seed}")
+
+    query = json.dumps([os.path.abspath(logdir), models, nb_seeds, tag, grid_size, confidence])
+    curves_path = os.path.join(cache_dir, f"curves_{hashlib.sha1(query.encode()).hexdigest()}.npz")
+    signature = _logs_signature(run_dirs)
+    try:
+        with np.load(curves_path) as cached:
+            if str(cached["signature"]) == signature:
+                curves = {model: {stat: cached[stat][model_idx] for stat in curve_stats}
+                          for model_idx, model in enumerate(models) if cached["count"][model_idx].any()}
+                return cached["grid"], curves
+    except (OSError, KeyError, ValueError):
+        pass
+
+    scalars = read_runs(list(run_dirs.values()), [tag], cache_dir, n_workers)
+    series = {key: scalars[run_dir][tag] for key, run_dir in run_dirs.items() if len(scalars[run_dir][tag][0])}
+
+    if series:
+        first_step = min(steps[0] for steps, values in series.values())
+        last_step = max(steps[-1] for steps, values in series.values())
+        nb_steps = min(grid_size, max(len(steps) for steps, values in series.values()))
+        grid = np.linspace(first_step, last_step, nb_steps)
+    else:
+        grid = np.zeros(0)
+
+    stats = {stat: np.full((len(models), len(grid)), np.nan) for stat in curve_stats}
+    curves = {}
+    for model_idx, model in enumerate(models):
+        model_series = [run_series for (run_model, seed), run_series in series.items() if run_model == model]
+        if model_series:
+            curves[model] = aggregate_series(model_series, grid, confidence)
+            for stat in curve_stats:
+                stats[stat][model_idx] = curves[model][stat]
+    stats["count"] = np.nan_to_num(stats["count"])
+
+    os.makedirs(cache_dir, exist_ok=True)
+    atomic_savez(curves_path, signature=signature, grid=grid, **stats)
+    return grid, curves
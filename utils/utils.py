@@ -1,123 +1,92 @@
 import os
 
-import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
+from utils.training_curves import load_training_curves
+from utils.reports import new_figure, save_figure, downsample
 
-from tensorflow.python.summary.summary_iterator import summary_iterator
-
-def get_logs_values(logdir, models, nb_seeds):
+def get_logs_values(logdir, models, nb_seeds=None, tag='rollout/ep_rew_mean', cache_dir=None, n_workers=None):
     """
-    Download data from Tensorboard log files and returns the mean episodic reward array, the std episodic reward array
+    Read data from Tensorboard log files and returns the mean episodic reward array, the std episodic reward array
     and the timesteps array associated in order to plot and observe these results for the desired models.
 
+    The runs of all the seeds and models are aligned on the same timesteps, see load_training_curves.
+
     :param logdir: (str) log directory
     :param models: ([str]) models names list
-    :param nb_seeds: (int) nb of random seeds experiments
-    :return: (np.ndarray, np.ndarray, np.ndarray) models_mean_arrays, models_std_arrays, timesteps
+    :param nb_seeds: (int) nb of random seeds experiments, all the seeds found if None
+    :param tag: (str) tag of the scalar to read
+    :param cache_dir: (str) directory of the cache of the parsed logs
+    :param n_workers: (int) number of processes reading the run directories, defaults to the number of cpus
+    :return: (dict, dict, np.ndarray) models_mean_arrays, models_std_arrays, timesteps
     """
-
-    # Downloading the data from the logs directory in a pandas DataFrame
-    dfs = []
-
-    for dir in os.listdir(logdir):
-        if os.path.isdir(os.path.join(logdir, dir)):
-            for model_name in models :
-                if dir.startswith(model_name):
-                    model = model_name
-                    for i in range(5):
-                        if dir.endswith(f"{i}_1"):
-                            seed = i
-
-                            subdir = os.path.join(logdir, dir)
-                            files = [os.path.join(subdir, file) for file in os.listdir(subdir)]
-                            data = []
-
-                            for filepath in files:
-                                for event in summary_iterator(filepath):
-                                    for value in event.summary.value:
-                                        if value.tag =='rollout/ep_rew_mean':
-                                            data.append([event.step, value.simple_value, model, seed])
-
-                            df = pd.DataFrame(data, columns=['step', 'ep_rew_mean', 'model', 'seed'])
-                            dfs.append(df)
-
-    df_all = pd.concat(dfs, ignore_index=True)
-
-    # Transforming the pandas data into numpy arrays of mean and std reward for each model
-
-    models_tot_arrays = {}
-    models_mean_arrays = {}
-    models_std_arrays = {}
-
-    for model in models:
-        arr = []
-        for seed in range(nb_seeds):
-            serie = df_all.loc[(df_all['model'] == model) & (df_all['seed'] == seed), 'ep_rew_mean']
-            serie = serie.reset_index(drop=True)  # reset index
-            if len(serie) == 0 :
-                print(f"data missing for {model} seed {seed}")
-            else:
-                arr.append(serie)
-
-
-        df = pd.concat(arr, axis=1)
-        nparr = df.to_numpy()
-
-        models_tot_arrays[model] = nparr
-
-        # calculate the mean and the std of this model rewards:
-        models_mean_arrays[model] = np.mean(nparr, axis=1)
-
-        models_std_arrays[model] = np.std(nparr, axis=1)
-
-
-    timesteps = df_all.loc[(df_all['model' ]==model) & (df_all['seed' ]==seed), 'step']
-    timesteps = np.array(timesteps, dtype=np.float64)
-
+    timesteps, curves = load_training_curves(logdir, models, nb_seeds, tag, cache_dir=cache_dir, n_workers=n_workers)
+    models_mean_arrays = {model: curve["mean"] for model, curve in curves.items()}
+    models_std_arrays = {model: curve["std"] for model, curve in curves.items()}
     return models_mean_arrays, models_std_arrays, timesteps
 
 
-def plot_training_results(logdir, models):
+def _figure(output, figsize):
+    """
+    Figure and axes of a plot, rendered without GUI when it is saved in output, else displayed by pyplot
+    """
+    if output is not None:
+        return new_figure(figsize=figsize)
+    import matplotlib.pyplot as plt
+    return plt.subplots(figsize=figsize)
+
+def _show(figure, output, title):
+    if output is not None:
+        save_figure(figure, output, title=title)
+    else:
+        import matplotlib.pyplot as plt
+        plt.show()
+
+def plot_training_results(logdir, models, nb_seeds=None, tag='rollout/ep_rew_mean', confidence=0.95, output=None):
     """
-    Matplotlib plot of the models performance during training
+    Matplotlib plot of the models performance during training, with the confidence band of the mean over the seeds
     :param logdir : (str) log directory
     :param models : [(str)] models tested
+    :param nb_seeds : (int) nb of random seeds experiments, all the seeds found if None
+    :param tag : (str) tag of the scalar plotted
+    :param confidence : (float) confidence level of the bands
+    :param output : (str) PNG or HTML file where the plot is saved without GUI, displayed if None
     """
-    models_mean_arrays, models_std_arrays, timesteps = get_logs_values(logdir, models)
+    timesteps, curves = load_training_curves(logdir, models, nb_seeds, tag, confidence=confidence)
 
-    plt.figure(figsize=(15, 6))
-    plt.title(f"Evolution of mean episode reward on {logdir}_{models}")
-    plt.xlabel('Steps')
-    plt.ylabel('Mean episode reward')
+    title = f"Evolution of mean episode reward on {logdir}_{models}"
+    figure, ax = _figure(output, figsize=(15, 6))
+    ax.set_title(title)
+    ax.set_xlabel('Steps')
+    ax.set_ylabel('Mean episode reward')
 
-    for model in models:
-        std = models_std_arrays[model]
-        plt.plot(timesteps, models_mean_arrays[model], label=model)
-        plt.fill_between(timesteps, models_mean_arrays[model] - models_std_arrays[model],
-                         models_mean_arrays[model] + models_std_arrays[model], alpha=0.2)
+    for model, curve in curves.items():
+        ax.plot(timesteps, curve["mean"], label=model)
+        ax.fill_between(timesteps, curve["low"], curve["high"], alpha=0.2)
 
-    plt.legend()
-    plt.show()
+    ax.legend()
+    _show(figure, output, title)
 
-def plot_evaluation_results(rl_player_wins_list, bot_player_wins_list):
+def plot_evaluation_results(rl_player_wins_list, bot_player_wins_list, output=None, max_points=1000):
     """
     Matplotlib plot of the model performance against a bot
     :param rl_player_wins_list : [(int)] Evolution of the rl player wins
     :param bot_player_wins_list : [(int)] Evolution of the rl player wins
+    :param output : (str) PNG or HTML file where the plot is saved without GUI, displayed if None
+    :param max_points : (int) Maximum number of points of the curves, evenly spaced over the games
     """
-    x = np.linspace(0, len(rl_player_wins_list), len(rl_player_wins_list))
+    x, rl_player_wins_list = downsample(rl_player_wins_list, max_points)
+    x, bot_player_wins_list = downsample(bot_player_wins_list, max_points)
 
-    plt.figure(figsize=(15, 5))
-    plt.title("Number of wins between trained RL and Heuristic Player")
-    plt.xlabel("Game number")
-    plt.ylabel("nb wins")
+    title = "Number of wins between trained RL and Heuristic Player"
+    figure, ax = _figure(output, figsize=(15, 5))
+    ax.set_title(title)
+    ax.set_xlabel("Game number")
+    ax.set_ylabel("nb wins")
 
-    plt.plot(x, rl_player_wins_list, label='rl_player')
-    plt.plot(x, bot_player_wins_list, label='bot_player')
+    ax.plot(x, rl_player_wins_list, label='rl_player')
+    ax.plot(x, bot_player_wins_list, label='bot_player')
 
-    plt.legend()
-    plt.show()
+    ax.legend()
+    _show(figure, output, title)
 
 def create_saving_directories(exp_name, fights_per_game, bot_behavior, verbose=False):
     """
@@ -139,4 +108,4 @@ def create_saving_directories(exp_name, fights_per_game, bot_behavior, verbose=F
     if verbose :
         print(f"Saving directories created for {experiment_name} experiment")
 
-    return logs_dir, models_dir
\ No newline at end of file
+    return logs_dir, models_dir
\ No newline at end of file
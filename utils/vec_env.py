@@ -0,0 +1,318 @@
+import time
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from typing import Optional, List, Any, Callable, Type
+
+import numpy as np
+import gymnasium as gym
+from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv, VecEnv
+from stable_baselines3.common.vec_env.base_vec_env import CloudpickleWrapper, VecEnvIndices, VecEnvStepReturn, VecEnvObs
+
+from game.game_env import GameEnv, initialize_players_eval, spawn_seed_sequences
+
+
+vec_backends = ["dummy", "subproc", "shm"]
+
+
+def make_env_fn(bot_behavior, fights_per_game, projection="random"):
+    """
+    Create a function building an independent game, with its own Player / bot player pair
+    :param bot_behavior: (str) the bot_behavior (i.e. its action policy)
+    :param fights_per_game: (int) the number of fights per game
+    :param projection: (str) reduction of the actions exceeding the golds of the player, see project_actions
+    :return env_fn: (Callable) function returning a new GameEnv
+    """
+    def env_fn():
+        player, bot_player = initialize_players_eval(bot_behavior, fights_per_game=fights_per_game)
+        return GameEnv(player=player, bot_player=bot_player, fights_per_game=fights_per_game, verbose=False,
+                       projection=projection)
+    return env_fn
+
+
+def make_vec_env(bot_behavior, fights_per_game, n_envs, vec_backend="dummy", n_workers=None, seed=None,
+                 projection="random"):
+    """
+    Create a vectorized environment of n_envs independent games
+    :param bot_behavior: (str) the bot_behavior (i.e. its action policy)
+    :param fights_per_game: (int) the number of fights per game
+    :param n_envs: (int) the number of games played in parallel
+    :param vec_backend: (str) 'dummy' (sequential), 'subproc' (one process per game) or 'shm' (shared memory workers)
+    :param n_workers: (int) number of worker processes of the 'shm' backend, defaults to the number of cpus
+    :param seed: (int or np.random.SeedSequence) seed of the games, see seed_vec_env
+    :param projection: (str) reduction of the actions exceeding the golds of the player, see project_actions
+    :return vec_env: (VecEnv) the vectorized environment
+    """
+    env_fns = [make_env_fn(bot_behavior, fights_per_game, projection) for _ in range(n_envs)]
+    if vec_backend == "dummy":
+        vec_env = DummyVecEnv(env_fns)
+    elif vec_backend == "subproc":
+        vec_env = SubprocVecEnv(env_fns)
+    elif vec_backend == "shm":
+        vec_env = ShmVecEnv(env_fns, n_workers=n_workers)
+    else:
+        raise(ValueError(f"Unknown vec backend {vec_backend}, choose among {vec_backends}"))
+    if seed is not None:
+        seed_vec_env(vec_env, seed)
+    return vec_env
+
+
+def seed_vec_env(vec_env, seed):
+    """
+    Seed game i of a vectorized environment with the i-th child of np.random.SeedSequence(seed) at its next reset,
+    instead of the seed + i of stable-baselines3. The games are then independent of the backend and of the number
+    of workers, and game i plays as GameEnv.reset(seed=child_i) does.
+    :param vec_env: (VecEnv) a vectorized environment of GameEnv
+    :param seed: (int or np.random.SeedSequence) the seed of the games
+    :return seeds: ([np.random.SeedSequence]) the seeds of the games
+    """
+    vec_env._seeds = spawn_seed_sequences(seed, vec_env.num_envs)
+    return vec_env._seeds
+
+
+def report_throughput(vec_env, total_steps, elapsed_time):
+    """
+    Print the number of env-steps per second of a vectorized environment, per worker process when
+    the workers measure it themselves (shm backend)
+    :param vec_env: (VecEnv) the vectorized environment
+    :param total_steps: (int) total number of env-steps collected
+    :param elapsed_time: (float) wall-clock time in seconds
+    """
+    print(f"\n{total_steps} env-steps in {elapsed_time:.1f}s : {total_steps / elapsed_time:.0f} env-steps/sec")
+    if isinstance(vec_env, ShmVecEnv):
+        for worker_idx, (steps, busy_time) in enumerate(vec_env.get_worker_stats()):
+            steps_per_sec = steps / busy_time if busy_time > 0 else 0.
+            print(f"worker {worker_idx} : {int(steps)} env-steps, {steps_per_sec:.0f} env-steps/sec while busy, "
+                  f"{busy_time / elapsed_time:.0%} busy")
+    else:
+        print(f"{total_steps / elapsed_time / vec_env.num_envs:.0f} env-steps/sec per env")
+
+
+class _ShmLayout:
+    """
+    Layout of the arrays exchanged through the shared memory block. Observations, rewards and dones
+    are written by the workers in a ring of 'ring_size' slots, so the arrays returned by a step stay
+    valid during the ring_size - 1 following steps.
+    """
+
+    def __init__(self, n_envs, n_workers, ring_size, obs_shape, obs_dtype, action_shape):
+        self.shapes = {"actions": ((n_envs,) + action_shape, np.float64),
+                       "observations": ((ring_size, n_envs) + obs_shape, obs_dtype),
+                       "terminal_observations": ((ring_size, n_envs) + obs_shape, obs_dtype),
+                       "rewards": ((ring_size, n_envs), np.float64),
+                       "dones": ((ring_size, n_envs), np.bool_),
+                       "worker_stats": ((n_workers, 2), np.float64)}
+        self.offsets = {}
+        self.size = 0
+        for name, (shape, dtype) in self.shapes.items():
+            # Keep every array aligned on 8 bytes
+            self.size = -(-self.size // 8) * 8
+            self.offsets[name] = self.size
+            self.size += int(np.prod(shape)) * np.dtype(dtype).itemsize
+
+    def arrays(self, buffer):
+        return {name: np.ndarray(shape, dtype=dtype, buffer=buffer, offset=self.offsets[name])
+                for name, (shape, dtype) in self.shapes.items()}
+
+
+def _shm_worker(remote, parent_remote, env_fns_wrapper, shm_name, layout, env_indices, worker_idx):
+    """
+    Worker process stepping a contiguous block of games. Only small commands go through the pipe,
+    the actions are read from and the results written to the shared memory block.
+    """
+    parent_remote.close()
+    shm = shared_memory.SharedMemory(name=shm_name)
+    arrays = layout.arrays(shm.buf)
+    envs = [env_fn() for env_fn in env_fns_wrapper.var]
+    # Games of the worker by index in the VecEnv, for the commands targeting some of them
+    envs_by_index = dict(zip(env_indices, envs))
+    stats = arrays["worker_stats"][worker_idx]
+
+    while True:
+        try:
+            cmd, data = remote.recv()
+            if cmd == "step":
+                start = time.perf_counter()
+                slot = data
+                for i, env in zip(env_indices, envs):
+                    observation, reward, terminated, truncated, info = env.step(arrays["actions"][i])
+                    done = terminated or truncated
+                    if done:
+                        arrays["terminal_observations"][slot, i] = observation
+                        observation, reset_info = env.reset()
+                    arrays["observations"][slot, i] = observation
+                    arrays["rewards"][slot, i] = reward
+                    arrays["dones"][slot, i] = done
+                stats[0] += len(envs)
+                stats[1] += time.perf_counter() - start
+                remote.send(None)
+            elif cmd == "reset":
+                slot, seeds = data
+                for i, env in zip(env_indices, envs):
+                    observation, reset_info = env.reset(seed=seeds[i])
+                    arrays["observations"][slot, i] = observation
+                remote.send(None)
+            elif cmd == "get_attr":
+                attr_name, indices = data
+                remote.send([getattr(envs_by_index[i], attr_name) for i in indices])
+            elif cmd == "set_attr":
+                attr_name, value, indices = data
+                for i in indices:
+                    setattr(envs_by_index[i], attr_name, value)
+                remote.send(None)
+            elif cmd == "env_method":
+                method_name, method_args, method_kwargs, indices = data
+                remote.send([getattr(envs_by_index[i], method_name)(*method_args, **method_kwargs) for i in indices])
+            elif cmd == "close":
+                for env in envs:
+                    env.close()
+                del arrays, stats
+                shm.close()
+                remote.close()
+                break
+            else:
+                raise NotImplementedError(f"`{cmd}` is not implemented in the worker")
+        except EOFError:
+            break
+
+
+class ShmVecEnv(VecEnv):
+    """
+    VecEnv stepping its games in worker processes, each one owning a contiguous block of games.
+
+    Contrary to SubprocVecEnv, observations, rewards and dones are not pickled through pipes : the
+    workers write them in a ring buffer in shared memory, and only small commands go through the
+    pipes. The workers also measure the number of env-steps they make and the time spent doing it,
+    see get_worker_stats.
+    """
+
+    def __init__(self,
+                 env_fns: List[Callable[[], gym.Env]],
+                 n_workers: Optional[int] = None,
+                 ring_size: Optional[int] = 4,
+                 start_method: Optional[str] = None):
+        self.closed = False
+        self.waiting = False
+        n_envs = len(env_fns)
+        n_workers = min(n_workers or mp.cpu_count(), n_envs)
+
+        # Spaces are read on a local instance instead of asking a worker
+        env = env_fns[0]()
+        observation_space, action_space = env.observation_space, env.action_space
+        env.close()
+
+        self.ring_size = ring_size
+        self.slot = 0
+        self.layout = _ShmLayout(n_envs, n_workers, ring_size, observation_space.shape, observation_space.dtype,
+                                 action_space.shape)
+        self.shm = shared_memory.SharedMemory(create=True, size=self.layout.size)
+        self.arrays = self.layout.arrays(self.shm.buf)
+        self.arrays["worker_stats"][:] = 0
+
+        if start_method is None:
+            start_method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+        ctx = mp.get_context(start_method)
+
+        self.env_indices = np.array_split(np.arange(n_envs), n_workers)
+        self.remotes, self.work_remotes = zip(*[ctx.Pipe() for _ in range(n_workers)])
+        self.processes = []
+        for worker_idx, (work_remote, remote, env_indices) in enumerate(zip(self.work_remotes, self.remotes,
+                                                                             self.env_indices)):
+            worker_env_fns = CloudpickleWrapper([env_fns[i] for i in env_indices])
+            args = (work_remote, remote, worker_env_fns, self.shm.name, self.layout, env_indices, worker_idx)
+            process = ctx.Process(target=_shm_worker, args=args, daemon=True)
+            process.start()
+            self.processes.append(process)
+            work_remote.close()
+
+        super().__init__(n_envs, observation_space, action_space)
+
+    def reset(self) -> VecEnvObs:
+        self.slot = (self.slot + 1) % self.ring_size
+        for remote in self.remotes:
+            remote.send(("reset", (self.slot, self._seeds)))
+        for remote in self.remotes:
+            remote.recv()
+        self._reset_seeds()
+        self.reset_infos = [{} for _ in range(self.num_envs)]
+        return self.arrays["observations"][self.slot]
+
+    def step_async(self, actions: np.ndarray) -> None:
+        self.arrays["actions"][:] = np.asarray(actions).reshape(self.arrays["actions"].shape)
+        self.slot = (self.slot + 1) % self.ring_size
+        for remote in self.remotes:
+            remote.send(("step", self.slot))
+        self.waiting = True
+
+    def step_wait(self) -> VecEnvStepReturn:
+        for remote in self.remotes:
+            remote.recv()
+        self.waiting = False
+
+        observations = self.arrays["observations"][self.slot]
+        dones = self.arrays["dones"][self.slot]
+        infos = [{} for _ in range(self.num_envs)]
+        for i in np.flatnonzero(dones):
+            infos[i]["terminal_observation"] = self.arrays["terminal_observations"][self.slot, i].copy()
+            infos[i]["TimeLimit.truncated"] = False
+        return observations, self.arrays["rewards"][self.slot], dones, infos
+
+    def get_worker_stats(self) -> np.ndarray:
+        """
+        Returns a (n_workers, 2) array with the number of env-steps made by each worker and the
+        time in seconds it spent making them
+        """
+        return self.arrays["worker_stats"].copy()
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        if self.waiting:
+            for remote in self.remotes:
+                remote.recv()
+        for remote in self.remotes:
+            remote.send(("close", None))
+        for process in self.processes:
+            process.join()
+        self.arrays = None
+        self.shm.close()
+        self.shm.unlink()
+        self.closed = True
+
+    def _get_target_remotes(self, indices: List[int]) -> List[Any]:
+        """
+        Workers owning the games of the indices, with the indices of their games among them
+        """
+        targets = []
+        for remote, env_indices in zip(self.remotes, self.env_indices):
+            worker_indices = [i for i in indices if env_indices[0] <= i <= env_indices[-1]]
+            if worker_indices:
+                targets.append((remote, worker_indices))
+        return targets
+
+    def _send_to_targets(self, cmd: str, data: tuple, indices: VecEnvIndices) -> List[Any]:
+        """
+        Send a command to the workers owning the games of the indices, each getting the indices of its games
+        :return values: ([Any]) the values returned for each game, in the order of the indices
+        """
+        indices = list(self._get_indices(indices))
+        targets = self._get_target_remotes(indices)
+        for remote, worker_indices in targets:
+            remote.send((cmd, (*data, worker_indices)))
+        values = {}
+        for remote, worker_indices in targets:
+            worker_values = remote.recv()
+            if worker_values is not None:
+                values.update(zip(worker_indices, worker_values))
+        return [values[i] for i in indices] if values else []
+
+    def get_attr(self, attr_name: str, indices: VecEnvIndices = None) -> List[Any]:
+        return self._send_to_targets("get_attr", (attr_name,), indices)
+
+    def set_attr(self, attr_name: str, value: Any, indices: VecEnvIndices = None) -> None:
+        self._send_to_targets("set_attr", (attr_name, value), indices)
+
+    def env_method(self, method_name: str, *method_args, indices: VecEnvIndices = None, **method_kwargs) -> List[Any]:
+        return self._send_to_targets("env_method", (method_name, method_args, method_kwargs), indices)
+
+    def env_is_wrapped(self, wrapper_class: Type[gym.Wrapper], indices: VecEnvIndices = None) -> List[bool]:
+        return [False for _ in self._get_indices(indices)]